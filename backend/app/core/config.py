@@ -1,5 +1,6 @@
 
 import os
+from typing import Optional
 from pydantic_settings import BaseSettings
 
 class Settings(BaseSettings):
@@ -14,7 +15,77 @@ class Settings(BaseSettings):
     # Paths
     BASE_DIR: str = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
     MODEL_PATH: str = os.path.join(BASE_DIR, 'models', 'brain_tumor_vit_model.pth')
+    MODEL_VERSION: str = ""  # Derived from the checkpoint file when empty
+    MODEL_LOAD_MMAP: bool = True  # Memory-map checkpoint weights instead of copying them
+    MODEL_PRELOAD: bool = True  # Load and warm up the model at startup instead of on first request
+    MODEL_DIR: str = os.path.join(BASE_DIR, 'models')  # Checkpoints /api/models/load may read from
+    MODEL_REGISTRY_MAX_VERSIONS: int = 2  # Loaded versions kept side by side, including the active one
+
+    # Inference backend: "eager", "int8", "torchscript" or "onnx"
+    INFERENCE_BACKEND: str = "eager"
+    INFERENCE_BACKEND_PATH: str = ""  # Artifact written by export_model.py; exported at load time when empty
+
+    # Early exit: stop at an intermediate layer for confident images (heads from train_early_exit.py)
+    INFERENCE_EARLY_EXIT: bool = False
+    EARLY_EXIT_THRESHOLD: float = 0.0  # 0 uses the threshold calibrated by train_early_exit.py
+
+    # Preprocessing
+    # Let libjpeg downscale large JPEGs while decoding. Faster, but the model input then differs
+    # from Resize + ToTensor + Normalize by up to ~0.6 normalized units, which can change predictions
+    PREPROCESS_JPEG_DRAFT: bool = False
+
+    # Inference batching
+    INFERENCE_MAX_BATCH_SIZE: int = 8
+    INFERENCE_MAX_WAIT_MS: float = 10.0
+
+    # Inference execution
+    INFERENCE_EXECUTOR_MODE: str = "thread"  # "thread" or "process"
+    INFERENCE_WORKERS: int = 1
+    INFERENCE_MAX_QUEUE: int = 64
+    INFERENCE_TIMEOUT_S: float = 30.0
+    INFERENCE_TORCH_THREADS: int = 0  # 0 keeps torch's default
+    INFERENCE_PREFORKED: bool = False  # Set in serve_prefork.py workers, which refuse model hot swaps
+
+    # Bulk prediction
+    BATCH_MAX_FILES: int = 1000
+    BATCH_MAX_IMAGE_MB: float = 25.0
+
+    # Volume (DICOM/NIfTI/.npy) studies
+    VOLUME_MAX_MB: float = 2048.0
+    VOLUME_MIN_TUMOR_SLICES: int = 3  # Tumor-predicting slices needed to call the study for a tumor
+    VOLUME_SKIP_BLANK_FRACTION: float = 0.01  # Skip slices with less tissue than this; 0 runs every slice
+
+    # Prediction cache
+    PREDICTION_CACHE_ENABLED: bool = True
+    PREDICTION_CACHE_MAX_ENTRIES: int = 4096
+    PREDICTION_CACHE_MAX_MB: float = 64.0
+    PREDICTION_CACHE_TTL_S: float = 3600.0
+    PREDICTION_CACHE_DIR: str = ""  # Empty keeps the cache in memory only
+    PREDICTION_CACHE_DISK_MAX_MB: float = 1024.0  # Size of PREDICTION_CACHE_DIR past which the oldest files are deleted
     
+    # Dispatch
+    DISPATCH_GRID_CELL_KM: float = 1.0  # Cell size of the spatial index behind nearest-ambulance search
+    DISPATCH_TICK_HZ: float = 1.0  # Simulation ticks per second; each advances simulated time by 1 / DISPATCH_TICK_HZ
+    DISPATCH_MAX_CATCH_UP_TICKS: int = 5  # Ticks run back to back after a stall; further behind, they are dropped
+    DISPATCH_SEED: Optional[int] = None  # Seed the simulation for reproducible runs
+    DISPATCH_MODE: str = "greedy"  # "greedy" (nearest unit per request) or "batch" (min total ETA per window)
+    DISPATCH_BATCH_WINDOW_MS: float = 250.0  # How long the first request of a batch waits for others
+    DISPATCH_BATCH_MAX: int = 500  # Requests solved together at most
+    DISPATCH_BATCH_CANDIDATES: int = 8  # Nearest qualifying units each request considers
+    DISPATCH_ROAD_GRAPH: str = ""  # .npz from build_road_graph.py; empty for straight-line ETAs and movement
+    DISPATCH_ROUTE_CACHE_SIZE: int = 10000  # Node-to-node routes kept in the LRU cache
+    DISPATCH_ROAD_CANDIDATES: int = 8  # Straight-line nearest units re-ranked by road ETA
+    DISPATCH_RECORD_PATH: str = ""  # Record live ride requests as a replayable scenario (.ndjson); empty to disable
+    DISPATCH_JOURNAL_DIR: str = ""  # Event log and snapshots of the fleet, for recovery on restart; empty to disable
+    DISPATCH_JOURNAL_FLUSH_MS: float = 200.0  # How often queued events are written out
+    DISPATCH_SNAPSHOT_INTERVAL_S: float = 60.0  # Simulated seconds between fleet snapshots (bounds the log replayed on boot)
+    DISPATCH_COORD_PRECISION: int = 5  # Decimals kept in delta FLEET_UPDATE coordinates (5 is about 1 m)
+    DISPATCH_KEYFRAME_INTERVAL: int = 30  # Delta FLEET_UPDATE frames between full keyframes
+    DISPATCH_WS_QUEUE_SIZE: int = 16  # Messages queued per dispatch websocket client before it counts as slow
+    DISPATCH_WS_SLOW_POLICY: str = "drop"  # Slow clients: "drop" their stale fleet updates, or "disconnect" them
+    DISPATCH_WS_SEND_TIMEOUT_S: float = 10.0  # A send taking longer drops the client as dead
+    DISPATCH_VIEWPORT_CELL_KM: float = 2.0  # Grid cell size for viewport-scoped fleet updates
+
     # Database
     DATABASE_URL: str = f"sqlite:///{os.path.join(BASE_DIR, 'medicine_orders.db')}"
 
@@ -1,13 +1,22 @@
 
-from fastapi import FastAPI, Depends, UploadFile, File, HTTPException
+from fastapi import FastAPI, Depends, UploadFile, File, HTTPException, Request
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy.orm import Session
-from typing import List, Optional
+from typing import Dict, Optional, Tuple, Union
 from pydantic import BaseModel
+import asyncio
+import os
 
 from app.core.config import settings
 from app.db.base import get_db, Order
-from app.services.inference_service import inference_service
+from app.services.inference_service import checkpoint_version, inference_service
+from app.services.model_registry import UnknownModelVersion
+from app.services.batching_service import prediction_batcher
+from app.services.inference_executor import inference_executor, InferenceQueueFull
+from app.services.prediction_cache import prediction_cache
+from app.services.bulk_prediction import stream_batch_predictions
+from app.services.volume_ingest import VolumeFormatError, open_volume, spool_upload, stream_volume_predictions, volume_suffix
 from app.services.arbitrage_service import arbitrage_service
 
 app = FastAPI(title=settings.PROJECT_NAME, version=settings.VERSION)
@@ -28,17 +37,189 @@ def root():
     return {"message": "NeuroVision Enterprise API Running"}
 
 @app.post("/api/predict")
-async def predict_tumor(file: UploadFile = File(...)):
+async def predict_tumor(file: UploadFile = File(...), model_version: Optional[str] = None, explain: bool = False):
     if file.content_type not in ["image/jpeg", "image/png", "image/webp"]:
         raise HTTPException(400, detail="Invalid file type")
+    if explain and not inference_service.supports_explain:
+        raise HTTPException(400, detail=f"Heatmaps are not available with the {inference_service.backend} backend")
     
     contents = await file.read()
     try:
-        result = inference_service.predict(contents)
+        result = await prediction_batcher.submit(contents, version=model_version, explain=explain)
         return result
+    except UnknownModelVersion as e:
+        raise HTTPException(404, detail=str(e))
+    except InferenceQueueFull as e:
+        raise HTTPException(503, detail=str(e))
+    except asyncio.TimeoutError:
+        raise HTTPException(504, detail="Inference timed out")
     except Exception as e:
         raise HTTPException(500, detail=str(e))
 
+@app.post("/api/predict/batch")
+async def predict_tumor_batch(request: Request, model_version: Optional[str] = None, explain: bool = False):
+    """
+    Accepts a multipart list of images under `files` (zip archives are
+    expanded) and streams one NDJSON line per image as each batch finishes.
+    """
+    if not request.headers.get("content-type", "").startswith("multipart/form-data"):
+        raise HTTPException(400, detail="Expected multipart/form-data")
+    if explain and not inference_service.supports_explain:
+        raise HTTPException(400, detail=f"Heatmaps are not available with the {inference_service.backend} backend")
+
+    # Parsed here rather than via File(...) params: FastAPI closes those
+    # before a streamed body is sent, so the stream closes the form itself
+    form = await request.form(max_files=settings.BATCH_MAX_FILES)
+    uploads = [f for f in form.getlist("files") if not isinstance(f, str)]
+    if not uploads:
+        await form.close()
+        raise HTTPException(400, detail="No files uploaded")
+
+    return StreamingResponse(stream_batch_predictions(uploads, form, model_version, explain), media_type="application/x-ndjson")
+
+@app.post("/api/predict/volume")
+async def predict_volume(request: Request, model_version: Optional[str] = None, axis: Optional[int] = None):
+    """
+    Accepts one volume under `file` (.nii/.nii.gz, .npy, a multi-frame .dcm
+    or a zip of DICOM slices) and streams one NDJSON line per slice, then a
+    study-level aggregate. `axis` overrides the slicing axis of array volumes.
+    """
+    if not request.headers.get("content-type", "").startswith("multipart/form-data"):
+        raise HTTPException(400, detail="Expected multipart/form-data")
+
+    form = await request.form(max_files=1)
+    try:
+        upload = form.get("file")
+        if upload is None or isinstance(upload, str):
+            raise HTTPException(400, detail="No file uploaded")
+        suffix = volume_suffix(upload.filename or "")
+        if suffix is None:
+            raise HTTPException(400, detail="Invalid volume type")
+        max_bytes = int(settings.VOLUME_MAX_MB * 1024 * 1024)
+        path = await asyncio.to_thread(spool_upload, upload.file, suffix, max_bytes)
+    except VolumeFormatError as e:
+        raise HTTPException(400, detail=str(e))
+    finally:
+        await form.close()
+
+    try:
+        volume = await asyncio.to_thread(open_volume, path, suffix, axis)
+    except VolumeFormatError as e:
+        os.remove(path)
+        raise HTTPException(400, detail=str(e))
+    except BaseException:
+        os.remove(path)
+        raise
+
+    return StreamingResponse(stream_volume_predictions(volume, path, model_version), media_type="application/x-ndjson")
+
+# --- Model Registry ---
+
+class ModelLoadRequest(BaseModel):
+    filename: str
+    version: Optional[str] = None
+    activate: bool = True
+
+def require_hot_swap():
+    if inference_executor.mode != "thread":
+        # Each worker process has its own registry, which the API can't reach
+        raise HTTPException(409, detail="Hot swapping models requires INFERENCE_EXECUTOR_MODE=thread")
+    if settings.INFERENCE_PREFORKED:
+        # A swap would reach only the worker serving this request, and unshare its copy of the weights
+        raise HTTPException(409, detail="Hot swapping models is not supported under serve_prefork.py; restart it instead")
+
+def resolve_model_file(filename: str) -> str:
+    """Resolves a checkpoint name inside MODEL_DIR, refusing anything outside it."""
+    model_dir = os.path.realpath(settings.MODEL_DIR)
+    path = os.path.realpath(os.path.join(model_dir, filename))
+    if os.path.commonpath([model_dir, path]) != model_dir or path == model_dir:
+        raise HTTPException(400, detail="Checkpoint must be inside the models directory")
+    if not os.path.isfile(path):
+        raise HTTPException(404, detail=f"Checkpoint not found: {filename}")
+    return path
+
+async def load_model_version(path: str, version: str, activate: bool):
+    try:
+        # Off the inference executor, so serving continues on the current version
+        await asyncio.to_thread(
+            inference_service.load_checkpoint, path, version, activate,
+            (1, settings.INFERENCE_MAX_BATCH_SIZE)
+        )
+        print(f"✅ Model version {version} ready")
+    except Exception as e:
+        print(f"❌ Failed to load model version {version}: {e}")
+
+@app.get("/api/models")
+async def list_models():
+    return inference_service.registry.get_stats()
+
+@app.post("/api/models/load", status_code=202)
+async def load_model(body: ModelLoadRequest):
+    """Loads and warms a checkpoint in the background; poll /api/models for its state."""
+    require_hot_swap()
+    path = resolve_model_file(body.filename)
+    version = body.version or checkpoint_version(path, inference_service.backend)
+    if any(m["version"] == version and m["state"] != "failed" for m in inference_service.registry.list()):
+        raise HTTPException(409, detail=f"Model version '{version}' is already loaded")
+
+    asyncio.create_task(load_model_version(path, version, body.activate))
+    return {"status": "loading", "version": version, "activate": body.activate}
+
+@app.post("/api/models/{version}/activate")
+async def activate_model(version: str):
+    require_hot_swap()
+    try:
+        inference_service.registry.activate(version)
+    except UnknownModelVersion as e:
+        raise HTTPException(404, detail=str(e))
+    return {"active": version}
+
+@app.delete("/api/models/{version}")
+async def unload_model(version: str):
+    require_hot_swap()
+    try:
+        inference_service.registry.unload(version)
+    except UnknownModelVersion as e:
+        raise HTTPException(404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(409, detail=str(e))
+    return {"unloaded": version}
+
+@app.get("/api/inference/stats")
+async def get_inference_stats():
+    return {
+        "batching": prediction_batcher.get_stats(),
+        "executor": inference_executor.get_stats(),
+        "preprocessing": inference_service.preprocessor.get_stats(),
+        "cache": prediction_cache.get_stats() if prediction_cache else None,
+        "models": inference_service.registry.get_stats(),
+        "early_exit": inference_service.early_exit_stats()
+    }
+
+@app.on_event("startup")
+async def preload_model():
+    if settings.MODEL_PRELOAD:
+        # In the background, so the process answers liveness checks while loading
+        asyncio.create_task(inference_executor.warm_up(batch_sizes=(1, settings.INFERENCE_MAX_BATCH_SIZE)))
+
+@app.get("/api/health/ready")
+async def readiness():
+    """Readiness probe: 503 until the model is loaded and warmed up."""
+    ready = inference_executor.ready or not settings.MODEL_PRELOAD
+    payload = {
+        "ready": ready,
+        "state": inference_executor.state,
+        "model_version": inference_service.model_version,
+        "warm_up_s": inference_executor.warm_up_s
+    }
+    if not ready:
+        return JSONResponse(status_code=503, content=payload)
+    return payload
+
+@app.on_event("shutdown")
+def stop_inference_executor():
+    inference_executor.shutdown()
+
 @app.get("/api/medicine/search")
 async def search_medicine(query: str):
     return await arbitrage_service.find_cheapest_medicine(query)
@@ -64,59 +245,190 @@ async def place_order(
 from fastapi import WebSocket, WebSocketDisconnect
 from app.services.websocket_manager import manager
 from app.services.dispatch_service import dispatch_service
-import asyncio
+from app.services.dispatch_batcher import dispatch_batcher
+from app.services.dispatch_scenario import ScenarioRecorder
+from app.services.fleet_delta import fleet_encoder
+from app.services.fleet_binary import carries_table, fleet_binary
+from app.services.fleet_viewport import fleet_viewport, parse_subscription
+
+ride_tasks = set() # Batched ride requests still waiting for their assignment
+whole_fleet_messages: Dict[Tuple[str, str], Tuple[int, Union[Dict, bytes]]] = {} # (encoding, message type) -> (tick, the last full-fleet message built)
+WIRE_ENCODINGS = ("full", "delta", "binary")
+
+def whole_fleet(encoding: str, message_type: str) -> Union[Dict, bytes]:
+    """
+    Every unit, for a client joining (or returning to) the whole-fleet
+    stream. Clients asking at the same tick share the message, and so its
+    encoding.
+    """
+    snapshot = dispatch_service.snapshot
+    if encoding == "delta":
+        return fleet_encoder.keyframe(snapshot, message_type)
+    key = (encoding, message_type)
+    cached = whole_fleet_messages.get(key)
+    if cached is not None and cached[0] == snapshot.tick:
+        return cached[1]
+    if encoding == "binary":
+        # With the whole unit table, so the client can resolve every row
+        message = fleet_binary.frame(snapshot, message_type, table_start=0)
+    else:
+        message = {
+            "type": message_type,
+            "data": snapshot.serialize(),
+            "tick": snapshot.tick
+        }
+    whole_fleet_messages[key] = (snapshot.tick, message)
+    return message
+
+def replaceable(message: Union[Dict, bytes]) -> bool:
+    """Fleet frames a newer one may replace in a slow client's queue: all but binary frames carrying unit tables."""
+    return not (isinstance(message, bytes) and carries_table(message))
+
+def scoped_fleet(encoding: str, subscription, table_start: Optional[int] = None) -> Union[Dict, bytes]:
+    """The units a subscribed client sees, as a JSON keyframe or a binary frame."""
+    snapshot = dispatch_service.snapshot
+    if encoding == "binary":
+        rows = fleet_viewport.rows(snapshot, subscription)
+        return fleet_binary.frame(snapshot, rows=rows, table_start=table_start, scoped=True)
+    return fleet_viewport.message(snapshot, subscription)
+scenario_recorder = ScenarioRecorder(settings.DISPATCH_RECORD_PATH) if settings.DISPATCH_RECORD_PATH else None
 
 @app.websocket("/ws/dispatch")
 async def websocket_endpoint(websocket: WebSocket):
-    await manager.connect(websocket)
+    # ?encoding=delta: FLEET_UPDATE frames carry only what changed (see FleetDeltaEncoder)
+    # ?encoding=binary: fleet frames are packed binary records (see FleetBinaryEncoder); other messages stay JSON
+    encoding = websocket.query_params.get("encoding", "full")
+    if encoding not in WIRE_ENCODINGS:
+        encoding = "full"
+    await manager.connect(websocket, encoding)
     try:
-        # Send initial state
-        await websocket.send_json({
-            "type": "INIT_FLEET",
-            "data": dispatch_service.get_all_ambulances()
-        })
+        # Send initial state (queued, so it goes out before any broadcast)
+        message = whole_fleet(encoding, "INIT_FLEET")
+        manager.send(websocket, message, replaceable=replaceable(message))
         
         while True:
             data = await websocket.receive_json()
+            if data['type'] == 'RESYNC':
+                # The client missed a delta frame; send everything as of the last one
+                if encoding == "delta":
+                    manager.send(websocket, fleet_encoder.keyframe(dispatch_service.snapshot), replaceable=True)
+                else:
+                    message = whole_fleet(encoding, "INIT_FLEET")
+                    manager.send(websocket, message, replaceable=replaceable(message))
+            elif data['type'] == 'SUBSCRIBE':
+                # Only units in a bbox and/or of some types or statuses; no filters for the whole fleet again
+                try:
+                    subscription = parse_subscription(data)
+                except (ValueError, TypeError) as e:
+                    manager.send(websocket, {"type": "SUBSCRIPTION_ERROR", "detail": str(e)})
+                    continue
+                manager.subscribe(websocket, subscription)
+                if subscription is None:
+                    message = whole_fleet(encoding, "FLEET_UPDATE")
+                else:
+                    message = scoped_fleet(encoding, subscription)
+                manager.send(websocket, message, replaceable=replaceable(message))
             # Handle incoming requests (e.g. Booking)
-            if data['type'] == 'REQUEST_RIDE':
-               ride_req = data['data']
-               amb_id = dispatch_service.find_nearest_ambulance(
-                   ride_req['pickup']['lat'], 
-                   ride_req['pickup']['lng'],
-                   ride_req.get('requiredType')
-               )
-               
-               if amb_id:
-                   dispatch_service.dispatch_ambulance(
-                       amb_id, 
-                       ride_req['pickup']['lat'], 
-                       ride_req['pickup']['lng']
-                   )
-                   await manager.broadcast({
-                       "type": "RIDE_ASSIGNED",
-                       "bookingId": ride_req.get('id'),
-                       "ambulanceId": amb_id
-                   })
+            elif data['type'] == 'REQUEST_RIDE':
+               if settings.DISPATCH_MODE == "batch":
+                   # Don't block this connection's next request on the batch window
+                   task = asyncio.create_task(assign_ride(websocket, data['data']))
+                   ride_tasks.add(task)
+                   task.add_done_callback(ride_tasks.discard)
                else:
-                   await websocket.send_json({"type": "NO_AMBULANCE_AVAILABLE"})
+                   await assign_ride(websocket, data['data'])
 
     except WebSocketDisconnect:
+        pass
+    finally:
         manager.disconnect(websocket)
 
+async def assign_ride(websocket: WebSocket, ride_req: dict):
+    pickup = ride_req['pickup']
+    if scenario_recorder:
+        scenario_recorder.record(dispatch_service.sim_time, pickup['lat'], pickup['lng'], ride_req.get('requiredType'))
+    if settings.DISPATCH_MODE == "batch":
+        assignment = await dispatch_batcher.submit(pickup['lat'], pickup['lng'], ride_req.get('requiredType'))
+    else:
+        # Off the event loop: with a road graph this runs route searches
+        assignment = await asyncio.to_thread(dispatch_service.dispatch_nearest, pickup['lat'], pickup['lng'], ride_req.get('requiredType'))
+
+    if assignment:
+        message = {
+            "type": "RIDE_ASSIGNED",
+            "bookingId": ride_req.get('id'),
+            "ambulanceId": assignment["id"]
+        }
+        if "eta_s" in assignment:
+            message["etaSeconds"] = round(assignment["eta_s"], 1)
+        await manager.broadcast(message)
+    else:
+        manager.send(websocket, {"type": "NO_AMBULANCE_AVAILABLE"}) # A no-op if it disconnected meanwhile
+
 # Background task to broadcast updates
 @app.on_event("startup")
 async def start_broadcast_loop():
+    if scenario_recorder:
+        scenario_recorder.start(dispatch_service)
     asyncio.create_task(broadcast_state())
 
 async def broadcast_state():
+    # Sleep until absolute deadlines so the 1 Hz cadence doesn't drift with load
+    loop = asyncio.get_running_loop()
+    next_tick = loop.time()
+    last_sent = None
     while True:
-        await asyncio.sleep(1) # Broadcast every second
-        fleet_state = dispatch_service.get_all_ambulances()
-        await manager.broadcast({
-            "type": "FLEET_UPDATE",
-            "data": fleet_state
-        })
+        next_tick += 1.0 # Broadcast every second
+        delay = next_tick - loop.time()
+        if delay < -1.0:
+            # Fell more than a tick behind; resume from now instead of bursting
+            next_tick = loop.time()
+            delay = 0
+        await asyncio.sleep(max(0.0, delay))
+        snapshot = dispatch_service.snapshot
+        if snapshot.tick == last_sent:
+            continue # The simulation hasn't advanced since the last broadcast
+        last_sent = snapshot.tick
+        if manager.count("full"):
+            await manager.broadcast({
+                "type": "FLEET_UPDATE",
+                "data": snapshot.serialize(),
+                "tick": snapshot.tick
+            }, encoding="full", replaceable=True, unscoped=True)
+        if manager.count("delta"):
+            await manager.broadcast(fleet_encoder.encode(snapshot), encoding="delta", replaceable=True, unscoped=True)
+        else:
+            fleet_encoder.reset() # Nobody holds the previous frame; start the next client from a keyframe
+        # Binary frames name units added since the last broadcast; those can't be dropped for a newer frame
+        table_start = fleet_binary.table_start(snapshot)
+        if manager.count("binary"):
+            message = fleet_binary.frame(snapshot, table_start=table_start)
+            await manager.broadcast(message, encoding="binary", replaceable=replaceable(message), unscoped=True)
+        for (subscription, binary), websockets in manager.subscriptions().items():
+            if binary:
+                message = scoped_fleet("binary", subscription, table_start)
+            else:
+                message = fleet_viewport.message(snapshot, subscription)
+            await manager.broadcast_to(websockets, message, replaceable=replaceable(message))
+        fleet_binary.announced = len(snapshot)
+
+@app.get("/api/dispatch/stats")
+async def get_dispatch_stats():
+    return {**dispatch_service.get_stats(), "mode": settings.DISPATCH_MODE, "batcher": dispatch_batcher.get_stats(),
+            "fleet_updates": fleet_encoder.get_stats(), "binary_frames": fleet_binary.get_stats(),
+            "viewports": fleet_viewport.get_stats(),
+            "websockets": manager.get_stats()}
+
+@app.get("/api/dispatch/connections")
+async def get_dispatch_connections():
+    """Per-client queue depth, lag and drops of the dispatch websocket."""
+    return {"connections": manager.connection_stats()}
+
+@app.on_event("shutdown")
+def stop_dispatch_simulation():
+    dispatch_service.stop()
+    if scenario_recorder:
+        scenario_recorder.close()
 
 
 from app.services.pricing_service import pricing_service
@@ -0,0 +1,86 @@
+
+import math
+import threading
+from typing import Dict, List, Optional
+
+import torch
+import torch.nn as nn
+
+HEAD_FUSIONS = ("mean", "max")
+
+class AttentionRollout:
+    """
+    Collects an attention-rollout saliency map during an ordinary forward pass.
+
+    While active, hooks on every encoder block's self-attention ask it to also
+    return its attention weights (EncoderBlock normally discards them) and
+    fold each layer into a running product as soon as it is produced:
+
+        rollout = normalize(0.5 * A_l + 0.5 * I) @ rollout
+
+    so only one (N, S, S) matrix is ever held, whatever the depth. The class
+    token's row of the product, reshaped to the patch grid, is the map.
+
+        with AttentionRollout(model.vit) as rollout:
+            logits = model(x)
+        maps = rollout.heatmaps() # (N, 14, 14), each scaled to [0, 1]
+
+    The hooks sit on the shared model, so they act only on forward passes
+    run by the thread that entered the context; other requests running the
+    same model at the same time pass through them untouched.
+    """
+
+    def __init__(self, vit: nn.Module, head_fusion: str = "mean"):
+        if head_fusion not in HEAD_FUSIONS:
+            raise ValueError(f"Unknown head fusion: {head_fusion}")
+        self.attention_layers = [block.self_attention for block in vit.encoder.layers]
+        self.head_fusion = head_fusion
+        self.rollout: Optional[torch.Tensor] = None
+        self._handles = []
+        self._owner: Optional[int] = None # Thread whose forward passes the hooks act on
+
+    def __enter__(self) -> "AttentionRollout":
+        self.rollout = None
+        self._owner = threading.get_ident()
+        for layer in self.attention_layers:
+            self._handles.append(layer.register_forward_pre_hook(self._request_weights, with_kwargs=True))
+            self._handles.append(layer.register_forward_hook(self._fold))
+        return self
+
+    def __exit__(self, *exc):
+        for handle in self._handles:
+            handle.remove()
+        self._handles = []
+        self._owner = None
+
+    def _request_weights(self, module, args, kwargs):
+        if threading.get_ident() != self._owner:
+            return None
+        kwargs = dict(kwargs, need_weights=True, average_attn_weights=self.head_fusion == "mean")
+        return args, kwargs
+
+    def _fold(self, module, args, output):
+        if threading.get_ident() != self._owner:
+            return None
+        attention = output[1] # (N, S, S) averaged, or (N, heads, S, S)
+        if attention.dim() == 4:
+            attention = attention.max(dim=1).values
+        attention = 0.5 * attention + 0.5 * torch.eye(attention.shape[-1], dtype=attention.dtype, device=attention.device)
+        attention = attention / attention.sum(dim=-1, keepdim=True)
+        self.rollout = attention if self.rollout is None else torch.bmm(attention, self.rollout)
+
+    def heatmaps(self) -> torch.Tensor:
+        """Class-token attention to each patch, as (N, grid, grid) scaled per image to [0, 1]."""
+        if self.rollout is None:
+            raise RuntimeError("No forward pass ran inside the AttentionRollout context")
+        cls_to_patches = self.rollout[:, 0, 1:]
+        grid = int(math.isqrt(cls_to_patches.shape[1]))
+        maps = cls_to_patches.reshape(-1, grid, grid)
+        low = maps.amin(dim=(1, 2), keepdim=True)
+        high = maps.amax(dim=(1, 2), keepdim=True)
+        return (maps - low) / (high - low).clamp_min(1e-12)
+
+def heatmap_payload(heatmap: torch.Tensor, decimals: int = 3) -> Dict:
+    """JSON form of one map: a row-major grid over the patch layout of the 224x224 input."""
+    grid: List[List[float]] = [[round(float(v), decimals) for v in row] for row in heatmap.tolist()]
+    return {"method": "attention_rollout", "grid_size": len(grid), "grid": grid}
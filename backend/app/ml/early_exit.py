@@ -0,0 +1,142 @@
+
+import math
+import os
+import threading
+import time
+from collections import Counter
+from typing import Dict, Optional, Sequence, Tuple
+
+import torch
+import torch.nn as nn
+
+DEFAULT_EXIT_LAYERS = (4, 8)
+
+def exit_heads_path(checkpoint_path: str) -> str:
+    """Exit heads live next to the checkpoint they were distilled from: model.pth -> model.exits.pth"""
+    stem, _ = os.path.splitext(checkpoint_path)
+    return f"{stem}.exits.pth"
+
+def make_exit_head(hidden_dim: int, num_classes: int) -> nn.Module:
+    return nn.Sequential(nn.LayerNorm(hidden_dim), nn.Linear(hidden_dim, num_classes))
+
+def embed(vit: nn.Module, x: torch.Tensor) -> torch.Tensor:
+    """Patch embedding, class token and position embedding: the encoder input of torchvision's ViT."""
+    h = vit._process_input(x)
+    h = torch.cat([vit.class_token.expand(h.shape[0], -1, -1), h], dim=1)
+    return vit.encoder.dropout(h + vit.encoder.pos_embedding)
+
+def class_tokens(vit: nn.Module, x: torch.Tensor, layers: Sequence[int]) -> Tuple[Dict[int, torch.Tensor], torch.Tensor]:
+    """Class-token activations after each of `layers` (1-based), and the full model's logits."""
+    wanted = set(layers)
+    tokens = {}
+    h = embed(vit, x)
+    for i, block in enumerate(vit.encoder.layers, start=1):
+        h = block(h)
+        if i in wanted:
+            tokens[i] = h[:, 0]
+    return tokens, vit.heads(vit.encoder.ln(h)[:, 0])
+
+class EarlyExitViT(nn.Module):
+    """
+    Confidence-gated cascade over a BrainTumorViT.
+
+    Small heads read the class token after some intermediate encoder layers.
+    After each such layer, images whose head is at least `threshold` confident
+    stop there; only the rest continue through the remaining blocks, so a
+    batch of easy scans never pays for all 12. Images that never clear the
+    threshold get the full model's prediction.
+
+    Returns log-probabilities, so softmax over the output yields the same
+    probabilities whichever exit produced them.
+    """
+
+    def __init__(self, model: nn.Module, heads: Dict[int, nn.Module], threshold: float):
+        super().__init__()
+        self.model = model
+        self.exit_layers = sorted(heads)
+        self.heads = nn.ModuleDict({str(layer): heads[layer] for layer in self.exit_layers})
+        self.threshold = threshold
+        self.exit_names = [f"layer{layer}" for layer in self.exit_layers] + ["final"]
+
+        # Stats
+        self._lock = threading.Lock()
+        self.exits = Counter()
+        self.images = 0
+        self.seconds = 0.0
+
+    @classmethod
+    def from_file(cls, model: nn.Module, path: str, threshold: Optional[float] = None) -> "EarlyExitViT":
+        """Wraps `model` with heads saved by train_early_exit.py, using their calibrated threshold unless given one."""
+        saved = torch.load(path, map_location='cpu')
+        hidden_dim = model.vit.hidden_dim
+        heads = {}
+        for layer in saved['exit_layers']:
+            head = make_exit_head(hidden_dim, saved['num_classes'])
+            head.load_state_dict(saved['heads'][str(layer)])
+            heads[layer] = head.eval()
+        return cls(model, heads, threshold if threshold else saved['threshold'])
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        return self.cascade(x)[0]
+
+    def cascade(self, x: torch.Tensor, threshold: Optional[float] = None):
+        """Log-probabilities and, per image, the index into exit_names where it stopped."""
+        threshold = self.threshold if threshold is None else threshold
+        started = time.perf_counter()
+        vit = self.model.vit
+        n = x.shape[0]
+        out = None
+        exit_at = torch.full((n,), len(self.exit_layers), dtype=torch.long, device=x.device)
+        remaining = torch.arange(n, device=x.device)
+
+        min_log_prob = math.log(threshold)
+        h = embed(vit, x)
+        next_exit = 0
+        for i, block in enumerate(vit.encoder.layers, start=1):
+            h = block(h)
+            if next_exit >= len(self.exit_layers) or i != self.exit_layers[next_exit]:
+                continue
+
+            log_probs = torch.log_softmax(self.heads[str(i)](h[:, 0]), dim=1)
+            if out is None:
+                out = torch.empty((n, log_probs.shape[1]), dtype=log_probs.dtype, device=log_probs.device)
+            done = log_probs.max(dim=1).values >= min_log_prob
+            if done.any():
+                out[remaining[done]] = log_probs[done]
+                exit_at[remaining[done]] = next_exit
+                keep = ~done
+                h, remaining = h[keep], remaining[keep]
+            next_exit += 1
+            if len(remaining) == 0:
+                break
+
+        if len(remaining):
+            log_probs = torch.log_softmax(vit.heads(vit.encoder.ln(h)[:, 0]), dim=1)
+            if out is None:
+                out = log_probs
+            else:
+                out[remaining] = log_probs
+
+        self._record(exit_at, time.perf_counter() - started)
+        return out, exit_at
+
+    def _record(self, exit_at: torch.Tensor, seconds: float):
+        indices, counts = torch.unique(exit_at.cpu(), return_counts=True)
+        with self._lock:
+            for index, count in zip(indices.tolist(), counts.tolist()):
+                self.exits[self.exit_names[index]] += count
+            self.images += len(exit_at)
+            self.seconds += seconds
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            return {
+                "threshold": self.threshold,
+                "exit_layers": self.exit_layers,
+                "images": self.images,
+                "exit_rate": {
+                    name: round(self.exits[name] / self.images, 4) if self.images else 0.0
+                    for name in self.exit_names
+                },
+                "avg_ms_per_image": round(self.seconds * 1000 / self.images, 2) if self.images else 0.0
+            }
@@ -0,0 +1,70 @@
+
+from typing import Dict, Optional, Sequence
+
+import torch
+import torch.nn as nn
+import torchvision
+
+CLASSES = ['Glioma', 'Meningioma', 'No Tumor', 'Pituitary']
+
+class BrainTumorViT(nn.Module):
+    def __init__(self, num_classes=4):
+        super(BrainTumorViT, self).__init__()
+        self.vit = torchvision.models.vit_b_16(pretrained=False)
+        self.vit.heads = nn.Sequential(
+            nn.Linear(self.vit.heads.head.in_features, 256),
+            nn.ReLU(),
+            nn.Dropout(0.5),
+            nn.Linear(256, num_classes)
+        )
+
+    def forward(self, x):
+        return self.vit(x)
+
+def load_state_dict_file(path: str, use_mmap: bool = True) -> Dict[str, torch.Tensor]:
+    """
+    Reads checkpoint weights without a private in-memory copy where possible:
+    safetensors files and zip-format torch checkpoints are memory-mapped, so
+    tensors are backed by the page cache rather than freshly allocated.
+    """
+    if path.endswith('.safetensors'):
+        from safetensors.torch import load_file # Optional dependency
+        return load_file(path, device='cpu')
+
+    try:
+        checkpoint = torch.load(path, map_location='cpu', mmap=use_mmap)
+    except RuntimeError:
+        if not use_mmap:
+            raise
+        # Legacy (pre-zip) checkpoints can't be memory-mapped
+        checkpoint = torch.load(path, map_location='cpu')
+
+    # Handle different checkpoint formats if necessary
+    if 'model_state_dict' in checkpoint:
+        return checkpoint['model_state_dict']
+    return checkpoint
+
+def build_model_from_state(state_dict: Dict[str, torch.Tensor], num_classes: Optional[int] = None) -> BrainTumorViT:
+    """
+    Instantiates BrainTumorViT on the meta device and adopts the loaded tensors
+    as its parameters (assign=True), skipping both the random initialisation
+    and the copy that load_state_dict would otherwise make. The class count is
+    read from the classifier weights when not given.
+    """
+    if num_classes is None:
+        num_classes = state_dict['vit.heads.3.weight'].shape[0]
+    with torch.device('meta'):
+        model = BrainTumorViT(num_classes=num_classes)
+    model.load_state_dict(state_dict, assign=True)
+    return model.eval()
+
+def format_prediction(probs: torch.Tensor, classes: Sequence[str] = CLASSES) -> Dict:
+    """Result dict for one row of softmax probabilities."""
+    confidence, prediction = torch.max(probs, 0)
+    return {
+        'prediction': classes[prediction.item()],
+        'confidence': float(confidence.item()),
+        'probabilities': {
+            cls: float(prob.item()) for cls, prob in zip(classes, probs)
+        }
+    }
@@ -0,0 +1,74 @@
+
+from typing import List, Tuple
+
+import numpy as np
+
+# Cost of a pair that must not be matched; kept finite so the potentials stay finite
+INFEASIBLE = 1e12
+
+def _hungarian(cost: np.ndarray) -> np.ndarray:
+    """
+    Shortest augmenting path Hungarian algorithm for an n x m cost matrix
+    with n <= m, with the scan over columns vectorized. Returns the column
+    assigned to each row.
+    """
+    n, m = cost.shape
+    u = np.zeros(n + 1)
+    v = np.zeros(m + 1)
+    match = np.zeros(m + 1, dtype=np.int64) # column -> 1-based row, 0 if free; column 0 is the root
+    way = np.zeros(m + 1, dtype=np.int64)
+    for i in range(1, n + 1):
+        match[0] = i
+        j0 = 0
+        min_v = np.full(m + 1, np.inf)
+        used = np.zeros(m + 1, dtype=bool)
+        while True:
+            used[j0] = True
+            i0 = match[j0]
+            free = ~used[1:]
+            reduced = cost[i0 - 1] - u[i0] - v[1:]
+            better = free & (reduced < min_v[1:])
+            min_v[1:][better] = reduced[better]
+            way[1:][better] = j0
+            candidates = np.where(free, min_v[1:], np.inf)
+            j1 = int(np.argmin(candidates)) + 1
+            delta = candidates[j1 - 1]
+            u[match[used]] += delta
+            v[used] -= delta
+            min_v[1:][free] -= delta
+            j0 = j1
+            if match[j0] == 0:
+                break
+        while j0:
+            j1 = way[j0]
+            match[j0] = match[j1]
+            j0 = j1
+    assigned = np.full(n, -1, dtype=np.int64)
+    columns = np.flatnonzero(match[1:])
+    assigned[match[1:][columns] - 1] = columns
+    return assigned
+
+def solve_assignment(cost: np.ndarray) -> List[Tuple[int, int]]:
+    """
+    Minimum-cost matching between the rows and columns of `cost`, as
+    (row, column) pairs. Pairs costing INFEASIBLE or more are left out, so
+    rows without a feasible column stay unmatched. Uses scipy when it is
+    installed.
+    """
+    if cost.size == 0:
+        return []
+    cost = np.minimum(cost, INFEASIBLE)
+    try:
+        # Optional dependency
+        from scipy.optimize import linear_sum_assignment
+        rows, cols = linear_sum_assignment(cost)
+    except ImportError:
+        if cost.shape[0] <= cost.shape[1]:
+            cols = _hungarian(cost)
+            rows = np.arange(cost.shape[0])
+        else:
+            rows = _hungarian(cost.T)
+            cols = np.arange(cost.shape[1])
+        keep = (rows >= 0) & (cols >= 0)
+        rows, cols = rows[keep], cols[keep]
+    return [(int(r), int(c)) for r, c in zip(rows, cols) if cost[r, c] < INFEASIBLE]
@@ -0,0 +1,257 @@
+
+import asyncio
+from collections import Counter, OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+from app.core.config import settings
+from app.services.inference_executor import (
+    InferenceExecutor, InferenceQueueFull, inference_executor, predict_batch_job
+)
+from app.services.inference_service import inference_service
+from app.services.prediction_cache import PredictionCache, cache_namespace, prediction_cache
+
+class MicroBatcher:
+    """
+    Collects concurrent prediction requests into a single tensor batch.
+
+    A batch is closed as soon as it reaches `max_batch_size`, or `max_wait_ms`
+    after its first request arrived, whichever happens first. Every caller
+    awaits its own future and receives only its own result dict.
+
+    Batches run on `executor`, at most one per executor worker at a time.
+    At most `max_queue` requests may wait for a batch slot; beyond that
+    `submit` raises InferenceQueueFull instead of letting latency grow
+    without bound.
+
+    With a `cache`, results are looked up by image content and model
+    version before queueing, so a repeated scan never reaches the model.
+
+    Requests may pin a model version and ask for a heatmap; a batch mixing
+    these runs as one `run_batch(images, version, explain)` call per
+    combination.
+
+    Bulk and volume uploads, which form their own batches, go through
+    `submit_batch`: the same queue bound and executor slots, so they can't
+    crowd single requests out of the model.
+    """
+
+    def __init__(
+        self,
+        run_batch: Callable[[List[bytes], Optional[str], bool], List],
+        executor: InferenceExecutor,
+        max_batch_size: int = 8,
+        max_wait_ms: float = 10.0,
+        max_queue: int = 64,
+        timeout_s: Optional[float] = None,
+        cache: Optional[PredictionCache] = None,
+        model_version: Optional[Callable[[], str]] = None
+    ):
+        self.run_batch = run_batch
+        self.executor = executor
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self.max_queue = max(1, max_queue)
+        self.timeout_s = timeout_s
+        self.cache = cache
+        self.model_version = model_version or (lambda: "")
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._running = set()
+        self._batch_waiting = 0 # Images of submit_batch calls waiting for a slot
+
+        # Stats
+        self.batches_run = 0
+        self.items_processed = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.batch_sizes = Counter()
+
+    async def submit(
+        self,
+        image_bytes: bytes,
+        timeout_s: Optional[float] = None,
+        version: Optional[str] = None,
+        explain: bool = False
+    ) -> Dict:
+        """
+        Queues one image and waits for its result, from `version` if given,
+        else from whichever version is active when its batch runs. Raises
+        InferenceQueueFull when the queue is saturated and
+        asyncio.TimeoutError when the result doesn't arrive within the timeout.
+        """
+        if self.cache is not None:
+            namespace = cache_namespace(version or self.model_version(), explain)
+            cached = self.cache.get(self.cache.make_key(image_bytes, namespace))
+            if cached is not None:
+                return cached
+
+        self._ensure_worker()
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self._queue.put_nowait((image_bytes, (version, explain), future))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            raise InferenceQueueFull(f"Inference queue is full ({self.max_queue} pending)")
+
+        timeout = timeout_s if timeout_s is not None else self.timeout_s
+        try:
+            # A timeout cancels the future, so a request still in the queue is skipped
+            result = await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            raise
+
+        if self.cache is not None:
+            # Keyed by the version that actually answered; the active one may have changed meanwhile
+            self.cache.put_result(image_bytes, result, explain)
+        return result
+
+    async def submit_batch(
+        self,
+        images: List,
+        timeout_s: Optional[float] = None,
+        version: Optional[str] = None,
+        explain: bool = False
+    ) -> List[Union[Dict, Exception]]:
+        """
+        Runs an already formed batch (encoded images or decoded PIL slices)
+        as one `run_batch` call, once an executor slot is free. Its images count against `max_queue` while it waits.
+        Raises InferenceQueueFull when the queue is saturated and
+        asyncio.TimeoutError when the results don't arrive within the timeout;
+        a batch that times out while running keeps its slot until the
+        executor is done with it, so abandoned work doesn't pile up.
+        """
+        self._ensure_worker()
+        if self._queue.qsize() + self._batch_waiting + len(images) > self.max_queue:
+            self.rejected += len(images)
+            raise InferenceQueueFull(f"Inference queue is full ({self.max_queue} pending)")
+
+        loop = asyncio.get_running_loop()
+        timeout = timeout_s if timeout_s is not None else self.timeout_s
+        deadline = None if timeout is None else loop.time() + timeout
+        self._batch_waiting += len(images)
+        try:
+            await asyncio.wait_for(self._slots.acquire(), timeout)
+        except asyncio.TimeoutError:
+            self.timed_out += len(images)
+            raise
+        finally:
+            self._batch_waiting -= len(images)
+
+        task = asyncio.ensure_future(self.executor.run(self.run_batch, images, version, explain))
+        task.add_done_callback(lambda _: self._slots.release())
+        self._running.add(task)
+        task.add_done_callback(self._running.discard)
+        try:
+            results = await asyncio.wait_for(asyncio.shield(task), None if deadline is None else max(0.0, deadline - loop.time()))
+        except asyncio.TimeoutError:
+            self.timed_out += len(images)
+            raise
+
+        self.batches_run += 1
+        self.items_processed += len(images)
+        self.batch_sizes[len(images)] += 1
+        return results
+
+    def _ensure_worker(self):
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue(maxsize=self.max_queue)
+            self._slots = asyncio.Semaphore(self.executor.max_workers)
+            self._worker = asyncio.create_task(self._batch_loop())
+
+    async def _collect_batch(self, first, deadline: float) -> List[Tuple[bytes, Tuple[Optional[str], bool], asyncio.Future]]:
+        loop = asyncio.get_running_loop()
+        batch = [first]
+
+        while len(batch) < self.max_batch_size:
+            # Take whatever is already queued before paying for a timed wait
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _batch_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            first = await self._queue.get()
+            deadline = loop.time() + self.max_wait
+            # Don't collect the rest until a worker is free, so requests keep
+            # accumulating into the next batch while the current ones run.
+            # Taking the slot only once there is work leaves it to
+            # submit_batch while no single requests are waiting.
+            await self._slots.acquire()
+            try:
+                batch = await self._collect_batch(first, deadline)
+            except BaseException:
+                self._slots.release()
+                raise
+            task = asyncio.create_task(self._execute(batch))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _execute(self, batch: List[Tuple[bytes, Tuple[Optional[str], bool], asyncio.Future]]):
+        try:
+            # Callers that gave up while we were waiting don't need a slot
+            groups: Dict[Tuple[Optional[str], bool], List[Tuple[bytes, asyncio.Future]]] = OrderedDict()
+            for image, options, fut in batch:
+                if not fut.done():
+                    groups.setdefault(options, []).append((image, fut))
+
+            for (version, explain), group in groups.items():
+                await self._run_group(group, version, explain)
+        finally:
+            self._slots.release()
+
+    async def _run_group(self, group: List[Tuple[bytes, asyncio.Future]], version: Optional[str], explain: bool):
+        try:
+            results = await self.executor.run(self.run_batch, [image for image, _ in group], version, explain)
+        except Exception as e:
+            for _, fut in group:
+                if not fut.done():
+                    fut.set_exception(e)
+            return
+
+        self.batches_run += 1
+        self.items_processed += len(group)
+        self.batch_sizes[len(group)] += 1
+
+        for (_, fut), result in zip(group, results):
+            if fut.done():
+                continue
+            if isinstance(result, Exception):
+                fut.set_exception(result)
+            else:
+                fut.set_result(result)
+
+    def get_stats(self) -> Dict:
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000.0,
+            "max_queue": self.max_queue,
+            "batches_run": self.batches_run,
+            "items_processed": self.items_processed,
+            "avg_batch_size": round(self.items_processed / self.batches_run, 2) if self.batches_run else 0.0,
+            "batch_size_histogram": dict(sorted(self.batch_sizes.items())),
+            "queued": (self._queue.qsize() if self._queue else 0) + self._batch_waiting,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out
+        }
+
+prediction_batcher = MicroBatcher(
+    predict_batch_job,
+    inference_executor,
+    max_batch_size=settings.INFERENCE_MAX_BATCH_SIZE,
+    max_wait_ms=settings.INFERENCE_MAX_WAIT_MS,
+    max_queue=settings.INFERENCE_MAX_QUEUE,
+    timeout_s=settings.INFERENCE_TIMEOUT_S,
+    cache=prediction_cache,
+    model_version=lambda: inference_service.model_version
+)
@@ -0,0 +1,150 @@
+
+import asyncio
+import json
+import os
+import zipfile
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Tuple
+
+from starlette.concurrency import iterate_in_threadpool
+from starlette.datastructures import UploadFile
+
+from app.core.config import settings
+from app.services.batching_service import prediction_batcher
+from app.services.inference_service import inference_service
+from app.services.prediction_cache import cache_namespace, prediction_cache
+
+IMAGE_CONTENT_TYPES = ("image/jpeg", "image/png", "image/webp")
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+ZIP_CONTENT_TYPES = ("application/zip", "application/x-zip-compressed")
+
+# An item is (filename, image bytes or None, error message or None)
+UploadItem = Tuple[str, Optional[bytes], Optional[str]]
+
+def is_zip_upload(upload: UploadFile) -> bool:
+    return upload.content_type in ZIP_CONTENT_TYPES or (upload.filename or "").lower().endswith(".zip")
+
+def iter_upload_images(uploads: List[UploadFile], max_image_bytes: int) -> Iterator[UploadItem]:
+    """
+    Yields images one at a time from a list of uploads, expanding zip archives
+    entry by entry. Only the image currently being yielded is held in memory;
+    the uploads themselves stay in Starlette's spooled temporary files.
+    """
+    for upload in uploads:
+        name = upload.filename or "upload"
+        if is_zip_upload(upload):
+            try:
+                archive = zipfile.ZipFile(upload.file)
+            except zipfile.BadZipFile:
+                yield name, None, "Invalid zip archive"
+                continue
+            with archive:
+                for info in archive.infolist():
+                    if info.is_dir() or os.path.basename(info.filename).startswith("."):
+                        continue
+                    entry_name = f"{name}/{info.filename}"
+                    if not info.filename.lower().endswith(IMAGE_EXTENSIONS):
+                        yield entry_name, None, "Invalid file type"
+                    elif info.file_size > max_image_bytes:
+                        yield entry_name, None, "Image too large"
+                    else:
+                        yield entry_name, archive.read(info), None
+        elif upload.content_type in IMAGE_CONTENT_TYPES:
+            upload.file.seek(0)
+            data = upload.file.read(max_image_bytes + 1)
+            if len(data) > max_image_bytes:
+                yield name, None, "Image too large"
+            else:
+                yield name, data, None
+        else:
+            yield name, None, "Invalid file type"
+
+class BulkPredictionStream:
+    """
+    Feeds a stream of uploaded images through the model in tensor batches and
+    renders one NDJSON line per image as each batch completes, followed by a
+    SUMMARY line. Cached results are reused and fresh ones are cached.
+    With `model_version`, every image runs on that registry version; with
+    `explain`, every result carries a heatmap.
+    """
+
+    def __init__(self, batch_size: int, timeout_s: Optional[float] = None, model_version: Optional[str] = None, explain: bool = False):
+        self.batch_size = max(1, batch_size)
+        self.timeout_s = timeout_s
+        self.model_version = model_version
+        self.explain = explain
+        self.count = 0
+        self.errors = 0
+
+    async def stream(self, uploads: List[UploadFile], max_image_bytes: int) -> AsyncIterator[str]:
+        pending: List[Tuple[int, str, bytes]] = []
+        index = 0
+        async for name, data, error in iterate_in_threadpool(iter_upload_images(uploads, max_image_bytes)):
+            if error is not None:
+                yield self._line({"type": "ERROR", "index": index, "filename": name, "error": error})
+            else:
+                pending.append((index, name, data))
+                if len(pending) >= self.batch_size:
+                    for line in await self._run_batch(pending):
+                        yield line
+                    pending = []
+            index += 1
+
+        if pending:
+            for line in await self._run_batch(pending):
+                yield line
+
+        yield json.dumps({"type": "SUMMARY", "count": self.count, "errors": self.errors}) + "\n"
+
+    async def _run_batch(self, batch: List[Tuple[int, str, bytes]]) -> List[str]:
+        namespace = cache_namespace(self.model_version or inference_service.model_version, self.explain)
+        results: Dict[int, object] = {}
+        to_run: List[Tuple[int, bytes]] = []
+
+        for index, _, data in batch:
+            if prediction_cache is not None:
+                cached = prediction_cache.get(prediction_cache.make_key(data, namespace))
+                if cached is not None:
+                    results[index] = cached
+                    continue
+            to_run.append((index, data))
+
+        if to_run:
+            try:
+                # Through the batcher's queue bound and slots, so bulk uploads share the model with single requests
+                outputs = await prediction_batcher.submit_batch(
+                    [data for _, data in to_run], self.timeout_s, self.model_version, self.explain
+                )
+            except asyncio.TimeoutError:
+                outputs = [TimeoutError("Inference timed out")] * len(to_run)
+            except Exception as e:
+                outputs = [e] * len(to_run)
+
+            for (index, data), output in zip(to_run, outputs):
+                results[index] = output
+                if prediction_cache is not None and not isinstance(output, Exception):
+                    prediction_cache.put_result(data, output, self.explain)
+
+        lines = []
+        for index, name, _ in batch:
+            output = results[index]
+            if isinstance(output, Exception):
+                lines.append(self._line({"type": "ERROR", "index": index, "filename": name, "error": str(output)}))
+            else:
+                lines.append(self._line({"type": "RESULT", "index": index, "filename": name, "result": output}))
+        return lines
+
+    def _line(self, message: Dict) -> str:
+        self.count += 1
+        if message["type"] == "ERROR":
+            self.errors += 1
+        return json.dumps(message) + "\n"
+
+async def stream_batch_predictions(uploads: List[UploadFile], form, model_version: Optional[str] = None, explain: bool = False) -> AsyncIterator[str]:
+    """NDJSON body for /api/predict/batch. Closes the parsed form when done."""
+    try:
+        bulk = BulkPredictionStream(settings.INFERENCE_MAX_BATCH_SIZE, settings.INFERENCE_TIMEOUT_S, model_version, explain)
+        max_image_bytes = int(settings.BATCH_MAX_IMAGE_MB * 1024 * 1024)
+        async for line in bulk.stream(uploads, max_image_bytes):
+            yield line
+    finally:
+        await form.close()
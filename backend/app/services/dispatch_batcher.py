@@ -0,0 +1,88 @@
+
+import asyncio
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+from app.core.config import settings
+from app.services.dispatch_service import DispatchService, dispatch_service
+
+class DispatchBatcher:
+    """
+    Collects ride requests for up to `window_ms` after the first one arrives
+    (or until `max_batch` are waiting) and dispatches them together with
+    DispatchService.assign_batch, so simultaneous requests share out the
+    nearby units instead of each grabbing its own nearest.
+
+    Every caller awaits its own future and gets its own assignment (or None).
+    """
+
+    def __init__(self, service: DispatchService, window_ms: float = 250.0, max_batch: int = 500):
+        self.service = service
+        self.window = max(0.0, window_ms) / 1000.0
+        self.max_batch = max(1, max_batch)
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self.batch_sizes = Counter()
+
+    async def submit(self, lat: float, lng: float, required_type: Optional[str] = None) -> Optional[Dict]:
+        """Queues one pickup and waits for its {"id", "distance_km", "eta_s"}, or None if no unit qualifies."""
+        self._ensure_worker()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put(((lat, lng, required_type), future))
+        return await future
+
+    def _ensure_worker(self):
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.create_task(self._batch_loop())
+
+    async def _collect_batch(self) -> List[Tuple[Tuple[float, float, Optional[str]], asyncio.Future]]:
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.window
+
+        while len(batch) < self.max_batch:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _batch_loop(self):
+        while True:
+            batch = await self._collect_batch()
+            batch = [(request, fut) for request, fut in batch if not fut.done()]
+            if not batch:
+                continue
+            self.batch_sizes[len(batch)] += 1
+            try:
+                # Off the event loop: a few hundred requests take milliseconds to solve
+                results = await asyncio.to_thread(self.service.assign_batch, [request for request, _ in batch])
+            except Exception as e:
+                for _, fut in batch:
+                    if not fut.done():
+                        fut.set_exception(e)
+                continue
+            for (_, fut), result in zip(batch, results):
+                if not fut.done():
+                    fut.set_result(result)
+
+    def get_stats(self) -> Dict:
+        return {
+            "window_ms": self.window * 1000.0,
+            "max_batch": self.max_batch,
+            "queued": self._queue.qsize() if self._queue else 0,
+            "batch_size_histogram": dict(sorted(self.batch_sizes.items()))
+        }
+
+dispatch_batcher = DispatchBatcher(
+    dispatch_service,
+    window_ms=settings.DISPATCH_BATCH_WINDOW_MS,
+    max_batch=settings.DISPATCH_BATCH_MAX
+)
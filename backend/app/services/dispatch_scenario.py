@@ -0,0 +1,284 @@
+
+import json
+import math
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.services.dispatch_service import DispatchService
+from app.services.fleet_store import ON_SCENE
+from app.services.road_network import RoadRouter
+from app.services.spatial_index import KM_PER_DEG_LAT
+
+CITY = (18.90, 19.30, 72.77, 73.05) # lat_min, lat_max, lng_min, lng_max
+UNIT_TYPES = ("ALS", "BLS", "ICU", "NEONATAL")
+REQUIRED_TYPES = (None, None, "BLS", "ALS", "ICU")
+
+Unit = Tuple[str, str, str, float, float] # id, call_sign, type, lat, lng
+Request = Tuple[float, float, float, Optional[str]] # sim time (s), lat, lng, required_type
+
+class Scenario:
+    """
+    A reproducible dispatch workload: the fleet at t=0 and timestamped ride
+    requests. Stored as NDJSON: one SCENARIO line with its parameters, then
+    one UNIT or REQUEST line each, so recordings can be appended to.
+    """
+
+    def __init__(self, units: List[Unit], requests: List[Request], meta: Optional[Dict] = None):
+        self.units = units
+        self.requests = sorted(requests, key=lambda r: r[0])
+        self.meta = meta or {}
+
+    @property
+    def duration_s(self) -> float:
+        return self.requests[-1][0] if self.requests else 0.0
+
+    @classmethod
+    def generate(cls, units: int, requests_per_s: float, duration_s: float, hot_spots: int = 3,
+                 hot_share: float = 0.7, spread_km: float = 1.5, seed: int = 0,
+                 bbox: Tuple[float, float, float, float] = CITY) -> "Scenario":
+        """
+        `units` ambulances scattered over `bbox`, and requests arriving as a
+        Poisson process at `requests_per_s`. A `hot_share` of them cluster
+        (normally, `spread_km` wide) around `hot_spots` incident centres of
+        random weight; the rest are uniform. Same arguments, same scenario.
+        """
+        rng = np.random.default_rng(seed)
+        lat_min, lat_max, lng_min, lng_max = bbox
+        fleet = [
+            (f"AMB-{i}", f"Unit-{i}", str(rng.choice(UNIT_TYPES)), float(rng.uniform(lat_min, lat_max)), float(rng.uniform(lng_min, lng_max)))
+            for i in range(units)
+        ]
+
+        count = int(rng.poisson(requests_per_s * duration_s))
+        times = np.sort(rng.uniform(0, duration_s, count))
+        centres = np.column_stack((rng.uniform(lat_min, lat_max, hot_spots), rng.uniform(lng_min, lng_max, hot_spots)))
+        weights = rng.dirichlet(np.ones(hot_spots)) if hot_spots else np.empty(0)
+        spread_deg = spread_km / KM_PER_DEG_LAT
+        requests = []
+        for t in times.tolist():
+            if hot_spots and rng.random() < hot_share:
+                lat, lng = centres[rng.choice(hot_spots, p=weights)] + rng.normal(0, spread_deg, 2)
+            else:
+                lat, lng = rng.uniform(lat_min, lat_max), rng.uniform(lng_min, lng_max)
+            requests.append((t, float(lat), float(lng), REQUIRED_TYPES[int(rng.integers(len(REQUIRED_TYPES)))]))
+
+        meta = {"units": units, "requests_per_s": requests_per_s, "duration_s": duration_s, "hot_spots": hot_spots,
+                "hot_share": hot_share, "spread_km": spread_km, "seed": seed, "bbox": list(bbox)}
+        return cls(fleet, requests, meta)
+
+    def save(self, path: str):
+        with open(path, "w") as f:
+            f.write(json.dumps({"type": "SCENARIO", **self.meta}) + "\n")
+            for unit in self.units:
+                f.write(_unit_line(unit))
+            for request in self.requests:
+                f.write(_request_line(*request))
+
+    @classmethod
+    def load(cls, path: str) -> "Scenario":
+        units, requests, meta = [], [], {}
+        with open(path) as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                kind = record.pop("type")
+                if kind == "SCENARIO":
+                    meta = record
+                elif kind == "UNIT":
+                    units.append((record["id"], record["callSign"], record["unitType"], record["lat"], record["lng"]))
+                elif kind == "REQUEST":
+                    requests.append((record["t"], record["lat"], record["lng"], record.get("requiredType")))
+        return cls(units, requests, meta)
+
+def _unit_line(unit: Unit) -> str:
+    id, call_sign, type, lat, lng = unit
+    return json.dumps({"type": "UNIT", "id": id, "callSign": call_sign, "unitType": type, "lat": lat, "lng": lng}) + "\n"
+
+def _request_line(t: float, lat: float, lng: float, required_type: Optional[str]) -> str:
+    return json.dumps({"type": "REQUEST", "t": round(t, 3), "lat": lat, "lng": lng, "requiredType": required_type}) + "\n"
+
+class ScenarioRecorder:
+    """
+    Captures live traffic as a replayable Scenario: the fleet when recording
+    starts, then every ride request stamped with the simulation time.
+
+    `record` only queues a line under a lock; a writer thread appends the
+    queue to the open file every `flush_interval_s`, so recording never
+    blocks the event loop on disk.
+    """
+
+    def __init__(self, path: str, flush_interval_s: float = 0.5):
+        self.path = path
+        self.flush_interval = flush_interval_s
+        self.started_at: Optional[float] = None
+        self.recorded = 0
+        self._pending: List[str] = []
+        self._lock = threading.Lock() # Guards _pending
+        self._write_lock = threading.Lock() # Serialises writers (the thread and close)
+        self._file = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self, service: DispatchService):
+        snapshot = service.snapshot
+        lines = [json.dumps({"type": "SCENARIO", "recorded": True, "units": len(snapshot), "seed": service.seed}) + "\n"]
+        for id, call_sign, type, lat, lng in zip(snapshot.ids, snapshot.call_signs, snapshot.types,
+                                                 snapshot.lat.tolist(), snapshot.lng.tolist()):
+            lines.append(_unit_line((id, call_sign, type, lat, lng)))
+        with self._lock:
+            self._pending = lines
+        self._file = open(self.path, "w")
+        self.started_at = snapshot.sim_time
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="scenario recorder", daemon=True)
+        self._thread.start()
+        print(f"⏺️ Recording dispatch scenario to {self.path}")
+
+    def record(self, sim_time: float, lat: float, lng: float, required_type: Optional[str] = None):
+        if self.started_at is None:
+            return
+        line = _request_line(sim_time - self.started_at, lat, lng, required_type)
+        with self._lock:
+            self._pending.append(line)
+            self.recorded += 1
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"❌ Scenario recording write failed: {e!r}")
+
+    def flush(self):
+        """Writes out everything recorded so far."""
+        with self._write_lock:
+            with self._lock:
+                pending, self._pending = self._pending, []
+            if pending and self._file is not None:
+                self._file.write("".join(pending))
+                self._file.flush()
+
+def _distribution(values: List[float]) -> Dict:
+    if not values:
+        return {"count": 0}
+    array = np.asarray(values)
+    return {
+        "count": len(values),
+        "mean": round(float(array.mean()), 3),
+        "p50": round(float(np.percentile(array, 50)), 3),
+        "p95": round(float(np.percentile(array, 95)), 3),
+        "p99": round(float(np.percentile(array, 99)), 3),
+        "max": round(float(array.max()), 3)
+    }
+
+def run_scenario(scenario: Scenario, mode: str = "greedy", tick_hz: float = 1.0, batch_window_s: float = 0.25,
+                 candidates: Optional[int] = None, scene_s: float = 900.0, drain_s: float = 600.0,
+                 router: Optional[RoadRouter] = None, seed: int = 0) -> Dict:
+    """
+    Replays a scenario headlessly against a fresh DispatchService, in
+    simulated time: requests due before the end of a tick are dispatched
+    (one by one in "greedy" mode, or per `batch_window_s` of simulated time
+    through assign_batch in "batch" mode), then the tick runs. Units that
+    reach the scene go back to IDLE after `scene_s`. After the last request
+    the simulation runs `drain_s` longer so dispatched units can arrive.
+
+    Reports distributions of the wall-clock assignment latency per request
+    (a batch's solve time counts for each of its requests), tick time, the
+    ETA quoted at assignment and the response time the simulation actually
+    took (for units that arrived before the end), plus requests no unit
+    could take. Routes by road when given a `router` or when
+    DISPATCH_ROAD_GRAPH is set.
+    """
+    if mode not in ("greedy", "batch"):
+        raise ValueError(f"Unknown dispatch mode: {mode}")
+    service = DispatchService(tick_hz=tick_hz, seed=seed, seed_fleet=False, start=False, router=router, journal_dir="")
+    service.add_ambulances(scenario.units)
+    fleet = service.fleet
+    dt = service.scheduler.dt
+
+    assign_ms, tick_ms, etas, responses = [], [], [], []
+    unassigned = 0
+    requested_at = np.full(len(fleet), np.nan) # Request time of each unit's current job
+    on_scene_since = np.full(len(fleet), np.nan)
+    requests = scenario.requests
+    next_request = 0
+    ticks = int(math.ceil((scenario.duration_s + drain_s) / dt))
+
+    def dispatched(request: Request, result: Optional[Dict]):
+        nonlocal unassigned
+        if result is None:
+            unassigned += 1
+            return
+        etas.append(result["eta_s"])
+        requested_at[fleet.row_of[result["id"]]] = request[0]
+
+    for tick in range(ticks):
+        tick_end = (tick + 1) * dt
+        due = []
+        while next_request < len(requests) and requests[next_request][0] < tick_end:
+            due.append(requests[next_request])
+            next_request += 1
+
+        if mode == "greedy":
+            for request in due:
+                started = time.perf_counter()
+                result = service.dispatch_nearest(*request[1:])
+                assign_ms.append((time.perf_counter() - started) * 1000)
+                dispatched(request, result)
+        elif due:
+            windows: Dict[int, List[Request]] = {}
+            for request in due:
+                windows.setdefault(int(request[0] // batch_window_s), []).append(request)
+            for batch in windows.values():
+                started = time.perf_counter()
+                results = service.assign_batch([request[1:] for request in batch], candidates)
+                elapsed_ms = (time.perf_counter() - started) * 1000
+                assign_ms.extend([elapsed_ms] * len(batch))
+                for request, result in zip(batch, results):
+                    dispatched(request, result)
+
+        service.scheduler.run_ticks(1)
+        tick_ms.append(service.scheduler.last_tick_ms)
+
+        # Arrivals this tick, and units whose time on scene is over
+        now = service.sim_time
+        arrived = np.flatnonzero((fleet.status == ON_SCENE) & np.isnan(on_scene_since))
+        on_scene_since[arrived] = now
+        for row in arrived.tolist():
+            if not math.isnan(requested_at[row]):
+                responses.append(now - requested_at[row])
+                requested_at[row] = np.nan
+        for row in np.flatnonzero(now - on_scene_since >= scene_s).tolist():
+            service.complete_ride(fleet.ids[row])
+            on_scene_since[row] = np.nan
+
+    return {
+        "scenario": scenario.meta,
+        "mode": mode,
+        "road_graph": service.router is not None,
+        "units": len(fleet),
+        "requests": len(requests),
+        "assigned": len(etas),
+        "unassigned": unassigned,
+        "sim_time_s": round(service.sim_time, 1),
+        "assign_latency_ms": _distribution(assign_ms),
+        "tick_ms": _distribution(tick_ms),
+        "eta_s": _distribution(etas),
+        "response_s": _distribution(responses),
+        "still_en_route": int(np.count_nonzero(~np.isnan(requested_at))), # Not in response_s: ran out of drain time
+        "batch_assignment": service.get_batch_stats() if mode == "batch" else None
+    }
@@ -1,11 +1,17 @@
 
 import math
 import time
-import threading
-import asyncio
-from typing import List, Dict, Optional
-from datetime import datetime
-import random
+from typing import List, Dict, Optional, Tuple
+
+import numpy as np
+
+from app.core.config import settings
+from app.services.assignment import INFEASIBLE, solve_assignment
+from app.services.fleet_journal import FleetJournal
+from app.services.fleet_store import EN_ROUTE_TO_PICKUP, IDLE, FleetSnapshot, FleetStore
+from app.services.road_network import RoadRouter, load_router
+from app.services.sim_scheduler import FixedStepScheduler
+from app.services.spatial_index import KM_PER_DEG_LAT, GridIndex, haversine_km_array, serving_types
 
 # Data Models (mirroring TypeScript types)
 class GeoLocation:
@@ -24,15 +30,61 @@ class Ambulance:
         self.target_location: Optional[GeoLocation] = None
 
 class DispatchService:
-    _instance = None
-    
-    def __new__(cls):
-        if cls._instance is None:
-            cls._instance = super(DispatchService, cls).__new__(cls)
-            cls._instance.ambulances = {} # id -> Ambulance
-            cls._instance._initialize_fleet()
-            cls._instance._start_simulation()
-        return cls._instance
+    """
+    Simulated ambulance fleet and nearest-unit dispatch.
+
+    The simulation advances on a FixedStepScheduler thread. Each tick moves
+    the fleet by a fixed dt, re-indexes the IDLE units and publishes an
+    immutable FleetSnapshot as `snapshot`; readers use the latest one
+    without locking. With a `seed`, a run is reproducible. Construct one per
+    test or headless run with `start=False` and drive it with
+    `scheduler.run_ticks`.
+
+    With a road graph (`router`, or DISPATCH_ROAD_GRAPH), candidates from the
+    grid index are re-ranked by road ETA and dispatched units drive along
+    the road path; otherwise both are straight lines.
+
+    With a journal directory (`journal_dir`, or DISPATCH_JOURNAL_DIR), fleet
+    changes are logged and the fleet is snapshotted every
+    DISPATCH_SNAPSHOT_INTERVAL_S; a new service resumes from the latest
+    snapshot plus the log after it instead of seeding a fresh fleet.
+    """
+
+    SPEED_DEG_PER_S = 0.0005 # Approx 50m/s simulation speed
+    JITTER_DEG = 0.0001 # Random walk of IDLE units per second, to show aliveness
+
+    def __init__(self, tick_hz: Optional[float] = None, seed: Optional[int] = None, max_catch_up: Optional[int] = None,
+                 seed_fleet: bool = True, start: bool = True, router: Optional[RoadRouter] = None,
+                 journal_dir: Optional[str] = None):
+        self.seed = settings.DISPATCH_SEED if seed is None else seed
+        self.rng = np.random.default_rng(self.seed)
+        self.fleet = FleetStore()
+        self.idle_index = GridIndex(settings.DISPATCH_GRID_CELL_KM) # IDLE units as of the last tick
+        self.router = router or load_router(settings.DISPATCH_ROAD_GRAPH, settings.DISPATCH_ROUTE_CACHE_SIZE)
+        self.scheduler = FixedStepScheduler(
+            self.step,
+            tick_hz or settings.DISPATCH_TICK_HZ,
+            settings.DISPATCH_MAX_CATCH_UP_TICKS if max_catch_up is None else max_catch_up,
+            name="dispatch simulation"
+        )
+        self.sim_time = 0.0
+        self.batch_stats = {
+            "batches": 0, "requests": 0, "assigned": 0, "fallbacks": 0,
+            "solve_ms": 0.0, "optimal_eta_s": 0.0, "greedy_eta_s": 0.0
+        }
+        self.snapshot: FleetSnapshot = self.fleet.snapshot(0, 0.0)
+
+        directory = settings.DISPATCH_JOURNAL_DIR if journal_dir is None else journal_dir
+        self.journal = FleetJournal(directory, settings.DISPATCH_JOURNAL_FLUSH_MS / 1000) if directory else None
+        self.snapshot_every = max(1, round(settings.DISPATCH_SNAPSHOT_INTERVAL_S / self.scheduler.dt)) # ticks
+        recovered = self.journal is not None and self._recover()
+        self.fleet.journal = self.journal
+        if self.journal is not None:
+            self.journal.start()
+        if seed_fleet and not recovered:
+            self._initialize_fleet()
+        if start:
+            self.start()
 
     def _initialize_fleet(self):
         """Seed the city with ambulances"""
@@ -47,104 +99,297 @@ class DispatchService:
         types = ["ALS", "BLS", "ICU", "NEONATAL"]
         
         for i, pos in enumerate(initial_positions):
-            amb_id = f"AMB-{100+i}"
-            amb = Ambulance(
-                id=amb_id,
+            self.fleet.add(
+                id=f"AMB-{100+i}",
                 call_sign=f"Unit-{100+i}",
-                type=random.choice(types),
+                type=str(self.rng.choice(types)),
                 lat=pos[0],
                 lng=pos[1]
             )
-            self.ambulances[amb_id] = amb
-            print(f"Initialized {amb.call_sign} at {amb.location.lat}, {amb.location.lng}")
+            print(f"Initialized Unit-{100+i} at {pos[0]}, {pos[1]}")
+        self._publish()
+
+    def _recover(self) -> bool:
+        """Rebuilds the fleet from the journal's latest snapshot and the events after it; False if it is empty."""
+        state, events = self.journal.recover()
+        if state is None and not events:
+            return False
+        self.fleet = FleetStore.from_state(state) if state is not None else FleetStore()
+        for event in events:
+            self.fleet.apply(event)
+
+        meta = state["meta"] if state is not None else {}
+        snapshot_tick = meta.get("tick", 0)
+        tick = max([snapshot_tick] + [event["tick"] for event in events])
+        self.scheduler.tick = tick
+        self.sim_time = meta.get("sim_time", 0.0) + (tick - snapshot_tick) * self.scheduler.dt
+        if "rng" in meta:
+            self.rng.bit_generator.state = meta["rng"]
+        if self.router is not None:
+            # Routes are not journaled; plan them again from where the units are now
+            en_route = np.flatnonzero((self.fleet.status == EN_ROUTE_TO_PICKUP) & ~np.isnan(self.fleet.target_lat))
+            for row in en_route.tolist():
+                route = self.router.route(float(self.fleet.lat[row]), float(self.fleet.lng[row]),
+                                          float(self.fleet.target_lat[row]), float(self.fleet.target_lng[row]))
+                if route is not None:
+                    self.fleet.set_route(row, route)
+        self._publish(tick)
+        recovery = self.journal.recovery
+        print(f"♻️ Recovered {len(self.fleet)} units at tick {tick} (snapshot seq {recovery['snapshot_seq']}, "
+              f"{recovery['events_replayed']} events replayed) in {recovery['ms']:.0f}ms")
+        return True
+
+    def add_ambulances(self, units: List[Tuple[str, str, str, float, float]]):
+        """Adds (id, call_sign, type, lat, lng) units, searchable from the next snapshot on (published now)."""
+        for unit in units:
+            self.fleet.add(*unit)
+        self._publish(self.scheduler.tick)
 
     def get_all_ambulances(self) -> List[Dict]:
-        return [self._serialize_ambulance(a) for a in self.ambulances.values()]
+        return self.snapshot.serialize()
 
-    def _serialize_ambulance(self, amb: Ambulance) -> Dict:
-        return {
-            "id": amb.id,
-            "callSign": amb.call_sign,
-            "type": amb.type,
-            "status": amb.status,
-            "location": {
-                "lat": amb.location.lat,
-                "lng": amb.location.lng
-            },
-            "heading": amb.heading
-        }
+    def get_ambulance(self, ambulance_id: str) -> Optional[Ambulance]:
+        """A copy of one unit's current state."""
+        row = self.fleet.row_of.get(ambulance_id)
+        if row is None:
+            return None
+        data = self.fleet.serialize(np.array([row]))[0]
+        amb = Ambulance(data["id"], data["callSign"], data["type"], data["location"]["lat"], data["location"]["lng"])
+        amb.status = data["status"]
+        amb.heading = data["heading"]
+        if not math.isnan(self.fleet.target_lat[row]):
+            amb.target_location = GeoLocation(float(self.fleet.target_lat[row]), float(self.fleet.target_lng[row]))
+        return amb
 
     def find_nearest_ambulance(self, patient_lat: float, patient_lng: float, required_type: str = None) -> Optional[str]:
-        """Finds the nearest IDLE ambulance using Haversine distance"""
-        min_dist = float('inf')
-        nearest_id = None
-        
-        for amb_id, amb in self.ambulances.items():
-            if amb.status != "IDLE":
-                continue
-            if required_type and amb.type != required_type:
-                # Basic matching: ICU can do ALS/BLS, but BLS cannot do ICU
-                pass # Simplify for prototype
-                
-            dist = self._haversine_distance(amb.location.lat, amb.location.lng, patient_lat, patient_lng)
-            if dist < min_dist:
-                min_dist = dist
-                nearest_id = amb_id
-                
-        return nearest_id
+        """Finds the nearest IDLE ambulance able to take a `required_type` call"""
+        nearest = self.find_nearest_ambulances(patient_lat, patient_lng, 1, required_type)
+        return nearest[0]["id"] if nearest else None
 
-    def dispatch_ambulance(self, ambulance_id: str, target_lat: float, target_lng: float):
-        if ambulance_id in self.ambulances:
-            amb = self.ambulances[ambulance_id]
-            amb.status = "EN_ROUTE_TO_PICKUP"
-            amb.target_location = GeoLocation(target_lat, target_lng)
-            return True
-        return False
-
-    def _haversine_distance(self, lat1, lon1, lat2, lon2):
-        R = 6371 # Earth radius in km
-        dlat = math.radians(lat2 - lat1)
-        dlon = math.radians(lon2 - lon1)
-        a = math.sin(dlat/2) * math.sin(dlat/2) + math.cos(math.radians(lat1)) \
-            * math.cos(math.radians(lat2)) * math.sin(dlon/2) * math.sin(dlon/2)
-        c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
-        return R * c
-
-    def _start_simulation(self):
-        """Background thread to move ambulances"""
-        t = threading.Thread(target=self._simulation_loop, daemon=True)
-        t.start()
-
-    def _simulation_loop(self):
-        print("Starting Simulation Loop...")
+    def find_nearest_ambulances(self, patient_lat: float, patient_lng: float, k: int = 1, required_type: str = None,
+                                exact_type: bool = False, max_km: Optional[float] = None) -> List[Dict]:
+        """
+        Up to `k` IDLE ambulances, soonest first, as {"id", "distance_km",
+        "eta_s"}. By default a unit qualifies if its type covers
+        `required_type` (ICU covers ALS/BLS, ALS covers BLS); `exact_type`
+        only accepts that type.
+        """
+        return [
+            {"id": self.fleet.ids[row], "distance_km": distance, "eta_s": eta}
+            for row, distance, eta in self._ranked_rows(patient_lat, patient_lng, k, required_type, exact_type, max_km)
+        ]
+
+    def dispatch_nearest(self, lat: float, lng: float, required_type: Optional[str] = None) -> Optional[Dict]:
+        """Sends the soonest qualifying IDLE unit to a pickup; its {"id", "distance_km", "eta_s"}, or None."""
         while True:
-            time.sleep(1) # 1Hz update
-            for amb in self.ambulances.values():
-                if amb.status == "EN_ROUTE_TO_PICKUP" and amb.target_location:
-                    # Move towards target
-                    self._move_towards(amb, amb.target_location)
-                elif amb.status == "IDLE":
-                     # Random jitter to show aliveness
-                     amb.location.lat += random.uniform(-0.0001, 0.0001)
-                     amb.location.lng += random.uniform(-0.0001, 0.0001)
-
-    def _move_towards(self, amb: Ambulance, target: GeoLocation):
-        speed = 0.0005 # Approx 50m/s simulation speed
-        
-        dy = target.lat - amb.location.lat
-        dx = target.lng - amb.location.lng
-        distance = math.sqrt(dx*dx + dy*dy)
-        
-        if distance < speed:
-            amb.location.lat = target.lat
-            amb.location.lng = target.lng
-            amb.status = "ON_SCENE"
-            amb.target_location = None
+            nearest = self._ranked_rows(lat, lng, 1, required_type)
+            if not nearest:
+                return None
+            row, km, eta = nearest[0]
+            if self._claim(row, lat, lng):
+                return {"id": self.fleet.ids[row], "distance_km": km, "eta_s": eta}
+
+    def _nearest_rows(self, lat: float, lng: float, k: int, required_type: Optional[str] = None,
+                      exact_type: bool = False, max_km: Optional[float] = None,
+                      exclude: Optional[np.ndarray] = None) -> List[Tuple[int, float]]:
+        types = serving_types(required_type, exact_type)
+        allowed = None if types is None else self.fleet.type_mask(types)
+
+        def accept(rows: np.ndarray) -> np.ndarray:
+            # Units dispatched since the last tick are still in the index
+            mask = self.fleet.status[rows] == IDLE
+            if allowed is not None:
+                mask &= allowed[self.fleet.type_code[rows]]
+            if exclude is not None:
+                mask &= ~exclude[rows]
+            return mask
+
+        return self.idle_index.nearest(lat, lng, k, accept, max_km)
+
+    def _ranked_rows(self, lat: float, lng: float, k: int, required_type: Optional[str] = None,
+                     exact_type: bool = False, max_km: Optional[float] = None,
+                     exclude: Optional[np.ndarray] = None) -> List[Tuple[int, float, float]]:
+        """Up to `k` (row, distance_km, eta_s), soonest first: by road when a graph is loaded, else straight-line."""
+        if self.router is None:
+            return [(row, km, self.eta_seconds(km))
+                    for row, km in self._nearest_rows(lat, lng, k, required_type, exact_type, max_km, exclude)]
+
+        # The straight-line nearest units are a good candidate set; roads decide the order
+        nearest = self._nearest_rows(lat, lng, max(k, settings.DISPATCH_ROAD_CANDIDATES), required_type,
+                                     exact_type, max_km, exclude)
+        if not nearest:
+            return []
+        rows = np.array([row for row, _ in nearest])
+        seconds, meters = self.router.etas_to(lat, lng, self.fleet.lat[rows], self.fleet.lng[rows])
+        order = [i for i in np.argsort(seconds, kind="stable") if np.isfinite(seconds[i])][:k]
+        return [(int(rows[i]), float(meters[i]) / 1000, float(seconds[i])) for i in order]
+
+    def _claim(self, row: int, lat: float, lng: float) -> bool:
+        """Sends an IDLE unit to a pickup, by road when possible; False if it is no longer IDLE."""
+        route = None
+        if self.router is not None:
+            route = self.router.route(float(self.fleet.lat[row]), float(self.fleet.lng[row]), lat, lng)
+        return self.fleet.claim(row, lat, lng, route)
+
+    def eta_seconds(self, distance_km: float) -> float:
+        """Straight-line travel time at the simulation's speed (road ETAs come from the router)."""
+        return distance_km / (self.SPEED_DEG_PER_S * KM_PER_DEG_LAT)
+
+    def assign_batch(self, requests: List[Tuple[float, float, Optional[str]]], candidates: Optional[int] = None) -> List[Optional[Dict]]:
+        """
+        Dispatches several (lat, lng, required_type) pickups at once, minimising
+        their total ETA instead of serving them one by one.
+
+        The cost matrix only holds each request's nearest qualifying IDLE
+        units, so it stays small however large the fleet: `candidates`, plus
+        one more for every other request in the batch that is competing for
+        the same neighbourhood, plus the unit greedy dispatch would give it.
+        The last makes the result never worse than greedy. Requests the
+        solver leaves unmatched fall back to the nearest unit still IDLE.
+        Returns one {"id", "distance_km", "eta_s"} or None per request.
+        """
+        started = time.perf_counter()
+        k = candidates or settings.DISPATCH_BATCH_CANDIDATES
+        greedy = self._greedy_rows(requests)
+
+        pickup_lat = np.array([lat for lat, _, _ in requests])
+        pickup_lng = np.array([lng for _, lng, _ in requests])
+        options = []
+        for i, (lat, lng, required_type) in enumerate(requests):
+            nearest = self._ranked_rows(lat, lng, k, required_type)
+            if nearest:
+                # Requests within reach of the same k units compete for them
+                radius = max(km for _, km, _ in nearest)
+                competing = int((haversine_km_array(lat, lng, pickup_lat, pickup_lng) <= radius).sum()) - 1
+                if competing > 0:
+                    nearest = self._ranked_rows(lat, lng, k + competing, required_type)
+            if greedy[i] is not None and greedy[i][0] not in {row for row, _, _ in nearest}:
+                nearest.append(greedy[i])
+            options.append(nearest)
+
+        columns = sorted({row for rows in options for row, _, _ in rows})
+        column_of = {row: j for j, row in enumerate(columns)}
+        cost = np.full((len(requests), len(columns)), INFEASIBLE)
+        distance = np.full_like(cost, np.inf)
+        for i, rows in enumerate(options):
+            for row, km, eta in rows:
+                cost[i, column_of[row]] = eta
+                distance[i, column_of[row]] = km
+        pairs = solve_assignment(cost)
+
+        results: List[Optional[Dict]] = [None] * len(requests)
+        for i, j in pairs:
+            lat, lng, _ = requests[i]
+            if self._claim(columns[j], lat, lng):
+                results[i] = {"id": self.fleet.ids[columns[j]], "distance_km": float(distance[i, j]), "eta_s": float(cost[i, j])}
+        fallbacks = 0
+        for i, (lat, lng, required_type) in enumerate(requests):
+            # Claimed units are no longer IDLE, so this only sees what is left
+            if results[i] is None:
+                results[i] = self.dispatch_nearest(lat, lng, required_type)
+                if results[i] is not None:
+                    fallbacks += 1
+
+        stats = self.batch_stats
+        stats["batches"] += 1
+        stats["requests"] += len(requests)
+        stats["assigned"] += sum(r is not None for r in results)
+        stats["fallbacks"] += fallbacks
+        stats["solve_ms"] += (time.perf_counter() - started) * 1000
+        greedy_matched = [g for g in greedy if g is not None]
+        if len(pairs) == len(greedy_matched):
+            # Same number of matches: compare their total ETA
+            stats["optimal_eta_s"] += float(sum(cost[i, j] for i, j in pairs))
+            stats["greedy_eta_s"] += float(sum(eta for _, _, eta in greedy_matched))
+        return results
+
+    def _greedy_rows(self, requests: List[Tuple[float, float, Optional[str]]]) -> List[Optional[Tuple[int, float, float]]]:
+        """The (row, distance_km, eta_s) per-request dispatch would give each request in turn, without claiming anything."""
+        taken = np.zeros(len(self.fleet), dtype=bool)
+        picks = []
+        for lat, lng, required_type in requests:
+            nearest = self._ranked_rows(lat, lng, 1, required_type, exclude=taken)
+            if nearest:
+                taken[nearest[0][0]] = True
+            picks.append(nearest[0] if nearest else None)
+        return picks
+
+    def get_batch_stats(self) -> Dict:
+        stats = dict(self.batch_stats)
+        batches = stats["batches"]
+        stats["avg_batch_size"] = round(stats["requests"] / batches, 2) if batches else 0.0
+        stats["avg_solve_ms"] = round(stats.pop("solve_ms") / batches, 3) if batches else 0.0
+        greedy = stats["greedy_eta_s"]
+        stats["eta_saved_pct"] = round(100 * (greedy - stats["optimal_eta_s"]) / greedy, 2) if greedy else 0.0
+        stats["optimal_eta_s"] = round(stats["optimal_eta_s"], 1)
+        stats["greedy_eta_s"] = round(greedy, 1)
+        return stats
+
+    def dispatch_ambulance(self, ambulance_id: str, target_lat: float, target_lng: float):
+        row = self.fleet.row_of.get(ambulance_id)
+        if row is None:
+            return False
+        route = None
+        if self.router is not None:
+            route = self.router.route(float(self.fleet.lat[row]), float(self.fleet.lng[row]), target_lat, target_lng)
+        if route is not None:
+            self.fleet.set_route(row, route)
         else:
-            ratio = speed / distance
-            amb.location.lat += dy * ratio
-            amb.location.lng += dx * ratio
-            # Calculate heading
-            amb.heading = math.degrees(math.atan2(dx, dy))
+            self.fleet.set_target(row, target_lat, target_lng)
+        return True
+
+    def complete_ride(self, ambulance_id: str) -> bool:
+        """Returns a unit to service (IDLE at its current position) once its ride is over."""
+        row = self.fleet.row_of.get(ambulance_id)
+        if row is None:
+            return False
+        self.fleet.release(row)
+        return True
+
+    def _publish(self, ticks: int = 0):
+        """Re-indexes the IDLE units and publishes a snapshot of the state after `ticks` ticks."""
+        with self.fleet.lock:
+            idle = np.flatnonzero(self.fleet.status == IDLE)
+            lat, lng = self.fleet.lat[idle], self.fleet.lng[idle]
+        self.idle_index.rebuild(idle, lat, lng)
+        self.snapshot = self.fleet.snapshot(ticks, self.sim_time)
+
+    def start(self):
+        """Starts the simulation thread"""
+        self.scheduler.start()
+
+    def stop(self):
+        self.scheduler.stop()
+        if self.journal is not None:
+            # A final snapshot, so the next start has no log to replay
+            self._checkpoint(self.scheduler.tick)
+            self.journal.flush()
+
+    def _checkpoint(self, ticks: int):
+        self.fleet.checkpoint(tick=ticks, sim_time=self.sim_time, rng=self.rng.bit_generator.state)
+
+    def step(self, tick: int, dt: float):
+        """Advances every unit by `dt` seconds of simulated time."""
+        if self.journal is not None:
+            self.journal.tick = tick + 1 # Events from here on happen in the state after this tick
+        # Jitter is a random walk, so its amplitude scales with sqrt(dt)
+        self.fleet.step(self.rng, self.SPEED_DEG_PER_S * dt, self.JITTER_DEG * dt ** 0.5, dt)
+        self.sim_time += dt
+        self._publish(tick + 1)
+        if self.journal is not None and (tick + 1) % self.snapshot_every == 0:
+            self._checkpoint(tick + 1)
+
+    def get_stats(self) -> Dict:
+        return {
+            "units": len(self.fleet),
+            "seed": self.seed,
+            "sim_time_s": round(self.sim_time, 3),
+            "snapshot_tick": self.snapshot.tick,
+            "scheduler": self.scheduler.get_stats(),
+            "idle_index": self.idle_index.get_stats(),
+            "road_router": self.router.get_stats() if self.router else None,
+            "journal": self.journal.get_stats() if self.journal else None,
+            "batch_assignment": self.get_batch_stats()
+        }
 
 dispatch_service = DispatchService()
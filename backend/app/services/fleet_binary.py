@@ -0,0 +1,110 @@
+
+import json
+import struct
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from app.services.fleet_store import STATUSES, FleetSnapshot
+
+MAGIC = b"FU"
+VERSION = 1
+KINDS = {"INIT_FLEET": 1, "FLEET_UPDATE": 2}
+SCOPED = 0x80 # Or'ed into the kind for viewport-scoped frames
+HEADER = struct.Struct("<2sBBqIII") # magic, version, kind, tick, record count, table start row, table bytes
+RECORD = np.dtype([("row", "<u4"), ("lat", "<i4"), ("lng", "<i4"), ("heading", "<i2"), ("status", "u1"), ("pad", "u1")])
+COORD_SCALE = 1e6 # Coordinates in microdegrees (about 0.1 m)
+HEADING_SCALE = 10 # Headings in tenths of a degree
+
+class FleetBinaryEncoder:
+    """
+    Packed binary fleet frames for websocket clients that connect with
+    ?encoding=binary, instead of JSON with its repeated key names and long
+    float strings. A frame is a header, an optional unit table, then one
+    fixed 16-byte little-endian record per unit:
+
+        header  magic "FU", version u8, kind u8 (1 INIT_FLEET, 2 FLEET_UPDATE;
+                | 0x80 when viewport-scoped), tick i64, record count u32,
+                table start row u32, table length u32
+        table   UTF-8 JSON [[id, callSign, type], ...] for rows from the start row
+        record  row u32, lat i32 and lng i32 (microdegrees), heading i16
+                (tenths of a degree), status u8 (index into STATUSES), pad u8
+
+    Records refer to units by row, so the strings are only sent in the
+    table: all of it in INIT_FLEET, and in later frames only for units added
+    since the previous broadcast (`table_start`; the broadcaster advances
+    `announced` once a tick's frames are out).
+    """
+
+    def __init__(self):
+        self.announced = 0 # Rows whose table entries have been broadcast
+
+        # Stats
+        self.frames = 0
+        self.bytes = 0
+
+    def frame(self, snapshot: FleetSnapshot, message_type: str = "FLEET_UPDATE", rows: Optional[np.ndarray] = None,
+              table_start: Optional[int] = None, scoped: bool = False) -> bytes:
+        """Every unit of `snapshot` (or just `rows`), with table entries from row `table_start` if given."""
+        if rows is None:
+            lat, lng, heading, status = snapshot.lat, snapshot.lng, snapshot.heading, snapshot.status
+            rows = np.arange(len(snapshot))
+        else:
+            lat, lng, heading, status = snapshot.lat[rows], snapshot.lng[rows], snapshot.heading[rows], snapshot.status[rows]
+        records = np.empty(len(rows), dtype=RECORD)
+        records["row"] = rows
+        records["lat"] = np.round(lat * COORD_SCALE)
+        records["lng"] = np.round(lng * COORD_SCALE)
+        records["heading"] = np.round(heading * HEADING_SCALE)
+        records["status"] = status
+        records["pad"] = 0
+
+        table = b""
+        if table_start is not None:
+            entries = list(zip(snapshot.ids[table_start:], snapshot.call_signs[table_start:], snapshot.types[table_start:]))
+            table = json.dumps(entries, separators=(",", ":"), ensure_ascii=False).encode()
+        kind = KINDS[message_type] | (SCOPED if scoped else 0)
+        header = HEADER.pack(MAGIC, VERSION, kind, snapshot.tick, len(records), table_start or 0, len(table))
+        frame = header + table + records.tobytes()
+        self.frames += 1
+        self.bytes += len(frame)
+        return frame
+
+    def table_start(self, snapshot: FleetSnapshot) -> Optional[int]:
+        """Row from which this tick's frames must carry table entries, or None if no unit is new."""
+        return self.announced if len(snapshot) > self.announced else None
+
+    def get_stats(self) -> Dict:
+        return {
+            "frames": self.frames,
+            "avg_bytes": round(self.bytes / self.frames) if self.frames else 0,
+            "announced_units": self.announced
+        }
+
+def carries_table(frame: bytes) -> bool:
+    """Whether a frame names units; the client can't resolve later records without it, so it mustn't be dropped."""
+    return HEADER.unpack_from(frame)[6] > 0
+
+def decode_frame(frame: bytes) -> Dict:
+    """
+    A binary frame back as a dict: "type", "tick", "scoped", "table_start",
+    "units" (the table entries) and "data" (one dict per record, with its row).
+    The reference decoder for clients, and for checking the encoder.
+    """
+    magic, version, kind, tick, count, table_start, table_len = HEADER.unpack_from(frame)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"Not a version {VERSION} fleet frame")
+    offset = HEADER.size
+    units: List = json.loads(frame[offset:offset + table_len]) if table_len else []
+    records = np.frombuffer(frame, dtype=RECORD, count=count, offset=offset + table_len)
+    types = {code: name for name, code in KINDS.items()}
+    data = [
+        {"row": r, "location": {"lat": la / COORD_SCALE, "lng": ln / COORD_SCALE}, "heading": h / HEADING_SCALE,
+         "status": STATUSES[s]}
+        for r, la, ln, h, s in zip(records["row"].tolist(), records["lat"].tolist(), records["lng"].tolist(),
+                                   records["heading"].tolist(), records["status"].tolist())
+    ]
+    return {"type": types[kind & ~SCOPED], "tick": tick, "scoped": bool(kind & SCOPED), "table_start": table_start,
+            "units": units, "data": data}
+
+fleet_binary = FleetBinaryEncoder()
@@ -0,0 +1,127 @@
+
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.core.config import settings
+from app.services.fleet_store import STATUSES, FleetSnapshot
+
+class FleetDeltaEncoder:
+    """
+    Encodes successive fleet snapshots as FLEET_UPDATE frames for clients
+    that asked for deltas: a keyframe (every unit, like INIT_FLEET) every
+    `keyframe_interval` frames, and in between only the units whose
+    quantized position, heading or status changed, with just those fields.
+
+    Coordinates are rounded to `precision` decimals (5 is about 1 m) and
+    headings to whole degrees, so jitter below that precision sends nothing.
+    Every frame carries `seq`; a client that sees a gap asks for a keyframe
+    (RESYNC) and gets `keyframe()`, the state as of the last frame sent.
+    """
+
+    def __init__(self, precision: int = 5, keyframe_interval: int = 30):
+        self.precision = precision
+        self.scale = 10 ** precision
+        self.keyframe_interval = max(1, keyframe_interval)
+        self.seq = 0
+        self._base: Optional[Tuple[np.ndarray, ...]] = None # Quantized state of the last frame
+        self._base_snapshot: Optional[FleetSnapshot] = None
+        self._since_keyframe = 0
+        self._keyframes: Dict[str, Tuple[int, FleetSnapshot, Dict]] = {} # message type -> (seq, snapshot, frame)
+
+        # Stats
+        self.frames = 0
+        self.keyframes = 0
+        self.changed_units = 0
+        self.units_seen = 0
+
+    def reset(self):
+        """Forgets the last frame (e.g. when no delta client is connected), so the next one is a keyframe."""
+        self._base = None
+        self._base_snapshot = None
+
+    def _quantize(self, snapshot: FleetSnapshot) -> Tuple[np.ndarray, ...]:
+        return (np.round(snapshot.lat * self.scale).astype(np.int64), np.round(snapshot.lng * self.scale).astype(np.int64),
+                np.round(snapshot.heading).astype(np.int64), snapshot.status)
+
+    def encode(self, snapshot: FleetSnapshot) -> Dict:
+        """The next frame: a keyframe when due, else the changes since the previous frame."""
+        quantized = self._quantize(snapshot)
+        self.seq += 1
+        self.frames += 1
+        self.units_seen += len(snapshot)
+        if self._base is None or self._since_keyframe + 1 >= self.keyframe_interval:
+            frame = self._keyframe(snapshot, quantized, "FLEET_UPDATE")
+            self._since_keyframe = 0
+            self.keyframes += 1
+            self.changed_units += len(snapshot)
+        else:
+            changes = self._changes(snapshot, quantized)
+            frame = {"type": "FLEET_UPDATE", "keyframe": False, "seq": self.seq, "tick": snapshot.tick, "changes": changes}
+            self._since_keyframe += 1
+            self.changed_units += len(changes)
+        self._base = quantized
+        self._base_snapshot = snapshot
+        return frame
+
+    def keyframe(self, snapshot: FleetSnapshot, message_type: str = "FLEET_UPDATE") -> Dict:
+        """
+        Every unit as of the last frame sent (or `snapshot` before the first),
+        for connects and resyncs. Clients asking at the same frame get the
+        same dict, so it is built and encoded once.
+        """
+        source = self._base_snapshot if self._base_snapshot is not None else snapshot
+        cached = self._keyframes.get(message_type)
+        if cached is not None and cached[0] == self.seq and cached[1] is source:
+            return cached[2]
+        quantized = self._base if self._base_snapshot is not None else self._quantize(snapshot)
+        frame = self._keyframe(source, quantized, message_type)
+        self._keyframes[message_type] = (self.seq, source, frame)
+        return frame
+
+    def _keyframe(self, snapshot: FleetSnapshot, quantized: Tuple[np.ndarray, ...], message_type: str) -> Dict:
+        lat, lng, heading, status = (a.tolist() for a in quantized)
+        scale = self.scale
+        data = [
+            {"id": i, "callSign": c, "type": t, "status": STATUSES[s], "location": {"lat": la / scale, "lng": ln / scale}, "heading": h}
+            for i, c, t, la, ln, h, s in zip(snapshot.ids, snapshot.call_signs, snapshot.types, lat, lng, heading, status)
+        ]
+        return {"type": message_type, "keyframe": True, "seq": self.seq, "tick": snapshot.tick,
+                "precision": self.precision, "data": data}
+
+    def _changes(self, snapshot: FleetSnapshot, quantized: Tuple[np.ndarray, ...]) -> List[Dict]:
+        lat, lng, heading, status = quantized
+        base_lat, base_lng, base_heading, base_status = self._base
+        n = len(base_lat) # Rows are append-only; anything past the base is new
+        moved = (lat[:n] != base_lat) | (lng[:n] != base_lng)
+        turned = heading[:n] != base_heading
+        switched = status[:n] != base_status
+        rows = np.flatnonzero(moved | turned | switched)
+
+        scale = self.scale
+        changes = []
+        for row, m, tu, sw, la, ln, h, s in zip(rows.tolist(), moved[rows].tolist(), turned[rows].tolist(),
+                                               switched[rows].tolist(), lat[rows].tolist(), lng[rows].tolist(),
+                                               heading[rows].tolist(), status[rows].tolist()):
+            change = {"id": snapshot.ids[row]}
+            if m:
+                change["location"] = {"lat": la / scale, "lng": ln / scale}
+            if tu:
+                change["heading"] = h
+            if sw:
+                change["status"] = STATUSES[s]
+            changes.append(change)
+        if len(lat) > n:
+            changes.extend(self._keyframe(snapshot, quantized, "FLEET_UPDATE")["data"][n:])
+        return changes
+
+    def get_stats(self) -> Dict:
+        return {
+            "seq": self.seq,
+            "frames": self.frames,
+            "keyframes": self.keyframes,
+            "avg_units_per_frame": round(self.changed_units / self.frames, 1) if self.frames else 0.0,
+            "avg_fleet_size": round(self.units_seen / self.frames, 1) if self.frames else 0.0
+        }
+
+fleet_encoder = FleetDeltaEncoder(settings.DISPATCH_COORD_PRECISION, settings.DISPATCH_KEYFRAME_INTERVAL)
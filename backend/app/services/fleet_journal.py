@@ -0,0 +1,213 @@
+
+import glob
+import json
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+SNAPSHOTS_KEPT = 2 # The newest snapshot, and one to fall back on if it is unreadable
+
+class FleetJournal:
+    """
+    Append-only log of fleet events (units added, dispatched, arrived,
+    released) plus periodic snapshots of the whole fleet, so the dispatch
+    engine can restart where it stopped.
+
+    `append` only queues an event under a lock; a writer thread writes the
+    queue out every `flush_interval_s` in one write, so logging costs a
+    tick next to nothing. Each snapshot starts a new log segment, and
+    segments older than the retained snapshots are deleted, so recovery
+    (latest snapshot plus the log after it) stays bounded however long the
+    engine has run.
+
+    Files in `directory`: snapshot-<seq>.npz holds the fleet with every
+    event up to <seq> applied; events-<seq>.jsonl holds events from <seq> on.
+    """
+
+    def __init__(self, directory: str, flush_interval_s: float = 0.2):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.flush_interval = flush_interval_s
+        self.seq = 0 # Last sequence number handed out
+        self.tick = 0 # Stamped on events; kept current by the simulation
+        self._pending: List = []
+        self._lock = threading.Lock() # Guards seq and _pending
+        self._write_lock = threading.Lock() # Serialises writers (the thread and explicit flushes)
+        self._segment = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        # Stats
+        self.events_written = 0
+        self.bytes_written = 0
+        self.flushes = 0
+        self.snapshots = 0
+        self.last_flush_ms = 0.0
+        self.last_snapshot_ms = 0.0
+        self.recovery: Dict = {}
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="fleet journal", daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+        if self._segment is not None:
+            self._segment.close()
+            self._segment = None
+
+    def append(self, kind: str, **fields):
+        with self._lock:
+            self.seq += 1
+            self._pending.append({"seq": self.seq, "tick": self.tick, "type": kind, **fields})
+
+    def snapshot(self, arrays: Dict[str, np.ndarray], **meta):
+        """
+        Queues a snapshot of state reflecting every event appended so far.
+        Call it under the same lock the event producers hold, so no event
+        slips in between the state and its sequence number.
+        """
+        with self._lock:
+            self._pending.append((self.seq, arrays, meta))
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"❌ Fleet journal write failed: {e!r}")
+
+    def flush(self):
+        """Writes out everything queued so far."""
+        with self._write_lock:
+            with self._lock:
+                pending, self._pending = self._pending, []
+            if not pending:
+                return
+            started = time.perf_counter()
+            lines: List[str] = []
+            for item in pending:
+                if isinstance(item, dict):
+                    lines.append(json.dumps(item, separators=(",", ":")))
+                    continue
+                # A snapshot: everything before it belongs to the current segment
+                self._write_lines(lines)
+                lines = []
+                self._write_snapshot(*item)
+            self._write_lines(lines)
+            self.flushes += 1
+            self.last_flush_ms = (time.perf_counter() - started) * 1000
+
+    def _write_lines(self, lines: List[str]):
+        if not lines:
+            return
+        if self._segment is None:
+            first = json.loads(lines[0])["seq"]
+            self._segment = open(os.path.join(self.directory, f"events-{first:012d}.jsonl"), "a")
+        data = "\n".join(lines) + "\n"
+        self._segment.write(data)
+        self._segment.flush()
+        self.events_written += len(lines)
+        self.bytes_written += len(data)
+
+    def _write_snapshot(self, seq: int, arrays: Dict[str, np.ndarray], meta: Dict):
+        started = time.perf_counter()
+        if self._segment is not None:
+            self._segment.close()
+            self._segment = None # The next event opens events-<seq + 1>
+        path = os.path.join(self.directory, f"snapshot-{seq:012d}.npz")
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            np.savez(f, seq=np.int64(seq), meta=np.array(json.dumps(meta)), **arrays)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+        self.snapshots += 1
+        self.last_snapshot_ms = (time.perf_counter() - started) * 1000
+        self._prune()
+
+    def _prune(self):
+        """Deletes snapshots beyond the newest SNAPSHOTS_KEPT and log segments only they needed."""
+        snapshots = self._files("snapshot-", ".npz")
+        for _, path in snapshots[:-SNAPSHOTS_KEPT]:
+            os.remove(path)
+        oldest_kept = snapshots[-SNAPSHOTS_KEPT:][0][0]
+        segments = self._files("events-", ".jsonl")
+        # A segment ends where the next begins; drop it if all its events are in the oldest kept snapshot
+        for (_, path), (next_start, _) in zip(segments, segments[1:]):
+            if next_start <= oldest_kept + 1:
+                os.remove(path)
+
+    def _files(self, prefix: str, suffix: str) -> List[Tuple[int, str]]:
+        found = []
+        for path in glob.glob(os.path.join(self.directory, f"{prefix}*{suffix}")):
+            name = os.path.basename(path)[len(prefix):-len(suffix)]
+            if name.isdigit():
+                found.append((int(name), path))
+        return sorted(found)
+
+    def recover(self) -> Tuple[Optional[Dict], List[Dict]]:
+        """
+        The newest readable snapshot (its arrays plus "seq" and "meta"), or
+        None, and the logged events after it in order. A torn last line from
+        a crash mid-write is skipped. New events continue the sequence.
+        """
+        started = time.perf_counter()
+        state = None
+        for seq, path in reversed(self._files("snapshot-", ".npz")):
+            try:
+                with np.load(path) as data:
+                    state = {name: data[name] for name in data.files}
+                state["seq"] = int(state["seq"])
+                state["meta"] = json.loads(str(state["meta"]))
+                break
+            except Exception as e:
+                print(f"⚠️ Skipping unreadable fleet snapshot {path}: {e!r}")
+        after = state["seq"] if state else 0
+
+        events = []
+        skipped = 0
+        for _, path in self._files("events-", ".jsonl"):
+            with open(path) as f:
+                for line in f:
+                    try:
+                        event = json.loads(line)
+                    except ValueError:
+                        skipped += 1
+                        continue
+                    if event["seq"] > after:
+                        events.append(event)
+        events.sort(key=lambda e: e["seq"])
+
+        self.seq = max([after] + [e["seq"] for e in events])
+        self.recovery = {
+            "snapshot_seq": after if state else None,
+            "events_replayed": len(events),
+            "torn_lines": skipped,
+            "ms": round((time.perf_counter() - started) * 1000, 3)
+        }
+        return state, events
+
+    def get_stats(self) -> Dict:
+        return {
+            "directory": self.directory,
+            "seq": self.seq,
+            "pending": len(self._pending),
+            "events_written": self.events_written,
+            "bytes_written": self.bytes_written,
+            "flushes": self.flushes,
+            "last_flush_ms": round(self.last_flush_ms, 3),
+            "snapshots": self.snapshots,
+            "last_snapshot_ms": round(self.last_snapshot_ms, 3),
+            "recovery": self.recovery
+        }
@@ -0,0 +1,413 @@
+
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+# Status codes stored in FleetStore.status (mirroring AmbulanceStatus in types.ts)
+STATUSES = ("IDLE", "EN_ROUTE_TO_PICKUP", "ON_SCENE", "TRANSPORTING", "CLEANING", "OFF_DUTY")
+STATUS_CODES = {name: code for code, name in enumerate(STATUSES)}
+IDLE = STATUS_CODES["IDLE"]
+EN_ROUTE_TO_PICKUP = STATUS_CODES["EN_ROUTE_TO_PICKUP"]
+ON_SCENE = STATUS_CODES["ON_SCENE"]
+
+class FleetSnapshot:
+    """
+    Immutable copy of the fleet as of one simulation tick. Readers (the
+    broadcast loop, websocket handlers) take the current snapshot and read
+    it without locks while the simulation builds the next one.
+    """
+
+    __slots__ = ("tick", "sim_time", "ids", "call_signs", "types", "lat", "lng", "heading", "status", "_payload", "_built")
+
+    def __init__(self, tick: int, sim_time: float, ids: Tuple[str, ...], call_signs: Tuple[str, ...], types: Tuple[str, ...],
+                 lat: np.ndarray, lng: np.ndarray, heading: np.ndarray, status: np.ndarray):
+        self.tick = tick
+        self.sim_time = sim_time
+        self.ids = ids
+        self.call_signs = call_signs
+        self.types = types
+        for array in (lat, lng, heading, status):
+            array.flags.writeable = False
+        self.lat, self.lng, self.heading, self.status = lat, lng, heading, status
+        self._payload: Optional[List[Optional[Dict]]] = None # Per row, filled in as units are serialized
+        self._built: Optional[np.ndarray] = None # Rows of _payload filled in
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def serialize(self, rows: Optional[np.ndarray] = None) -> List[Dict]:
+        """
+        The fleet as the JSON dicts the dispatch websocket sends; built once
+        per snapshot and shared. With `rows`, just those units: each unit's
+        dict is still built at most once per snapshot, and only once some
+        caller asks for it, so scoped clients don't pay for the whole fleet.
+        """
+        if rows is None:
+            rows = np.arange(len(self))
+            if self._built is None:
+                self._payload = self._records(rows)
+                self._built = np.ones(len(self), dtype=bool)
+            else:
+                self._fill(rows)
+            return self._payload
+        self._fill(rows)
+        payload = self._payload
+        return [payload[r] for r in rows.tolist()]
+
+    def _fill(self, rows: np.ndarray):
+        if self._built is None:
+            self._payload = [None] * len(self)
+            self._built = np.zeros(len(self), dtype=bool)
+        missing = rows[~self._built[rows]]
+        if len(missing):
+            payload = self._payload
+            for r, record in zip(missing.tolist(), self._records(missing)):
+                payload[r] = record
+            self._built[missing] = True
+
+    def _records(self, rows: np.ndarray) -> List[Dict]:
+        ids, call_signs, types = self.ids, self.call_signs, self.types
+        return [
+            {
+                "id": ids[i],
+                "callSign": call_signs[i],
+                "type": types[i],
+                "status": STATUSES[s],
+                "location": {"lat": la, "lng": ln},
+                "heading": h
+            }
+            for i, la, ln, h, s in zip(rows.tolist(), self.lat[rows].tolist(), self.lng[rows].tolist(),
+                                       self.heading[rows].tolist(), self.status[rows].tolist())
+        ]
+
+class FleetStore:
+    """
+    Fleet state as parallel NumPy arrays (one row per ambulance) instead of
+    one Python object per unit, so a simulation tick is a few array
+    operations however many units there are.
+
+    Rows are append-only; `ids[row]` and `row_of[id]` map between the two.
+    Arrays grow by doubling, so always slice them to `size` (the properties
+    below do). Target coordinates are NaN when a unit has no target.
+
+    A unit can instead follow a road route (`set_route`): a polyline with the
+    time at which each waypoint is reached. All routes share flat waypoint
+    arrays whose keys (route base + seconds) increase across routes, so one
+    searchsorted places every routed unit on its current segment.
+
+    With a `journal` attached, every change that does not follow from the
+    simulation itself (units added, dispatched, released) and every arrival
+    is appended to it while the lock is held, so a snapshot taken under the
+    lock (`checkpoint`) and the events after it replay to the same fleet.
+    """
+
+    def __init__(self, capacity: int = 64):
+        self.size = 0
+        self.ids: List[str] = []
+        self.call_signs: List[str] = []
+        self.types: List[str] = []
+        self.row_of: Dict[str, int] = {}
+        self._lat = np.empty(capacity)
+        self._lng = np.empty(capacity)
+        self._target_lat = np.full(capacity, np.nan)
+        self._target_lng = np.full(capacity, np.nan)
+        self._heading = np.zeros(capacity)
+        self._status = np.zeros(capacity, dtype=np.int8)
+        self._type_code = np.zeros(capacity, dtype=np.int8)
+        self._route_start = np.full(capacity, -1, dtype=np.int64) # First waypoint of the row's route, -1 if none
+        self._route_end = np.zeros(capacity, dtype=np.int64) # One past its last waypoint
+        self._route_elapsed = np.zeros(capacity) # Seconds travelled along it
+        self._wp_lat = np.empty(0)
+        self._wp_lng = np.empty(0)
+        self._wp_key = np.empty(0)
+        self._wp_size = 0
+        self._wp_next_key = 0.0
+        self.type_names: List[str] = [] # type code -> name
+        self.lock = threading.Lock() # Held by writers; readers take array slices without it
+        self.journal = None # A FleetJournal, if changes are being logged
+        self._names: Optional[Tuple[Tuple[str, ...], ...]] = None
+
+    lat = property(lambda self: self._lat[:self.size])
+    lng = property(lambda self: self._lng[:self.size])
+    target_lat = property(lambda self: self._target_lat[:self.size])
+    target_lng = property(lambda self: self._target_lng[:self.size])
+    heading = property(lambda self: self._heading[:self.size])
+    status = property(lambda self: self._status[:self.size])
+    type_code = property(lambda self: self._type_code[:self.size])
+
+    def __len__(self) -> int:
+        return self.size
+
+    def _grow(self):
+        capacity = max(1, 2 * len(self._lat))
+        for name, fill in (("_lat", 0.0), ("_lng", 0.0), ("_target_lat", np.nan), ("_target_lng", np.nan),
+                           ("_heading", 0.0), ("_status", 0), ("_type_code", 0), ("_route_start", -1),
+                           ("_route_end", 0), ("_route_elapsed", 0.0)):
+            old = getattr(self, name)
+            new = np.full(capacity, fill, dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+    def type_code_of(self, type: str) -> int:
+        if type not in self.type_names:
+            self.type_names.append(type)
+        return self.type_names.index(type)
+
+    def add(self, id: str, call_sign: str, type: str, lat: float, lng: float, status: str = "IDLE") -> int:
+        with self.lock:
+            if id in self.row_of:
+                raise ValueError(f"Duplicate ambulance id: {id}")
+            if self.size == len(self._lat):
+                self._grow()
+            row = self.size
+            self._lat[row] = lat
+            self._lng[row] = lng
+            self._target_lat[row] = np.nan
+            self._target_lng[row] = np.nan
+            self._heading[row] = 0.0
+            self._status[row] = STATUS_CODES[status]
+            self._type_code[row] = self.type_code_of(type)
+            self._route_start[row] = -1
+            self.ids.append(id)
+            self.call_signs.append(call_sign)
+            self.types.append(type)
+            self.row_of[id] = row
+            self.size += 1
+            self._log("ADD", id=id, callSign=call_sign, unitType=type, lat=lat, lng=lng, status=status)
+            return row
+
+    def set_target(self, row: int, lat: float, lng: float, status: str = "EN_ROUTE_TO_PICKUP"):
+        with self.lock:
+            self._target_lat[row] = lat
+            self._target_lng[row] = lng
+            self._route_start[row] = -1
+            self._status[row] = STATUS_CODES[status]
+            self._log("TARGET", id=self.ids[row], lat=lat, lng=lng, status=status)
+
+    def set_route(self, row: int, route: Dict, status: str = "EN_ROUTE_TO_PICKUP"):
+        """Sends a unit along a road route: {"lat", "lng", "t"} waypoint arrays, `t` in seconds from the start."""
+        with self.lock:
+            self._start_route(row, route)
+            self._status[row] = STATUS_CODES[status]
+            self._log("TARGET", id=self.ids[row], lat=float(route["lat"][-1]), lng=float(route["lng"][-1]), status=status, road=True)
+
+    def claim(self, row: int, lat: float, lng: float, route: Optional[Dict] = None) -> bool:
+        """Sends an IDLE unit towards a pickup, along `route` if given; False if it is no longer IDLE."""
+        with self.lock:
+            if self._status[row] != IDLE:
+                return False
+            if route is not None:
+                self._start_route(row, route)
+            else:
+                self._target_lat[row] = lat
+                self._target_lng[row] = lng
+                self._route_start[row] = -1
+            self._status[row] = EN_ROUTE_TO_PICKUP
+            self._log("TARGET", id=self.ids[row], lat=lat, lng=lng, status="EN_ROUTE_TO_PICKUP", road=route is not None)
+            return True
+
+    def release(self, row: int):
+        """Back to IDLE where the unit is, dropping any target or route."""
+        with self.lock:
+            self._target_lat[row] = np.nan
+            self._target_lng[row] = np.nan
+            self._route_start[row] = -1
+            self._status[row] = IDLE
+            self._log("RELEASE", id=self.ids[row], lat=float(self._lat[row]), lng=float(self._lng[row]))
+
+    def _log(self, kind: str, **fields):
+        if self.journal is not None:
+            self.journal.append(kind, **fields)
+
+    def checkpoint(self, **meta):
+        """Hands the journal a snapshot of the fleet, consistent with the events it has been given."""
+        with self.lock:
+            n = self.size
+            arrays = {
+                "ids": np.array(self.ids, dtype=str),
+                "call_signs": np.array(self.call_signs, dtype=str),
+                "types": np.array(self.types, dtype=str)
+            }
+            for name in ("lat", "lng", "target_lat", "target_lng", "heading", "status"):
+                arrays[name] = getattr(self, "_" + name)[:n].copy()
+            self.journal.snapshot(arrays, **meta)
+
+    @classmethod
+    def from_state(cls, state: Dict) -> "FleetStore":
+        """A fleet from checkpoint arrays. Units en route head straight for their target until re-routed."""
+        ids = state["ids"].tolist()
+        n = len(ids)
+        fleet = cls(capacity=max(64, n))
+        fleet.ids = ids
+        fleet.call_signs = state["call_signs"].tolist()
+        fleet.types = state["types"].tolist()
+        fleet.row_of = {id: row for row, id in enumerate(ids)}
+        for name in ("lat", "lng", "target_lat", "target_lng", "heading", "status"):
+            getattr(fleet, "_" + name)[:n] = state[name]
+        fleet._type_code[:n] = [fleet.type_code_of(type) for type in fleet.types]
+        fleet.size = n
+        return fleet
+
+    def apply(self, event: Dict):
+        """Replays one journal event. Detach the journal first, or the replay is logged again."""
+        kind = event["type"]
+        if kind == "ADD":
+            self.add(event["id"], event["callSign"], event["unitType"], event["lat"], event["lng"], event["status"])
+            return
+        row = self.row_of[event["id"]]
+        if kind == "TARGET":
+            self.set_target(row, event["lat"], event["lng"], event["status"])
+        elif kind in ("ARRIVE", "RELEASE"):
+            with self.lock:
+                self._lat[row] = event["lat"]
+                self._lng[row] = event["lng"]
+            if kind == "ARRIVE":
+                self.set_target(row, np.nan, np.nan, "ON_SCENE")
+            else:
+                self.release(row)
+
+    def _start_route(self, row: int, route: Dict):
+        lats, lngs, t = route["lat"], route["lng"], np.asarray(route["t"], dtype=np.float64)
+        count = len(t)
+        if self._wp_size + count > len(self._wp_key):
+            self._compact_routes(count)
+        start = self._wp_size
+        end = start + count
+        self._wp_lat[start:end] = lats
+        self._wp_lng[start:end] = lngs
+        self._wp_key[start:end] = self._wp_next_key + t
+        self._wp_next_key = self._wp_key[end - 1] + 1.0
+        self._wp_size = end
+        self._route_start[row] = start
+        self._route_end[row] = end
+        self._route_elapsed[row] = 0.0
+        self._target_lat[row] = lats[-1]
+        self._target_lng[row] = lngs[-1]
+
+    def _compact_routes(self, extra: int):
+        """Drops the waypoints of finished routes, growing the arrays if the live ones still do not fit."""
+        rows = np.flatnonzero(self._route_start[:self.size] >= 0)
+        live = int((self._route_end[rows] - self._route_start[rows]).sum())
+        capacity = max(1024, 2 * (live + extra), len(self._wp_key))
+        wp_lat, wp_lng, wp_key = np.empty(capacity), np.empty(capacity), np.empty(capacity)
+        size = 0
+        next_key = 0.0
+        # Keep the routes in their current order so the keys stay sorted
+        for row in rows[np.argsort(self._route_start[rows])]:
+            start, end = self._route_start[row], self._route_end[row]
+            count = end - start
+            wp_lat[size:size + count] = self._wp_lat[start:end]
+            wp_lng[size:size + count] = self._wp_lng[start:end]
+            wp_key[size:size + count] = self._wp_key[start:end] - self._wp_key[start] + next_key
+            next_key = wp_key[size + count - 1] + 1.0
+            self._route_start[row], self._route_end[row] = size, size + count
+            size += count
+        self._wp_lat, self._wp_lng, self._wp_key = wp_lat, wp_lng, wp_key
+        self._wp_size = size
+        self._wp_next_key = next_key
+
+    def type_mask(self, types) -> np.ndarray:
+        """Lookup table over type codes: `type_mask(types)[type_code[rows]]` selects rows of those types."""
+        return np.array([name in types for name in self.type_names], dtype=bool)
+
+    def step(self, rng: np.random.Generator, speed: float, jitter: float, dt: float = 1.0) -> np.ndarray:
+        """
+        One simulation tick for every unit at once: units en route move
+        `speed` degrees towards their target (arriving, and going ON_SCENE,
+        when closer than that), units on a road route advance `dt` seconds
+        along it, and IDLE units jitter by up to `jitter`. Returns the rows
+        that arrived this tick.
+        """
+        with self.lock:
+            n = self.size
+            lat, lng, status = self._lat[:n], self._lng[:n], self._status[:n]
+
+            idle = np.flatnonzero(status == IDLE)
+            if len(idle):
+                lat[idle] += rng.uniform(-jitter, jitter, len(idle))
+                lng[idle] += rng.uniform(-jitter, jitter, len(idle))
+
+            en_route = (status == EN_ROUTE_TO_PICKUP) & ~np.isnan(self._target_lat[:n])
+            on_road = self._route_start[:n] >= 0
+            moving = np.flatnonzero(en_route & ~on_road)
+            routed = self._follow_routes(np.flatnonzero(en_route & on_road), dt)
+            target_lat, target_lng = self._target_lat[moving], self._target_lng[moving]
+            dy = target_lat - lat[moving]
+            dx = target_lng - lng[moving]
+            distance = np.hypot(dx, dy)
+            arrived = distance < speed
+            ratio = speed / np.maximum(distance, speed)
+            lat[moving] = np.where(arrived, target_lat, lat[moving] + dy * ratio)
+            lng[moving] = np.where(arrived, target_lng, lng[moving] + dx * ratio)
+
+            still_moving = moving[~arrived]
+            self._heading[still_moving] = np.degrees(np.arctan2(dx[~arrived], dy[~arrived]))
+
+            done = moving[arrived]
+            status[done] = ON_SCENE
+            self._target_lat[done] = np.nan
+            self._target_lng[done] = np.nan
+            done = np.concatenate((routed, done))
+            if self.journal is not None:
+                for row in done.tolist():
+                    self._log("ARRIVE", id=self.ids[row], lat=float(lat[row]), lng=float(lng[row]))
+            return done
+
+    def _follow_routes(self, rows: np.ndarray, dt: float) -> np.ndarray:
+        """Advances routed units `dt` seconds along their routes; returns the rows that reached the end."""
+        if not len(rows):
+            return rows
+        start, end = self._route_start[rows], self._route_end[rows]
+        elapsed = self._route_elapsed[rows] + dt
+        self._route_elapsed[rows] = elapsed
+        keys = self._wp_key[:self._wp_size]
+        query = keys[start] + elapsed
+        # The segment [i - 1, i] each unit is on, kept inside its own route
+        i = np.clip(np.searchsorted(keys, query, side="right"), start + 1, end - 1)
+        span = keys[i] - keys[i - 1]
+        fraction = np.clip((query - keys[i - 1]) / np.where(span > 0, span, 1.0), 0.0, 1.0)
+        dy = self._wp_lat[i] - self._wp_lat[i - 1]
+        dx = self._wp_lng[i] - self._wp_lng[i - 1]
+        self._lat[rows] = self._wp_lat[i - 1] + dy * fraction
+        self._lng[rows] = self._wp_lng[i - 1] + dx * fraction
+        turning = (dx != 0) | (dy != 0)
+        self._heading[rows[turning]] = np.degrees(np.arctan2(dx[turning], dy[turning]))
+
+        done = rows[query >= keys[end - 1]]
+        self._status[done] = ON_SCENE
+        self._target_lat[done] = np.nan
+        self._target_lng[done] = np.nan
+        self._route_start[done] = -1
+        return done
+
+    def snapshot(self, tick: int, sim_time: float) -> FleetSnapshot:
+        with self.lock:
+            n = self.size
+            if self._names is None or len(self._names[0]) != n:
+                # Rows are append-only, so the name tuples only change when the fleet grows
+                self._names = (tuple(self.ids), tuple(self.call_signs), tuple(self.types))
+            return FleetSnapshot(tick, sim_time, *self._names, self._lat[:n].copy(), self._lng[:n].copy(),
+                                 self._heading[:n].copy(), self._status[:n].copy())
+
+    def serialize(self, rows: Optional[np.ndarray] = None) -> List[Dict]:
+        """Rows (all by default) as the JSON dicts the dispatch websocket sends."""
+        with self.lock:
+            n = self.size
+            rows = np.arange(n) if rows is None else rows
+            lats = self._lat[rows].tolist()
+            lngs = self._lng[rows].tolist()
+            headings = self._heading[rows].tolist()
+            statuses = self._status[rows].tolist()
+            indices = rows.tolist()
+        return [
+            {
+                "id": self.ids[i],
+                "callSign": self.call_signs[i],
+                "type": self.types[i],
+                "status": STATUSES[s],
+                "location": {"lat": la, "lng": ln},
+                "heading": h
+            }
+            for i, la, ln, h, s in zip(indices, lats, lngs, headings, statuses)
+        ]
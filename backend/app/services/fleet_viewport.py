@@ -0,0 +1,117 @@
+
+from typing import Dict, FrozenSet, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from app.core.config import settings
+from app.services.fleet_store import STATUS_CODES, FleetSnapshot
+from app.services.spatial_index import GridIndex
+
+class Subscription(NamedTuple):
+    """What a dispatch websocket client wants to see; None fields don't filter."""
+    bbox: Optional[Tuple[float, float, float, float]] # lat_min, lng_min, lat_max, lng_max
+    types: Optional[FrozenSet[str]]
+    statuses: Optional[FrozenSet[int]] # Status codes
+
+def parse_subscription(data: Dict) -> Optional[Subscription]:
+    """
+    A Subscription from a SUBSCRIBE message's "bbox" ([south, west, north,
+    east]), "types" and "statuses" fields, or None when nothing is filtered
+    (back to the whole fleet). Raises ValueError on malformed input, and
+    TypeError when "types" or "statuses" isn't a list.
+    """
+    bbox = data.get("bbox")
+    if bbox is not None:
+        if not isinstance(bbox, (list, tuple)) or len(bbox) != 4:
+            raise ValueError("bbox must be [south, west, north, east]")
+        lat_min, lng_min, lat_max, lng_max = (float(v) for v in bbox)
+        if not (-90 <= lat_min <= lat_max <= 90 and -180 <= lng_min <= lng_max <= 180):
+            raise ValueError("bbox must be [south, west, north, east] with south <= north and west <= east")
+        bbox = (lat_min, lng_min, lat_max, lng_max)
+
+    types = data.get("types")
+    if types is not None:
+        if not isinstance(types, (list, tuple)):
+            raise TypeError("types must be a list")
+        types = frozenset(str(t) for t in types)
+
+    statuses = data.get("statuses")
+    if statuses is not None:
+        if not isinstance(statuses, (list, tuple)):
+            raise TypeError("statuses must be a list")
+        unknown = [s for s in statuses if s not in STATUS_CODES]
+        if unknown:
+            raise ValueError(f"Unknown statuses: {unknown}")
+        statuses = frozenset(STATUS_CODES[s] for s in statuses)
+
+    if bbox is None and types is None and statuses is None:
+        return None
+    return Subscription(bbox, types, statuses)
+
+class FleetViewport:
+    """
+    Fleet updates scoped to a client's subscription. Each new snapshot is
+    bucketed into a GridIndex once; a subscription then reads only the cells
+    its box overlaps and filters those units by type and status, so a tick
+    costs about the number of visible units per distinct subscription, not
+    clients times fleet. Clients with the same subscription share one frame.
+
+    Frames are keyframes of the region ({"keyframe": true, "scoped": true}):
+    every matching unit, as the snapshot serializes it, so units that leave
+    the region simply stop being listed. Only units some subscription shows
+    are serialized, each once per snapshot.
+    """
+
+    def __init__(self, cell_km: float = 2.0):
+        self.index = GridIndex(cell_km)
+        self._snapshot: Optional[FleetSnapshot] = None
+        self._frames: Dict[Subscription, Dict] = {}
+
+        # Stats
+        self.rebuilds = 0
+        self.frames_built = 0
+        self.units_sent = 0
+
+    def _prepare(self, snapshot: FleetSnapshot):
+        if snapshot is self._snapshot:
+            return
+        self.index.rebuild(np.arange(len(snapshot)), snapshot.lat, snapshot.lng)
+        self._snapshot = snapshot
+        self._frames = {}
+        self.rebuilds += 1
+
+    def rows(self, snapshot: FleetSnapshot, subscription: Subscription) -> np.ndarray:
+        """Fleet rows matching `subscription` in `snapshot`."""
+        self._prepare(snapshot)
+        if subscription.bbox is not None:
+            rows = self.index.within(*subscription.bbox)
+        else:
+            rows = np.arange(len(snapshot))
+        if subscription.statuses is not None and len(rows):
+            rows = rows[np.isin(snapshot.status[rows], list(subscription.statuses))]
+        if subscription.types is not None and len(rows):
+            types = snapshot.types
+            rows = np.array([r for r in rows.tolist() if types[r] in subscription.types], dtype=np.int64)
+        return rows
+
+    def message(self, snapshot: FleetSnapshot, subscription: Subscription) -> Dict:
+        """The FLEET_UPDATE for `subscription`, built once per snapshot."""
+        self._prepare(snapshot)
+        frame = self._frames.get(subscription)
+        if frame is None:
+            data = snapshot.serialize(self.rows(snapshot, subscription))
+            frame = {"type": "FLEET_UPDATE", "keyframe": True, "scoped": True, "tick": snapshot.tick, "data": data}
+            self._frames[subscription] = frame
+            self.frames_built += 1
+            self.units_sent += len(data)
+        return frame
+
+    def get_stats(self) -> Dict:
+        return {
+            "rebuilds": self.rebuilds,
+            "frames_built": self.frames_built,
+            "avg_units_per_frame": round(self.units_sent / self.frames_built, 1) if self.frames_built else 0.0,
+            "grid": self.index.get_stats()
+        }
+
+fleet_viewport = FleetViewport(settings.DISPATCH_VIEWPORT_CELL_KM)
@@ -0,0 +1,94 @@
+
+import os
+import tempfile
+from typing import Optional
+
+import torch
+import torch.nn as nn
+
+BACKENDS = ("eager", "int8", "torchscript", "onnx")
+
+class OnnxRuntimeModel:
+    """Wraps an onnxruntime session so it can be called like the torch model."""
+
+    def __init__(self, onnx_path: str, num_threads: int = 0):
+        import onnxruntime as ort # Optional dependency, only needed for this backend
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads > 0:
+            options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(onnx_path, options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def __call__(self, x: torch.Tensor) -> torch.Tensor:
+        outputs = self.session.run(None, {self.input_name: x.detach().cpu().numpy()})
+        return torch.from_numpy(outputs[0])
+
+    def eval(self):
+        return self
+
+def example_input(batch_size: int = 1, image_size: int = 224) -> torch.Tensor:
+    return torch.randn(batch_size, 3, image_size, image_size)
+
+def quantize_int8(model: nn.Module) -> nn.Module:
+    """
+    Dynamic int8 quantization of the Linear layers (the ViT MLP blocks and
+    the classifier head). Attention projections stay fp32; torch excludes them.
+    """
+    return torch.ao.quantization.quantize_dynamic(model.eval(), {nn.Linear}, dtype=torch.qint8)
+
+def export_torchscript(model: nn.Module, path: Optional[str] = None) -> torch.jit.ScriptModule:
+    with torch.no_grad():
+        traced = torch.jit.trace(model.eval(), example_input(), check_trace=False)
+        traced = torch.jit.optimize_for_inference(traced)
+    if path:
+        torch.jit.save(traced, path)
+    return traced
+
+def export_onnx(model: nn.Module, path: str) -> str:
+    # Exported with grad enabled on purpose: under no_grad MultiheadAttention
+    # takes its fused fast path, which has no ONNX symbolic
+    torch.onnx.export(
+        model.eval(),
+        (example_input(),),
+        path,
+        input_names=["input"],
+        output_names=["logits"],
+        dynamic_axes={"input": {0: "batch"}, "logits": {0: "batch"}},
+        opset_version=17,
+        dynamo=False
+    )
+    return path
+
+def build_backend(model: nn.Module, backend: str, artifact_path: Optional[str] = None, device=None, num_threads: int = 0):
+    """
+    Turns an eager fp32 BrainTumorViT (weights already loaded) into a callable
+    for the requested backend. For "torchscript" and "onnx" an artifact
+    previously written by export_model.py is used when `artifact_path`
+    exists; otherwise the graph is exported on the spot.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown inference backend: {backend}")
+    device = device or torch.device('cpu')
+
+    if backend == "eager":
+        return model.to(device).eval()
+
+    if device.type != 'cpu':
+        raise ValueError(f"The {backend} backend only runs on CPU")
+    model = model.to(device).eval()
+
+    if backend == "int8":
+        return quantize_int8(model)
+
+    if backend == "torchscript":
+        if artifact_path and os.path.exists(artifact_path):
+            return torch.jit.load(artifact_path, map_location=device).eval()
+        return export_torchscript(model, artifact_path or None)
+
+    # onnx
+    if not (artifact_path and os.path.exists(artifact_path)):
+        artifact_path = artifact_path or os.path.join(tempfile.mkdtemp(prefix="neurovision-"), "model.onnx")
+        export_onnx(model, artifact_path)
+    return OnnxRuntimeModel(artifact_path, num_threads=num_threads)
@@ -0,0 +1,129 @@
+
+import asyncio
+import multiprocessing
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, List, Optional, Sequence, Union
+
+import torch
+
+from app.core.config import settings
+from app.services.inference_service import InferenceService
+
+class InferenceQueueFull(Exception):
+    """Raised when more requests are waiting for the model than the queue allows."""
+    pass
+
+def _configure_torch_threads(num_threads: int):
+    if num_threads > 0:
+        torch.set_num_threads(num_threads)
+
+def _init_process_worker(num_threads: int):
+    # Each worker process owns its own copy of the model
+    _configure_torch_threads(num_threads)
+    InferenceService.get_instance().load_model()
+
+def predict_batch_job(images: List[bytes], version: Optional[str] = None, explain: bool = False) -> List[Union[Dict, Exception]]:
+    """
+    Module-level entry point so the job can be pickled into a process pool
+    without dragging the service (and its model) along.
+    """
+    return InferenceService.get_instance().predict_batch(images, version=version, explain=explain)
+
+def warm_up_job(batch_sizes: Sequence[int]) -> bool:
+    return InferenceService.get_instance().warm_up(batch_sizes)
+
+class InferenceExecutor:
+    """
+    Runs model work on a dedicated thread or process pool so the uvicorn
+    event loop never blocks on a forward pass.
+    """
+
+    def __init__(self, mode: str = "thread", max_workers: int = 1, torch_threads: int = 0):
+        if mode not in ("thread", "process"):
+            raise ValueError(f"Unknown inference executor mode: {mode}")
+        self.mode = mode
+        self.max_workers = max(1, max_workers)
+        self.torch_threads = torch_threads
+        self._pool: Optional[Executor] = None
+        self.state = "cold" # cold -> warming_up -> ready, or failed/unavailable
+        self.warm_up_s: Optional[float] = None
+
+        # Stats
+        self.jobs_submitted = 0
+        self.jobs_failed = 0
+        self.jobs_running = 0
+
+    def _get_pool(self) -> Executor:
+        if self._pool is None:
+            if self.mode == "process":
+                # spawn, not fork: forking after torch has started its thread pool can deadlock
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_process_worker,
+                    initargs=(self.torch_threads,)
+                )
+            else:
+                _configure_torch_threads(self.torch_threads)
+                self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="inference")
+        return self._pool
+
+    async def run(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        self.jobs_submitted += 1
+        self.jobs_running += 1
+        try:
+            return await loop.run_in_executor(self._get_pool(), fn, *args)
+        except Exception:
+            self.jobs_failed += 1
+            raise
+        finally:
+            self.jobs_running -= 1
+
+    async def warm_up(self, batch_sizes: Sequence[int] = (1,)) -> bool:
+        """
+        Loads and warms the model wherever inference will run: once for the
+        shared thread-pool model, once per worker for a process pool.
+        """
+        self.state = "warming_up"
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        copies = self.max_workers if self.mode == "process" else 1
+        try:
+            # Submitted together so a process pool spawns every worker now
+            results = await asyncio.gather(*(self.run(warm_up_job, tuple(batch_sizes)) for _ in range(copies)))
+        except Exception as e:
+            self.state = "failed"
+            print(f"❌ Inference warm-up failed: {e!r}")
+            return False
+
+        self.warm_up_s = round(loop.time() - started, 3)
+        self.state = "ready" if all(results) else "unavailable"
+        return self.state == "ready"
+
+    @property
+    def ready(self) -> bool:
+        return self.state == "ready"
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def get_stats(self) -> Dict:
+        return {
+            "mode": self.mode,
+            "state": self.state,
+            "warm_up_s": self.warm_up_s,
+            "max_workers": self.max_workers,
+            "torch_threads": torch.get_num_threads() if self.mode == "thread" else self.torch_threads,
+            "jobs_submitted": self.jobs_submitted,
+            "jobs_running": self.jobs_running,
+            "jobs_failed": self.jobs_failed
+        }
+
+inference_executor = InferenceExecutor(
+    mode=settings.INFERENCE_EXECUTOR_MODE,
+    max_workers=settings.INFERENCE_WORKERS,
+    torch_threads=settings.INFERENCE_TORCH_THREADS
+)
@@ -1,99 +1,247 @@
 
 import torch
-import torchvision.transforms as transforms
-from PIL import Image
 import os
-import sys
+import threading
+from typing import Dict, List, Optional, Sequence, Union
 from app.core.config import settings
+from app.ml.attention_rollout import AttentionRollout, heatmap_payload
+from app.ml.early_exit import EarlyExitViT, exit_heads_path
+from app.ml.model import CLASSES, BrainTumorViT, build_model_from_state, format_prediction, load_state_dict_file
+from app.services.inference_backends import build_backend
+from app.services.model_registry import ModelHandle, ModelRegistry
+from app.services.preprocessing import ImagePreprocessor
 
-# Original Model Classes (Preserved)
-import torch.nn as nn
-import torchvision
-
-class BrainTumorViT(nn.Module):
-    def __init__(self, num_classes=4):
-        super(BrainTumorViT, self).__init__()
-        self.vit = torchvision.models.vit_b_16(pretrained=False)
-        self.vit.heads = nn.Sequential(
-            nn.Linear(self.vit.heads.head.in_features, 256),
-            nn.ReLU(),
-            nn.Dropout(0.5),
-            nn.Linear(256, num_classes)
-        )
-        
-    def forward(self, x):
-        return self.vit(x)
+# BrainTumorViT is re-exported: this module defined it before app.ml.model did
+__all__ = ["BrainTumorViT", "EARLY_EXIT_BACKENDS", "EXPLAIN_BACKENDS", "InferenceService", "checkpoint_version",
+           "inference_service", "uses_early_exit"]
+
+EARLY_EXIT_BACKENDS = ("eager", "int8")
+EXPLAIN_BACKENDS = ("eager", "int8") # Attention rollout hooks into torch modules
+
+def uses_early_exit(path: str, backend: str = "eager") -> bool:
+    """Whether INFERENCE_EARLY_EXIT applies to this checkpoint: it needs distilled heads and a torch backend."""
+    return settings.INFERENCE_EARLY_EXIT and backend in EARLY_EXIT_BACKENDS and os.path.exists(exit_heads_path(path))
+
+def checkpoint_version(path: str, backend: str = "eager") -> str:
+    """Default version id for a checkpoint: its name, size and modification time."""
+    stat = os.stat(path)
+    version = f"{os.path.basename(path)}:{stat.st_size}:{int(stat.st_mtime)}"
+    if backend != "eager":
+        # Quantized/exported graphs produce slightly different probabilities
+        version += f"+{backend}"
+    if uses_early_exit(path, backend):
+        version += "+early_exit"
+    return version
 
 class InferenceService:
     _instance = None
-    
+
     def __init__(self):
         self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-        self.model = None
-        self.classes = ['Glioma', 'Meningioma', 'No Tumor', 'Pituitary']
-        self.transform = transforms.Compose([
-            transforms.Resize((224, 224)),
-            transforms.ToTensor(),
-            transforms.Normalize(mean=[0.485, 0.456, 0.406], 
-                               std=[0.229, 0.224, 0.225])
-        ])
-        
+        self.backend = settings.INFERENCE_BACKEND
+        if self.backend != "eager":
+            # Quantized and exported backends are CPU-only
+            self.device = torch.device('cpu')
+        self.registry = ModelRegistry(max_versions=settings.MODEL_REGISTRY_MAX_VERSIONS)
+        self._default_version = None
+        self._load_lock = threading.Lock()
+        self.status = "not_loaded" # not_loaded -> loading -> loaded -> warming_up -> ready, or failed/unavailable
+        self.classes = CLASSES
+        self.preprocessor = ImagePreprocessor(image_size=224, jpeg_draft=settings.PREPROCESS_JPEG_DRAFT)
+
     @classmethod
     def get_instance(cls):
         if cls._instance is None:
             cls._instance = InferenceService()
         return cls._instance
-        
-    def load_model(self):
-        if self.model is not None:
-            return
 
-        if not os.path.exists(settings.MODEL_PATH):
-             # Fallback logic or error logging if model missing
-             print(f"Server Warning: Model not found at {settings.MODEL_PATH}")
-             return
+    @property
+    def model(self):
+        """The active model, or None before one is loaded."""
+        version = self.registry.active_version
+        if version is None:
+            return None
+        return self.registry.get(version).model
 
-        try:
-            checkpoint = torch.load(settings.MODEL_PATH, map_location=self.device)
-            self.model = BrainTumorViT(num_classes=4) # Assuming 4 classes always
-            
-            # Handle different checkpoint formats if necessary
-            if 'model_state_dict' in checkpoint:
-                self.model.load_state_dict(checkpoint['model_state_dict'])
+    @property
+    def model_version(self) -> str:
+        """
+        Identifies the weights behind a prediction: the active registry
+        version, or before anything is loaded, the version MODEL_PATH will
+        get (settings.MODEL_VERSION, else the checkpoint's name, size and
+        modification time).
+        """
+        active = self.registry.active_version
+        if active is not None:
+            return active
+        if self._default_version is None:
+            if settings.MODEL_VERSION:
+                self._default_version = settings.MODEL_VERSION
+            elif os.path.exists(settings.MODEL_PATH):
+                self._default_version = checkpoint_version(settings.MODEL_PATH, self.backend)
             else:
-                self.model.load_state_dict(checkpoint)
-                
-            self.model.to(self.device)
-            self.model.eval()
-            print(f"✅ Model loaded on {self.device}")
-        except Exception as e:
-            print(f"❌ Failed to load model: {e}")
-            raise e
+                return "unavailable"
+        return self._default_version
+
+    def load_model(self):
+        """Loads MODEL_PATH as the initial active version, if nothing is loaded yet."""
+        with self._load_lock:
+            if self.registry.active_version is not None:
+                return
+
+            if not os.path.exists(settings.MODEL_PATH):
+                 # Fallback logic or error logging if model missing
+                 print(f"Server Warning: Model not found at {settings.MODEL_PATH}")
+                 self.status = "unavailable"
+                 return
+
+            self.status = "loading"
+            try:
+                self.load_checkpoint(settings.MODEL_PATH, version=self.model_version)
+                self.status = "loaded"
+                print(f"✅ Model loaded on {self.device} ({self.backend} backend)")
+            except Exception as e:
+                self.status = "failed"
+                print(f"❌ Failed to load model: {e}")
+                raise e
+
+    def load_checkpoint(
+        self,
+        path: str,
+        version: Optional[str] = None,
+        activate: bool = True,
+        warm_up_batch_sizes: Sequence[int] = ()
+    ) -> ModelHandle:
+        """
+        Builds a checkpoint with the configured backend and adds it to the
+        registry, warming it up first when batch sizes are given. Blocking;
+        the current active version keeps serving until this one is ready.
+        """
+        version = version or checkpoint_version(path, self.backend)
+        # An exported graph belongs to the MODEL_PATH weights; other checkpoints are exported afresh
+        artifact_path = settings.INFERENCE_BACKEND_PATH if os.path.abspath(path) == os.path.abspath(settings.MODEL_PATH) else None
+
+        def build():
+            state_dict = load_state_dict_file(path, use_mmap=settings.MODEL_LOAD_MMAP)
+            model = build_backend(
+                build_model_from_state(state_dict),
+                self.backend,
+                artifact_path=artifact_path,
+                device=self.device,
+                num_threads=settings.INFERENCE_TORCH_THREADS
+            )
+            if uses_early_exit(path, self.backend):
+                model = EarlyExitViT.from_file(model, exit_heads_path(path), settings.EARLY_EXIT_THRESHOLD).to(self.device).eval()
+                print(f"⏩ Early exit after layers {model.exit_layers} at confidence {model.threshold}")
+            elif settings.INFERENCE_EARLY_EXIT:
+                print(f"⚠️ Early exit needs {os.path.basename(exit_heads_path(path))} and an eager/int8 backend; serving the full model")
+            return model
 
-    def predict(self, image_bytes: bytes):
+        warm_up = (lambda model: self._forward_zeros(model, warm_up_batch_sizes)) if warm_up_batch_sizes else None
+        return self.registry.load(version, build, warm_up=warm_up, path=path, backend=self.backend, activate=activate)
+
+    def warm_up(self, batch_sizes: Sequence[int] = (1,)) -> bool:
+        """
+        Loads the model and runs a forward pass at each batch size so the first
+        real request doesn't pay for lazy allocation and kernel selection.
+        Returns whether the model is ready to serve.
+        """
+        self.load_model()
         if self.model is None:
-            self.load_model()
-            
+            return False
+
+        self.status = "warming_up"
         try:
-            image = Image.open(io.BytesIO(image_bytes)).convert('RGB')
-            input_tensor = self.transform(image).unsqueeze(0).to(self.device)
-            
-            with torch.no_grad():
-                outputs = self.model(input_tensor)
-                probabilities = torch.softmax(outputs, dim=1)
-                confidence, prediction = torch.max(probabilities, 1)
-                
-            return {
-                'prediction': self.classes[prediction.item()],
-                'confidence': float(confidence.item()),
-                'probabilities': {
-                    cls: float(prob.item()) for cls, prob in zip(self.classes, probabilities[0])
-                }
-            }
+            with self.registry.acquire() as handle:
+                self._forward_zeros(handle.model, batch_sizes)
         except Exception as e:
-            print(f"Inference Error: {e}")
+            self.status = "failed"
+            print(f"❌ Model warm-up failed: {e}")
             raise e
+        self.status = "ready"
+        print(f"🔥 Model warmed up (batch sizes {list(batch_sizes)})")
+        return True
+
+    def early_exit_stats(self) -> Optional[Dict]:
+        """Exit rates and latency of the active model, if it is an early-exit cascade."""
+        model = self.model
+        return model.get_stats() if isinstance(model, EarlyExitViT) else None
+
+    def _forward_zeros(self, model, batch_sizes: Sequence[int]):
+        with torch.no_grad():
+            for batch_size in batch_sizes:
+                model(torch.zeros(batch_size, 3, 224, 224, device=self.device))
+
+    @property
+    def supports_explain(self) -> bool:
+        return self.backend in EXPLAIN_BACKENDS
+
+    def predict(self, image_bytes: bytes, version: Optional[str] = None, explain: bool = False):
+        result = self.predict_batch([image_bytes], version=version, explain=explain)[0]
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def predict_batch(self, images: List[bytes], version: Optional[str] = None, explain: bool = False) -> List[Union[Dict, Exception]]:
+        """
+        Runs several uploads through the model as a single tensor batch, on
+        `version` if given, else the active version. Images that fail to
+        decode yield their exception in place of a result, so one bad upload
+        does not fail the rest of its batch. Raises UnknownModelVersion for
+        a version that isn't loaded.
+
+        With `explain`, each result also carries an attention-rollout
+        `heatmap` computed during the same forward pass.
+        """
+        if explain and not self.supports_explain:
+            raise ValueError(f"Heatmaps need the eager or int8 backend, not {self.backend}")
+        if self.registry.active_version is None:
+            self.load_model()
+            if self.registry.active_version is None:
+                raise RuntimeError("Model is not available")
+
+        results: List[Union[Dict, Exception]] = [None] * len(images)
+        loaded = []
+        positions = []
+        for i, image_bytes in enumerate(images):
+            try:
+                loaded.append(self.preprocessor.load(image_bytes))
+                positions.append(i)
+            except Exception as e:
+                print(f"Inference Error: {e}")
+                results[i] = e
+
+        if not loaded:
+            return results
+
+        # Held until the forward pass is done, so a swap mid-batch doesn't affect it
+        with self.registry.acquire(version) as handle:
+            handle.requests += len(loaded)
+            try:
+                input_tensor = self.preprocessor.to_batch(loaded).to(self.device)
+
+                with torch.no_grad():
+                    if explain:
+                        # Rollout needs every layer, so an early-exit cascade explains with its full model
+                        model = handle.model.model if isinstance(handle.model, EarlyExitViT) else handle.model
+                        with AttentionRollout(model.vit) as rollout:
+                            outputs = model(input_tensor)
+                        heatmaps = rollout.heatmaps().cpu()
+                    else:
+                        outputs = handle.model(input_tensor)
+                    probabilities = torch.softmax(outputs, dim=1)
+            except Exception as e:
+                print(f"Inference Error: {e}")
+                raise e
+
+        for j, (i, probs) in enumerate(zip(positions, probabilities.cpu())):
+            results[i] = self._format_result(probs)
+            results[i]['model_version'] = handle.version
+            if explain:
+                results[i]['heatmap'] = heatmap_payload(heatmaps[j])
+        return results
 
+    def _format_result(self, probs: torch.Tensor) -> Dict:
+        return format_prediction(probs, self.classes)
 
-import io
 inference_service = InferenceService.get_instance()
@@ -0,0 +1,194 @@
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+class UnknownModelVersion(KeyError):
+    """Raised when a request names a model version that isn't loaded and ready."""
+
+    def __str__(self):
+        return str(self.args[0]) if self.args else "Unknown model version"
+
+class ModelHandle:
+    """One loaded model version and the requests currently running on it."""
+
+    def __init__(self, version: str, path: Optional[str] = None, backend: str = "eager"):
+        self.version = version
+        self.path = path
+        self.backend = backend
+        self.model: Any = None
+        self.state = "loading" # loading -> warming_up -> ready, or failed
+        self.error: Optional[str] = None
+        self.loaded_at: Optional[float] = None
+        self.load_s: Optional[float] = None
+        self.in_flight = 0
+        self.requests = 0
+
+    def to_dict(self) -> Dict:
+        return {
+            "version": self.version,
+            "path": os.path.basename(self.path) if self.path else None,
+            "backend": self.backend,
+            "state": self.state,
+            "error": self.error,
+            "loaded_at": self.loaded_at,
+            "load_s": self.load_s,
+            "in_flight": self.in_flight,
+            "requests": self.requests
+        }
+
+class ModelRegistry:
+    """
+    Keeps the loaded model versions and which one serves unpinned requests.
+
+    A new version is built and warmed up next to the active one, then made
+    active by swapping a single reference under the lock. Requests hold their
+    handle for the whole forward pass (see `acquire`), so ones already running
+    on the previous version finish on it even after a swap or unload; its
+    weights are freed once the last of them lets go.
+
+    At most `max_versions` ready versions are kept; loading another evicts the
+    least recently loaded version that isn't active.
+    """
+
+    def __init__(self, max_versions: int = 2):
+        self.max_versions = max(1, max_versions)
+        self._handles: "OrderedDict[str, ModelHandle]" = OrderedDict()
+        self._active: Optional[str] = None
+        self._lock = threading.Lock()
+
+        # Stats
+        self.swaps = 0
+        self.evictions = 0
+
+    @property
+    def active_version(self) -> Optional[str]:
+        return self._active
+
+    def get(self, version: Optional[str] = None) -> ModelHandle:
+        """The ready handle for `version`, or for the active version when None."""
+        with self._lock:
+            return self._get_ready(version)
+
+    def _get_ready(self, version: Optional[str]) -> ModelHandle:
+        if version is None:
+            version = self._active
+            if version is None:
+                raise UnknownModelVersion("No model version is active")
+        handle = self._handles.get(version)
+        if handle is None or handle.state != "ready":
+            raise UnknownModelVersion(f"Model version '{version}' is not loaded")
+        return handle
+
+    @contextmanager
+    def acquire(self, version: Optional[str] = None) -> Iterator[ModelHandle]:
+        """Pins a version (the active one by default) for the duration of a batch."""
+        with self._lock:
+            handle = self._get_ready(version)
+            handle.in_flight += 1
+        try:
+            yield handle
+        finally:
+            with self._lock:
+                handle.in_flight -= 1
+                if handle.in_flight == 0 and handle.version in self._handles:
+                    self._evict()
+
+    def load(
+        self,
+        version: str,
+        loader: Callable[[], Any],
+        warm_up: Optional[Callable[[Any], None]] = None,
+        path: Optional[str] = None,
+        backend: str = "eager",
+        activate: bool = True
+    ) -> ModelHandle:
+        """
+        Builds a version with `loader`, runs `warm_up` on it and registers it,
+        activating it if asked. Blocking; call it off the event loop.
+        """
+        with self._lock:
+            existing = self._handles.get(version)
+            if existing is not None and existing.state != "failed":
+                raise ValueError(f"Model version '{version}' is already {existing.state}")
+            handle = ModelHandle(version, path=path, backend=backend)
+            self._handles[version] = handle
+
+        started = time.perf_counter()
+        try:
+            model = loader()
+            if warm_up is not None:
+                handle.state = "warming_up"
+                warm_up(model)
+        except Exception as e:
+            handle.state = "failed"
+            handle.error = str(e)
+            raise
+
+        with self._lock:
+            handle.model = model
+            handle.state = "ready"
+            handle.loaded_at = time.time()
+            handle.load_s = round(time.perf_counter() - started, 3)
+            if activate or self._active is None:
+                self._set_active(version)
+            self._evict(keep=version)
+        return handle
+
+    def register(self, version: str, model: Any, path: Optional[str] = None, backend: str = "eager", activate: bool = True) -> ModelHandle:
+        """Adds an already-built model (benchmarks, tests), replacing any same-named version."""
+        with self._lock:
+            self._handles.pop(version, None)
+        return self.load(version, lambda: model, path=path, backend=backend, activate=activate)
+
+    def activate(self, version: str) -> ModelHandle:
+        with self._lock:
+            handle = self._get_ready(version)
+            self._set_active(version)
+            return handle
+
+    def unload(self, version: str):
+        """Forgets a version. Requests already running on it still complete."""
+        with self._lock:
+            if version not in self._handles:
+                raise UnknownModelVersion(f"Model version '{version}' is not loaded")
+            if version == self._active:
+                raise ValueError("Cannot unload the active model version; activate another one first")
+            handle = self._handles.pop(version)
+            handle.model = None
+
+    def _set_active(self, version: str):
+        if version != self._active:
+            if self._active is not None:
+                self.swaps += 1
+            self._active = version
+            print(f"🔁 Active model version: {version}")
+
+    def _evict(self, keep: Optional[str] = None):
+        """
+        Drops the oldest ready versions past max_versions. The active version,
+        `keep` (the one just loaded) and versions with batches in flight are
+        spared; a pinned version is evicted once its last batch finishes.
+        """
+        ready = [v for v, h in self._handles.items() if h.state == "ready"]
+        candidates = [v for v in ready if v not in (self._active, keep) and self._handles[v].in_flight == 0]
+        for version in candidates[:max(0, len(ready) - self.max_versions)]:
+            self._handles.pop(version).model = None
+            self.evictions += 1
+            print(f"♻️ Evicted model version {version}")
+
+    def list(self) -> List[Dict]:
+        with self._lock:
+            return [h.to_dict() for h in self._handles.values()]
+
+    def get_stats(self) -> Dict:
+        return {
+            "active": self._active,
+            "max_versions": self.max_versions,
+            "swaps": self.swaps,
+            "evictions": self.evictions,
+            "models": self.list()
+        }
@@ -0,0 +1,241 @@
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from app.core.config import settings
+
+def cache_namespace(model_version: str, explain: bool = False) -> str:
+    """Results with a heatmap are cached apart from plain ones for the same model."""
+    return f"{model_version}+heatmap" if explain else model_version
+
+class PredictionCache:
+    """
+    Content-addressed cache of prediction results.
+
+    Keys hash the raw image bytes together with the model version, so a
+    re-uploaded scan hits the cache while a model change invalidates it.
+    The in-memory tier is an LRU bounded by entry count and approximate
+    byte size, with a TTL on every entry. When `disk_dir` is set, entries
+    are also written through to JSON files there and survive restarts.
+
+    The disk tier is bounded by `disk_max_bytes`: past it, the directory is
+    rescanned (so files other workers wrote count too) and expired files,
+    then the oldest, are deleted until it is back under 90% of the cap.
+    """
+
+    DISK_PRUNE_TO = 0.9 # Fraction of disk_max_bytes pruning stops at, so it doesn't run on every write
+
+    def __init__(self, max_entries: int = 4096, max_bytes: int = 64 * 1024 * 1024, ttl_s: float = 3600.0, disk_dir: Optional[str] = None,
+                 disk_max_bytes: int = 1024 * 1024 * 1024):
+        self.max_entries = max(1, max_entries)
+        self.max_bytes = max(1, max_bytes)
+        self.ttl_s = ttl_s
+        self.disk_dir = disk_dir or None
+        self._entries: "OrderedDict[str, Tuple[float, int, Dict]]" = OrderedDict() # key -> (created_at, size, result)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.disk_max_bytes = max(1, disk_max_bytes)
+        self._disk_files: "OrderedDict[str, Tuple[float, int]]" = OrderedDict() # path -> (modified at, size), oldest first
+        self._disk_bytes = 0
+        self._disk_lock = threading.Lock()
+
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            self._scan_disk()
+
+        # Stats
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.disk_evictions = 0
+
+    @staticmethod
+    def make_key(image_bytes: bytes, model_version: str) -> str:
+        digest = hashlib.blake2b(digest_size=20)
+        digest.update(model_version.encode())
+        digest.update(b"\0")
+        digest.update(image_bytes)
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[Dict]:
+        """Returns the cached result (treat it as read-only) or None."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                created_at, size, result = entry
+                if now - created_at <= self.ttl_s:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return result
+                self._remove(key)
+                self.expirations += 1
+
+        if self.disk_dir:
+            stored = self._read_disk(key, now)
+            if stored is not None:
+                created_at, result = stored
+                with self._lock:
+                    self._insert(key, result, created_at)
+                    self.disk_hits += 1
+                return result
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put_result(self, image_bytes: bytes, result: Dict, explain: bool = False):
+        """
+        Caches a fresh result under the version that produced it. An explained
+        result also fills the plain entry, so a later request without a
+        heatmap for the same scan is a hit too.
+        """
+        version = result['model_version']
+        self.put(self.make_key(image_bytes, cache_namespace(version, explain)), result)
+        if explain:
+            plain = {k: v for k, v in result.items() if k != 'heatmap'}
+            self.put(self.make_key(image_bytes, version), plain)
+
+    def put(self, key: str, result: Dict):
+        now = time.time()
+        with self._lock:
+            self._insert(key, result, now)
+        if self.disk_dir:
+            self._write_disk(key, result, now)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _insert(self, key: str, result: Dict, created_at: float):
+        if key in self._entries:
+            self._remove(key)
+        size = len(key) + len(json.dumps(result))
+        self._entries[key] = (created_at, size, result)
+        self._bytes += size
+
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def _remove(self, key: str):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, key[:2], f"{key}.json")
+
+    def _read_disk(self, key: str, now: float) -> Optional[Tuple[float, Dict]]:
+        path = self._disk_path(key)
+        try:
+            with open(path, "r") as f:
+                stored = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if now - stored["created_at"] > self.ttl_s:
+            with self._disk_lock:
+                self._delete_disk(path)
+            with self._lock:
+                self.expirations += 1
+            return None
+        return stored["created_at"], stored["result"]
+
+    def _write_disk(self, key: str, result: Dict, created_at: float):
+        path = self._disk_path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write-then-rename so a concurrent reader never sees half a file
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            data = json.dumps({"created_at": created_at, "result": result}).encode()
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Prediction cache write failed: {e}")
+            return
+
+        with self._disk_lock:
+            previous = self._disk_files.pop(path, None)
+            if previous is not None:
+                self._disk_bytes -= previous[1]
+            self._disk_files[path] = (created_at, len(data))
+            self._disk_bytes += len(data)
+            if self._disk_bytes > self.disk_max_bytes:
+                self._prune_disk(time.time())
+
+    def _scan_disk(self):
+        """Rebuilds the index of cache files on disk, oldest first."""
+        files = []
+        for root, _, names in os.walk(self.disk_dir):
+            for name in names:
+                if not name.endswith(".json"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue # Pruned by another worker meanwhile
+                files.append((stat.st_mtime, path, stat.st_size))
+        files.sort()
+        self._disk_files = OrderedDict((path, (mtime, size)) for mtime, path, size in files)
+        self._disk_bytes = sum(size for _, _, size in files)
+
+    def _prune_disk(self, now: float):
+        """Deletes expired, then oldest, files until the disk tier is under DISK_PRUNE_TO of its cap."""
+        self._scan_disk()
+        target = self.disk_max_bytes * self.DISK_PRUNE_TO
+        while self._disk_files:
+            path, (modified_at, _) = next(iter(self._disk_files.items()))
+            if self._disk_bytes <= target and now - modified_at <= self.ttl_s:
+                break
+            self._delete_disk(path)
+            self.disk_evictions += 1
+
+    def _delete_disk(self, path: str):
+        entry = self._disk_files.pop(path, None)
+        if entry is not None:
+            self._disk_bytes -= entry[1]
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "ttl_s": self.ttl_s,
+                "disk_tier": self.disk_dir is not None,
+                "disk_bytes": self._disk_bytes,
+                "disk_files": len(self._disk_files),
+                "disk_max_bytes": self.disk_max_bytes,
+                "disk_evictions": self.disk_evictions,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round((self.hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations
+            }
+
+prediction_cache = PredictionCache(
+    max_entries=settings.PREDICTION_CACHE_MAX_ENTRIES,
+    max_bytes=int(settings.PREDICTION_CACHE_MAX_MB * 1024 * 1024),
+    ttl_s=settings.PREDICTION_CACHE_TTL_S,
+    disk_dir=settings.PREDICTION_CACHE_DIR,
+    disk_max_bytes=int(settings.PREDICTION_CACHE_DISK_MAX_MB * 1024 * 1024)
+) if settings.PREDICTION_CACHE_ENABLED else None
@@ -0,0 +1,114 @@
+
+import io
+import threading
+import time
+from typing import Dict, List, Sequence, Union
+
+import numpy as np
+import torch
+from PIL import Image
+
+IMAGENET_MEAN = (0.485, 0.456, 0.406)
+IMAGENET_STD = (0.229, 0.224, 0.225)
+
+class ImagePreprocessor:
+    """
+    Turns uploads into normalized (N, 3, H, W) model input.
+
+    Equivalent to Resize -> ToTensor -> Normalize, but cheaper on large scans:
+    - with `jpeg_draft`, JPEGs are decoded in draft mode, letting libjpeg
+      downscale by 1/2..1/8 while decoding instead of materialising the
+      full-resolution image. Off by default: the input is no longer the
+      same as torchvision's
+    - greyscale scans stay single-channel through resize; the channel is
+      only replicated when writing the batch
+    - uint8 -> float conversion, scaling and normalization are one fused
+      addcmul into a per-thread batch buffer that is reused across calls
+    """
+
+    def __init__(self, image_size: int = 224, mean: Sequence[float] = IMAGENET_MEAN, std: Sequence[float] = IMAGENET_STD, jpeg_draft: bool = False):
+        self.image_size = image_size
+        self.jpeg_draft = jpeg_draft
+        std_t = torch.tensor(std, dtype=torch.float32).view(1, 3, 1, 1)
+        mean_t = torch.tensor(mean, dtype=torch.float32).view(1, 3, 1, 1)
+        # (x / 255 - mean) / std  ==  x * scale + bias
+        self._scale = 1.0 / (255.0 * std_t)
+        self._bias = -mean_t / std_t
+        self._local = threading.local()
+
+        # Stats
+        self._lock = threading.Lock()
+        self.images = 0
+        self.stage_seconds = {"decode": 0.0, "resize": 0.0, "normalize": 0.0}
+
+    def load(self, image: Union[bytes, Image.Image]) -> Image.Image:
+        """Decodes (if needed) and resizes one image to image_size x image_size, in L or RGB mode."""
+        t0 = time.perf_counter()
+        if isinstance(image, (bytes, bytearray)):
+            image = Image.open(io.BytesIO(image))
+            if self.jpeg_draft and image.format == 'JPEG' and image.mode in ('L', 'RGB'):
+                image.draft(image.mode, (self.image_size, self.image_size))
+            image.load()
+        if image.mode not in ('L', 'RGB'):
+            image = image.convert('RGB')
+        t1 = time.perf_counter()
+
+        if image.size != (self.image_size, self.image_size):
+            image = image.resize((self.image_size, self.image_size), Image.BILINEAR)
+        t2 = time.perf_counter()
+
+        self._record(images=1, decode=t1 - t0, resize=t2 - t1)
+        return image
+
+    def to_batch(self, images: List[Image.Image]) -> torch.Tensor:
+        """
+        Writes already-resized images into the reusable batch buffer. The
+        returned tensor is only valid until the next call on this thread.
+        """
+        t0 = time.perf_counter()
+        n = len(images)
+        pixels = self._staging(n)
+        for i, image in enumerate(images):
+            array = np.asarray(image)
+            if array.ndim == 2:
+                pixels[i] = array[:, :, None] # broadcast greyscale into all 3 channels
+            else:
+                pixels[i] = array
+
+        out = self._output(n)
+        source = torch.from_numpy(pixels[:n]).permute(0, 3, 1, 2)
+        torch.addcmul(self._bias, source, self._scale, out=out)
+        self._record(normalize=time.perf_counter() - t0)
+        return out
+
+    def __call__(self, images: List[Union[bytes, Image.Image]]) -> torch.Tensor:
+        return self.to_batch([self.load(image) for image in images])
+
+    def _staging(self, n: int) -> np.ndarray:
+        pixels = getattr(self._local, "pixels", None)
+        if pixels is None or pixels.shape[0] < n:
+            pixels = np.empty((n, self.image_size, self.image_size, 3), dtype=np.uint8)
+            self._local.pixels = pixels
+        return pixels
+
+    def _output(self, n: int) -> torch.Tensor:
+        out = getattr(self._local, "out", None)
+        if out is None or out.shape[0] < n:
+            out = torch.empty((n, 3, self.image_size, self.image_size), dtype=torch.float32)
+            self._local.out = out
+        return out[:n]
+
+    def _record(self, images: int = 0, decode: float = 0.0, resize: float = 0.0, normalize: float = 0.0):
+        with self._lock:
+            self.images += images
+            self.stage_seconds["decode"] += decode
+            self.stage_seconds["resize"] += resize
+            self.stage_seconds["normalize"] += normalize
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            per_image = {
+                f"{stage}_ms": round(seconds * 1000 / self.images, 3) if self.images else 0.0
+                for stage, seconds in self.stage_seconds.items()
+            }
+            return {"images": self.images, "jpeg_draft": self.jpeg_draft, "avg_per_image": per_image}
@@ -0,0 +1,412 @@
+
+import heapq
+import math
+import os
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from app.services.spatial_index import EARTH_RADIUS_KM, GridIndex
+
+ACCESS_SPEED_MPS = 8.0 # Between a point and its nearest road node (~30 km/h)
+ACTIVE_LANDMARKS = 4 # Landmarks the ALT heuristic consults per query
+
+class RoadGraph:
+    """
+    Directed road graph in compressed sparse row form: the edges leaving
+    node u are indices[indptr[u]:indptr[u + 1]], with travel times in
+    `travel_s` and lengths in `length_m`. Optionally carries ALT landmark
+    distances: `landmark_from[v, i]` is the travel time from landmark i to
+    v, and `landmark_to[v, i]` from v to landmark i.
+
+    Stored as one .npz file, written by build_road_graph.py.
+    """
+
+    ARRAYS = ("node_lat", "node_lng", "indptr", "indices", "travel_s", "length_m")
+    LANDMARK_ARRAYS = ("landmarks", "landmark_from", "landmark_to")
+
+    def __init__(self, node_lat: np.ndarray, node_lng: np.ndarray, indptr: np.ndarray, indices: np.ndarray,
+                 travel_s: np.ndarray, length_m: np.ndarray, landmarks: Optional[np.ndarray] = None,
+                 landmark_from: Optional[np.ndarray] = None, landmark_to: Optional[np.ndarray] = None):
+        self.node_lat = np.asarray(node_lat, dtype=np.float64)
+        self.node_lng = np.asarray(node_lng, dtype=np.float64)
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.indices = np.asarray(indices, dtype=np.int32)
+        self.travel_s = np.asarray(travel_s, dtype=np.float32)
+        self.length_m = np.asarray(length_m, dtype=np.float32)
+        self.landmarks = landmarks
+        self.landmark_from = landmark_from
+        self.landmark_to = landmark_to
+        self._reverse = None
+
+    @property
+    def num_nodes(self) -> int:
+        return len(self.node_lat)
+
+    @property
+    def num_edges(self) -> int:
+        return len(self.indices)
+
+    @classmethod
+    def load(cls, path: str) -> "RoadGraph":
+        with np.load(path) as data:
+            arrays = {name: data[name] for name in cls.ARRAYS}
+            if all(name in data for name in cls.LANDMARK_ARRAYS):
+                arrays.update({name: data[name] for name in cls.LANDMARK_ARRAYS})
+        return cls(**arrays)
+
+    def save(self, path: str):
+        arrays = {name: getattr(self, name) for name in self.ARRAYS}
+        if self.landmarks is not None:
+            arrays.update({name: getattr(self, name) for name in self.LANDMARK_ARRAYS})
+        np.savez(path, **arrays)
+
+    def reverse(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """(indptr, indices, travel_s, length_m) of the graph with every edge flipped."""
+        if self._reverse is None:
+            sources = np.repeat(np.arange(self.num_nodes, dtype=np.int32), np.diff(self.indptr))
+            self._reverse = build_csr(self.num_nodes, self.indices, sources, self.travel_s, self.length_m)
+        return self._reverse
+
+def build_csr(num_nodes: int, src: np.ndarray, dst: np.ndarray, travel_s: np.ndarray,
+              length_m: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """CSR arrays (indptr, indices, travel_s, length_m) from an edge list."""
+    order = np.argsort(src, kind="stable")
+    indptr = np.zeros(num_nodes + 1, dtype=np.int64)
+    np.cumsum(np.bincount(src, minlength=num_nodes), out=indptr[1:])
+    return (indptr, np.asarray(dst, dtype=np.int32)[order],
+            np.asarray(travel_s, dtype=np.float32)[order], np.asarray(length_m, dtype=np.float32)[order])
+
+def dijkstra(indptr: List[int], indices: List[int], weights: List[float], source: int) -> np.ndarray:
+    """Travel time from `source` to every node (inf where unreachable). Takes the CSR arrays as lists, for speed."""
+    dist = [math.inf] * (len(indptr) - 1)
+    dist[source] = 0.0
+    heap = [(0.0, source)]
+    while heap:
+        d, u = heapq.heappop(heap)
+        if d > dist[u]:
+            continue
+        for e in range(indptr[u], indptr[u + 1]):
+            v = indices[e]
+            nd = d + weights[e]
+            if nd < dist[v]:
+                dist[v] = nd
+                heapq.heappush(heap, (nd, v))
+    return np.array(dist)
+
+def largest_strongly_connected(graph: RoadGraph) -> np.ndarray:
+    """Boolean mask of the nodes in the largest strongly connected component (iterative Kosaraju)."""
+    n = graph.num_nodes
+    forward = (graph.indptr.tolist(), graph.indices.tolist())
+    rindptr, rindices, _, _ = graph.reverse()
+    backward = (rindptr.tolist(), rindices.tolist())
+
+    # Pass 1: nodes in order of DFS completion on the forward graph
+    visited = [False] * n
+    order = []
+    indptr, indices = forward
+    for root in range(n):
+        if visited[root]:
+            continue
+        visited[root] = True
+        stack = [(root, indptr[root])]
+        while stack:
+            u, e = stack[-1]
+            if e < indptr[u + 1]:
+                stack[-1] = (u, e + 1)
+                v = indices[e]
+                if not visited[v]:
+                    visited[v] = True
+                    stack.append((v, indptr[v]))
+            else:
+                stack.pop()
+                order.append(u)
+
+    # Pass 2: components on the reversed graph, in reverse completion order
+    component = [-1] * n
+    sizes = []
+    indptr, indices = backward
+    for root in reversed(order):
+        if component[root] >= 0:
+            continue
+        label = len(sizes)
+        component[root] = label
+        stack = [root]
+        size = 0
+        while stack:
+            u = stack.pop()
+            size += 1
+            for e in range(indptr[u], indptr[u + 1]):
+                v = indices[e]
+                if component[v] < 0:
+                    component[v] = label
+                    stack.append(v)
+        sizes.append(size)
+    return np.array(component) == int(np.argmax(sizes))
+
+def subgraph(graph: RoadGraph, keep: np.ndarray) -> RoadGraph:
+    """The graph restricted to the `keep` nodes, renumbered."""
+    new_id = np.full(graph.num_nodes, -1, dtype=np.int64)
+    new_id[keep] = np.arange(int(keep.sum()))
+    src = np.repeat(np.arange(graph.num_nodes), np.diff(graph.indptr))
+    edges = keep[src] & keep[graph.indices]
+    indptr, indices, travel_s, length_m = build_csr(
+        int(keep.sum()), new_id[src[edges]], new_id[graph.indices[edges]], graph.travel_s[edges], graph.length_m[edges]
+    )
+    return RoadGraph(graph.node_lat[keep], graph.node_lng[keep], indptr, indices, travel_s, length_m)
+
+def add_landmarks(graph: RoadGraph, count: int = 16, seed: int = 0) -> RoadGraph:
+    """
+    Picks `count` landmarks by farthest-point selection and stores the travel
+    time from and to each of them, for the ALT heuristic. Two Dijkstra runs
+    per landmark, so this belongs in the offline build, not at startup.
+    """
+    forward = (graph.indptr.tolist(), graph.indices.tolist(), graph.travel_s.tolist())
+    rindptr, rindices, rtravel, _ = graph.reverse()
+    backward = (rindptr.tolist(), rindices.tolist(), rtravel.tolist())
+
+    rng = np.random.default_rng(seed)
+    landmarks: List[int] = []
+    from_columns, to_columns = [], []
+    nearest = np.full(graph.num_nodes, np.inf)
+    # The node farthest from a random start is on the rim: a good first landmark
+    from_start = dijkstra(*forward, int(rng.integers(graph.num_nodes)))
+    candidate = int(np.argmax(np.where(np.isfinite(from_start), from_start, -1)))
+    for _ in range(min(count, graph.num_nodes)):
+        landmarks.append(candidate)
+        from_landmark = dijkstra(*forward, candidate)
+        to_landmark = dijkstra(*backward, candidate)
+        from_columns.append(from_landmark)
+        to_columns.append(to_landmark)
+        nearest = np.minimum(nearest, np.where(np.isfinite(from_landmark), from_landmark, np.inf))
+        candidate = int(np.argmax(np.where(np.isfinite(nearest), nearest, -1)))
+        print(f"🧭 Landmark {len(landmarks)}/{count}: node {landmarks[-1]}")
+
+    graph.landmarks = np.array(landmarks, dtype=np.int32)
+    graph.landmark_from = np.stack(from_columns, axis=1).astype(np.float32)
+    graph.landmark_to = np.stack(to_columns, axis=1).astype(np.float32)
+    return graph
+
+class Route(NamedTuple):
+    seconds: float
+    meters: float
+    nodes: List[int]
+
+class RoadRouter:
+    """
+    Shortest-time routing on a RoadGraph.
+
+    Point-to-point queries run A* with the ALT heuristic (triangle
+    inequality against precomputed landmark distances) when the graph has
+    landmarks, else with straight-line distance at the graph's top speed.
+    Node-to-node routes are kept in an LRU cache. One-to-many ETAs (every
+    candidate unit to one pickup) are a single Dijkstra on the reversed
+    graph that stops once all candidates are settled.
+    """
+
+    def __init__(self, graph: RoadGraph, cache_size: int = 10000):
+        self.graph = graph
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[Tuple[int, int], Optional[Route]]" = OrderedDict()
+        self._lock = threading.Lock()
+        # Plain lists: indexing them is several times faster than numpy scalars in the search loops
+        self._forward = (graph.indptr.tolist(), graph.indices.tolist(), graph.travel_s.tolist(), graph.length_m.tolist())
+        self._backward = tuple(a.tolist() for a in graph.reverse())
+        self._node_lat, self._node_lng = graph.node_lat.tolist(), graph.node_lng.tolist()
+        if graph.landmarks is not None:
+            # One compact column per landmark; indexing array.array yields floats as fast as a list
+            self._landmark_from = [array("f", column) for column in graph.landmark_from.T]
+            self._landmark_to = [array("f", column) for column in graph.landmark_to.T]
+        self._nodes = GridIndex(0.25)
+        self._nodes.rebuild(np.arange(graph.num_nodes), graph.node_lat, graph.node_lng)
+        speeds = graph.length_m / np.maximum(graph.travel_s, 1e-3)
+        self.max_speed_mps = float(speeds.max()) if len(speeds) else 1.0
+
+        # Stats
+        self.hits = 0
+        self.misses = 0
+        self.searches = 0
+        self.search_s = 0.0
+        self.settled = 0
+
+    def snap(self, lat: float, lng: float) -> Tuple[int, float]:
+        """Nearest road node and the straight-line metres to it."""
+        node, km = self._nodes.nearest(lat, lng, 1)[0]
+        return node, km * 1000
+
+    def _heuristic(self, source: int, target: int):
+        """Lower bound on the seconds from a node to `target`, as a plain function (it runs once per push)."""
+        g = self.graph
+        if g.landmarks is not None:
+            # Only the few landmarks giving the tightest bound for this pair: cheaper, nearly as tight
+            from_target, to_target = g.landmark_from[target], g.landmark_to[target]
+            bounds = np.maximum(from_target - g.landmark_from[source], g.landmark_to[source] - to_target)
+            terms = [(self._landmark_from[i], float(from_target[i]), self._landmark_to[i], float(to_target[i]))
+                     for i in np.argsort(-bounds)[:ACTIVE_LANDMARKS]]
+
+            def h(v: int) -> float:
+                # d(v, t) >= d(L, t) - d(L, v) and >= d(v, L) - d(t, L) for every landmark L
+                best = 0.0
+                for from_landmark, from_t, to_landmark, to_t in terms:
+                    bound = max(from_t - from_landmark[v], to_landmark[v] - to_t)
+                    if bound > best:
+                        best = bound
+                return best
+            return h
+
+        node_lat, node_lng = self._node_lat, self._node_lng
+        target_lat, target_lng = math.radians(node_lat[target]), math.radians(node_lng[target])
+        cos_target = math.cos(target_lat)
+        scale = 2 * EARTH_RADIUS_KM * 1000 / self.max_speed_mps
+
+        def h(v: int) -> float:
+            lat, lng = math.radians(node_lat[v]), math.radians(node_lng[v])
+            a = math.sin((lat - target_lat) / 2) ** 2 + math.cos(lat) * cos_target * math.sin((lng - target_lng) / 2) ** 2
+            return scale * math.asin(min(1.0, math.sqrt(a)))
+        return h
+
+    def _astar(self, source: int, target: int) -> Optional[Route]:
+        indptr, indices, travel, length = self._forward
+        h = self._heuristic(source, target)
+        dist = {source: 0.0}
+        meters = {source: 0.0}
+        parent = {source: -1}
+        heap = [(h(source), 0.0, source)]
+        settled = 0
+        while heap:
+            _, d, u = heapq.heappop(heap)
+            if d > dist[u]:
+                continue
+            settled += 1
+            if u == target:
+                break
+            for e in range(indptr[u], indptr[u + 1]):
+                v = indices[e]
+                nd = d + travel[e]
+                if nd < dist.get(v, math.inf):
+                    dist[v] = nd
+                    meters[v] = meters[u] + length[e]
+                    parent[v] = u
+                    heapq.heappush(heap, (nd + h(v), nd, v))
+        self.settled += settled
+        if target not in dist:
+            return None
+        path = [target]
+        while parent[path[-1]] >= 0:
+            path.append(parent[path[-1]])
+        return Route(dist[target], meters[target], path[::-1])
+
+    def route_nodes(self, source: int, target: int) -> Optional[Route]:
+        key = (source, target)
+        with self._lock:
+            if key in self._cache:
+                self.hits += 1
+                self._cache.move_to_end(key)
+                return self._cache[key]
+            self.misses += 1
+        started = time.perf_counter()
+        route = self._astar(source, target)
+        with self._lock:
+            self.searches += 1
+            self.search_s += time.perf_counter() - started
+            self._cache[key] = route
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return route
+
+    def route(self, src_lat: float, src_lng: float, dst_lat: float, dst_lng: float) -> Optional[Dict]:
+        """
+        Fastest road path between two points, as {"seconds", "meters",
+        "lat", "lng", "t"}: waypoints from the start point through the road
+        nodes to the end point, with the cumulative seconds at each.
+        """
+        source, access_m = self.snap(src_lat, src_lng)
+        target, egress_m = self.snap(dst_lat, dst_lng)
+        route = self.route_nodes(source, target)
+        if route is None:
+            return None
+        g = self.graph
+        nodes = np.array(route.nodes, dtype=np.int64)
+        edge_s = np.array([self._edge_seconds(u, v) for u, v in zip(route.nodes, route.nodes[1:])])
+        t = np.concatenate(([0.0], access_m / ACCESS_SPEED_MPS + np.concatenate(([0.0], np.cumsum(edge_s)))))
+        t = np.append(t, t[-1] + egress_m / ACCESS_SPEED_MPS)
+        return {
+            "seconds": float(t[-1]),
+            "meters": route.meters + access_m + egress_m,
+            "lat": np.concatenate(([src_lat], g.node_lat[nodes], [dst_lat])),
+            "lng": np.concatenate(([src_lng], g.node_lng[nodes], [dst_lng])),
+            "t": t
+        }
+
+    def _edge_seconds(self, u: int, v: int) -> float:
+        indptr, indices, travel, _ = self._forward
+        return min(travel[e] for e in range(indptr[u], indptr[u + 1]) if indices[e] == v)
+
+    def etas_to(self, dst_lat: float, dst_lng: float, lats: np.ndarray, lngs: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        (seconds, meters) by road from each of the points to the destination,
+        inf where there is no path. One Dijkstra on the reversed graph from
+        the destination, stopped as soon as every point's node is settled.
+        """
+        target, egress_m = self.snap(dst_lat, dst_lng)
+        snapped = [self.snap(lat, lng) for lat, lng in zip(lats.tolist(), lngs.tolist())]
+        pending = {node for node, _ in snapped}
+
+        started = time.perf_counter()
+        indptr, indices, travel, length = self._backward
+        dist = {target: 0.0}
+        meters = {target: 0.0}
+        heap = [(0.0, target)]
+        settled = 0
+        while heap and pending:
+            d, u = heapq.heappop(heap)
+            if d > dist[u]:
+                continue
+            settled += 1
+            pending.discard(u)
+            for e in range(indptr[u], indptr[u + 1]):
+                v = indices[e]
+                nd = d + travel[e]
+                if nd < dist.get(v, math.inf):
+                    dist[v] = nd
+                    meters[v] = meters[u] + length[e]
+                    heapq.heappush(heap, (nd, v))
+        with self._lock:
+            self.searches += 1
+            self.search_s += time.perf_counter() - started
+            self.settled += settled
+
+        seconds = np.array([dist.get(node, math.inf) + (access_m + egress_m) / ACCESS_SPEED_MPS for node, access_m in snapped])
+        road_m = np.array([meters.get(node, math.inf) + access_m + egress_m for node, access_m in snapped])
+        return seconds, road_m
+
+    def get_stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "nodes": self.graph.num_nodes,
+            "edges": self.graph.num_edges,
+            "landmarks": 0 if self.graph.landmarks is None else len(self.graph.landmarks),
+            "cache_entries": len(self._cache),
+            "cache_hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "searches": self.searches,
+            "avg_search_ms": round(self.search_s * 1000 / self.searches, 3) if self.searches else 0.0,
+            "avg_settled_nodes": round(self.settled / self.searches, 1) if self.searches else 0.0
+        }
+
+def load_router(path: str, cache_size: int = 10000) -> Optional[RoadRouter]:
+    """The router for the graph at `path`, or None (straight-line distances) when it is unset or missing."""
+    if not path:
+        return None
+    if not os.path.exists(path):
+        print(f"⚠️ Road graph {path} not found; dispatch uses straight-line distances")
+        return None
+    started = time.perf_counter()
+    graph = RoadGraph.load(path)
+    router = RoadRouter(graph, cache_size)
+    print(f"🛣️ Loaded road graph: {graph.num_nodes} nodes, {graph.num_edges} edges, "
+          f"{0 if graph.landmarks is None else len(graph.landmarks)} landmarks in {time.perf_counter() - started:.1f}s")
+    return router
@@ -0,0 +1,113 @@
+
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+class FixedStepScheduler:
+    """
+    Runs `step(tick, dt)` at a fixed rate on a background thread.
+
+    Every tick advances simulated time by exactly `1 / tick_hz`, whatever the
+    wall clock did, so a run is reproducible from its seed and inputs. Ticks
+    are scheduled against absolute deadlines: if a tick overruns, the next
+    ones run back to back until the simulation has caught up. When it falls
+    more than `max_catch_up` ticks behind (a long GC pause, a suspended
+    process), the missed ticks are dropped and the clock resynchronises
+    instead of fast-forwarding through them.
+    """
+
+    def __init__(self, step: Callable[[int, float], None], tick_hz: float = 1.0, max_catch_up: int = 5,
+                 name: str = "simulation"):
+        if tick_hz <= 0:
+            raise ValueError("tick_hz must be positive")
+        self.step = step
+        self.dt = 1.0 / tick_hz
+        self.max_catch_up = max(0, max_catch_up)
+        self.name = name
+        self.tick = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        # Stats
+        self.ticks_run = 0 # Ticks run here; `tick` may resume from a recovered journal
+        self.last_tick_ms = 0.0
+        self.max_tick_ms = 0.0
+        self.total_tick_s = 0.0
+        self.overruns = 0 # Ticks that took longer than dt
+        self.catch_up_ticks = 0 # Ticks run late, back to back
+        self.dropped_ticks = 0
+        self.errors = 0
+        self.lag_s = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = 5.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def run_ticks(self, count: int):
+        """Runs `count` ticks immediately on the calling thread (headless runs and tests)."""
+        for _ in range(count):
+            self._run_tick()
+
+    def _run_tick(self):
+        started = time.perf_counter()
+        try:
+            self.step(self.tick, self.dt)
+        except Exception as e:
+            self.errors += 1
+            print(f"❌ {self.name} tick {self.tick} failed: {e!r}")
+        elapsed = time.perf_counter() - started
+        self.tick += 1
+        self.ticks_run += 1
+        self.last_tick_ms = elapsed * 1000
+        self.max_tick_ms = max(self.max_tick_ms, self.last_tick_ms)
+        self.total_tick_s += elapsed
+        if elapsed > self.dt:
+            self.overruns += 1
+
+    def _run(self):
+        print(f"⏱️ Starting {self.name} at {1 / self.dt:g} Hz...")
+        next_tick = time.monotonic() + self.dt
+        while not self._stop.is_set():
+            delay = next_tick - time.monotonic()
+            if delay > 0:
+                if self._stop.wait(delay):
+                    break
+            behind = int(-delay / self.dt) if delay < 0 else 0
+            if behind > self.max_catch_up:
+                self.dropped_ticks += behind
+                next_tick += behind * self.dt
+                print(f"⚠️ {self.name} fell {behind} ticks behind; dropping them")
+            elif behind:
+                self.catch_up_ticks += 1
+            self.lag_s = max(0.0, time.monotonic() - next_tick)
+            self._run_tick()
+            next_tick += self.dt
+
+    def get_stats(self) -> Dict:
+        return {
+            "running": self.running,
+            "tick": self.tick,
+            "tick_hz": 1 / self.dt,
+            "last_tick_ms": round(self.last_tick_ms, 3),
+            "ticks_run": self.ticks_run,
+            "avg_tick_ms": round(self.total_tick_s * 1000 / self.ticks_run, 3) if self.ticks_run else 0.0,
+            "max_tick_ms": round(self.max_tick_ms, 3),
+            "overruns": self.overruns,
+            "catch_up_ticks": self.catch_up_ticks,
+            "dropped_ticks": self.dropped_ticks,
+            "lag_ms": round(self.lag_s * 1000, 3),
+            "errors": self.errors
+        }
@@ -0,0 +1,203 @@
+
+import math
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEG_LAT = math.pi * EARTH_RADIUS_KM / 180
+
+# Which call types each ambulance type can take: ICU covers ALS/BLS, ALS covers BLS
+CAPABILITIES: Dict[str, Tuple[str, ...]] = {
+    "ICU": ("ICU", "ALS", "BLS"),
+    "ALS": ("ALS", "BLS"),
+    "BLS": ("BLS",),
+    "NEONATAL": ("NEONATAL",),
+}
+
+def serving_types(required_type: Optional[str], exact: bool = False) -> Optional[Set[str]]:
+    """Ambulance types that can take a `required_type` call, or None for any type."""
+    if not required_type:
+        return None
+    if exact:
+        return {required_type}
+    types = {t for t, caps in CAPABILITIES.items() if required_type in caps}
+    return types or {required_type}
+
+def haversine_km(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    dlat = math.radians(lat2 - lat1)
+    dlng = math.radians(lng2 - lng1)
+    a = math.sin(dlat / 2) ** 2 + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dlng / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+def haversine_km_array(lat: float, lng: float, lats: np.ndarray, lngs: np.ndarray) -> np.ndarray:
+    """Distances from one point to many, vectorized."""
+    dlat = np.radians(lats - lat)
+    dlng = np.radians(lngs - lng)
+    a = np.sin(dlat / 2) ** 2 + math.cos(math.radians(lat)) * np.cos(np.radians(lats)) * np.sin(dlng / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.minimum(1.0, np.sqrt(a)))
+
+def haversine_km_pairs(lats1: np.ndarray, lngs1: np.ndarray, lats2: np.ndarray, lngs2: np.ndarray) -> np.ndarray:
+    """Element-wise distances between two equally long sets of points."""
+    dlat = np.radians(lats2 - lats1)
+    dlng = np.radians(lngs2 - lngs1)
+    a = np.sin(dlat / 2) ** 2 + np.cos(np.radians(lats1)) * np.cos(np.radians(lats2)) * np.sin(dlng / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.minimum(1.0, np.sqrt(a)))
+
+CELL_ROW = 1 << 32 # Cell key = ci * CELL_ROW + cj + CELL_ROW // 2, so keys sort like (ci, cj)
+
+class Grid(NamedTuple):
+    cells: Dict[Tuple[int, int], Tuple[int, int]] # cell -> [start, end) in the arrays below
+    rows: np.ndarray # fleet rows, grouped by cell
+    lat: np.ndarray
+    lng: np.ndarray
+    keys: np.ndarray # cell key of each entry, ascending
+
+class GridIndex:
+    """
+    Uniform lat/lng grid of fleet rows for nearest, top-k and bounding box queries.
+
+    `rebuild` sorts the given points by cell in one pass of array operations
+    and publishes the result as an immutable Grid, so the simulation can
+    re-index the whole fleet every tick and queries on other threads just
+    read whichever grid is current, without locks.
+
+    A query scans rings of cells outward from the query's cell and stops once
+    the k-th best distance is no larger than the distance to the next ring, so
+    it touches a handful of cells however large the fleet is. Positions are
+    those of the last rebuild; `accept` filters candidates against live state
+    (such as units dispatched since).
+    """
+
+    def __init__(self, cell_km: float = 1.0):
+        if cell_km <= 0:
+            raise ValueError("cell_km must be positive")
+        self.cell_km = cell_km
+        self.cell_deg = cell_km / KM_PER_DEG_LAT
+        self.grid = Grid({}, np.empty(0, dtype=np.int64), np.empty(0), np.empty(0), np.empty(0, dtype=np.int64))
+
+    def __len__(self) -> int:
+        return len(self.grid.rows)
+
+    def rebuild(self, rows: np.ndarray, lat: np.ndarray, lng: np.ndarray):
+        """Indexes fleet `rows` at positions `lat`/`lng` (aligned with `rows`), replacing the previous grid."""
+        ci = np.floor(lat / self.cell_deg).astype(np.int64)
+        cj = np.floor(lng / self.cell_deg).astype(np.int64)
+        order = np.lexsort((cj, ci))
+        rows, lat, lng, ci, cj = rows[order], lat[order], lng[order], ci[order], cj[order]
+        if len(rows):
+            bounds = np.flatnonzero((np.diff(ci) != 0) | (np.diff(cj) != 0)) + 1
+            starts = np.concatenate(([0], bounds))
+            ends = np.concatenate((bounds, [len(rows)]))
+            cells = dict(zip(zip(ci[starts].tolist(), cj[starts].tolist()), zip(starts.tolist(), ends.tolist())))
+        else:
+            cells = {}
+        self.grid = Grid(cells, rows, lat, lng, ci * CELL_ROW + cj + CELL_ROW // 2)
+
+    def _cell(self, lat: float, lng: float) -> Tuple[int, int]:
+        return math.floor(lat / self.cell_deg), math.floor(lng / self.cell_deg)
+
+    def _ring_bound_km(self, lat: float, ring: int) -> float:
+        """
+        Lower bound on the distance from a query at `lat` to any point outside
+        the (2 * ring + 1)^2 cells centred on its own. Cells narrow with
+        latitude, so the east-west side uses the cosine at the highest
+        latitude it reaches.
+        """
+        highest = min(90.0, abs(lat) + (ring + 1) * self.cell_deg)
+        return ring * self.cell_km * math.cos(math.radians(highest))
+
+    def _ring(self, ci: int, cj: int, ring: int) -> Iterable[Tuple[int, int]]:
+        if ring == 0:
+            yield ci, cj
+            return
+        for dj in range(-ring, ring + 1):
+            yield ci - ring, cj + dj
+            yield ci + ring, cj + dj
+        for di in range(-ring + 1, ring):
+            yield ci + di, cj - ring
+            yield ci + di, cj + ring
+
+    def nearest(self, lat: float, lng: float, k: int = 1, accept: Optional[Callable[[np.ndarray], np.ndarray]] = None,
+                max_km: Optional[float] = None) -> List[Tuple[int, float]]:
+        """
+        Up to `k` (row, distance_km) pairs, closest first. `accept` maps an
+        array of rows to a boolean mask of the ones that qualify.
+        """
+        grid = self.grid
+        if k <= 0 or not grid.cells:
+            return []
+        ci, cj = self._cell(lat, lng)
+        best_rows = np.empty(0, dtype=np.int64)
+        best_km = np.empty(0)
+
+        def consider(spans: List[Tuple[int, int]]):
+            nonlocal best_rows, best_km
+            if not spans:
+                return
+            positions = np.concatenate([np.arange(start, end) for start, end in spans])
+            rows = grid.rows[positions]
+            km = haversine_km_array(lat, lng, grid.lat[positions], grid.lng[positions])
+            keep = np.ones(len(rows), dtype=bool) if accept is None else accept(rows)
+            if max_km is not None:
+                keep &= km <= max_km
+            best_rows = np.concatenate((best_rows, rows[keep]))
+            best_km = np.concatenate((best_km, km[keep]))
+            if len(best_km) > k:
+                top = np.argpartition(best_km, k - 1)[:k]
+                best_rows, best_km = best_rows[top], best_km[top]
+
+        ring = 0
+        while True:
+            if 8 * ring >= len(grid.cells):
+                # The ring has more cells than are occupied: finish with the
+                # occupied cells that lie outside the rings already scanned
+                consider([span for (i, j), span in grid.cells.items() if max(abs(i - ci), abs(j - cj)) >= ring])
+                break
+            consider([grid.cells[cell] for cell in self._ring(ci, cj, ring) if cell in grid.cells])
+            bound = self._ring_bound_km(lat, ring)
+            ring += 1
+            if len(best_km) == k and best_km.max() <= bound:
+                break
+            if max_km is not None and bound > max_km:
+                break
+
+        order = np.argsort(best_km, kind="stable")
+        return list(zip(best_rows[order].tolist(), best_km[order].tolist()))
+
+    def within(self, lat_min: float, lng_min: float, lat_max: float, lng_max: float) -> np.ndarray:
+        """
+        Rows inside the box, in row order. Entries are sorted by cell row then
+        column, so each row of cells the box spans is one contiguous range,
+        found by binary search; only the entries in those cells are tested.
+        """
+        grid = self.grid
+        if not len(grid.keys):
+            return np.empty(0, dtype=np.int64)
+        i0, j0 = self._cell(lat_min, lng_min)
+        i1, j1 = self._cell(lat_max, lng_max)
+        i0 = max(i0, int(grid.keys[0] // CELL_ROW))
+        i1 = min(i1, int(grid.keys[-1] // CELL_ROW))
+        if i0 > i1:
+            return np.empty(0, dtype=np.int64)
+        row_keys = np.arange(i0, i1 + 1, dtype=np.int64) * CELL_ROW + CELL_ROW // 2
+        starts = np.searchsorted(grid.keys, row_keys + j0, "left")
+        lengths = np.searchsorted(grid.keys, row_keys + j1, "right") - starts
+        total = int(lengths.sum())
+        if not total:
+            return np.empty(0, dtype=np.int64)
+        # Concatenated [start, start + length) ranges
+        positions = np.repeat(starts - (np.cumsum(lengths) - lengths), lengths) + np.arange(total)
+        lat, lng = grid.lat[positions], grid.lng[positions]
+        inside = (lat >= lat_min) & (lat <= lat_max) & (lng >= lng_min) & (lng <= lng_max)
+        return np.sort(grid.rows[positions[inside]])
+
+    def get_stats(self) -> Dict:
+        grid = self.grid
+        sizes = [end - start for start, end in grid.cells.values()]
+        return {
+            "points": len(grid.rows),
+            "cells": len(sizes),
+            "cell_km": self.cell_km,
+            "max_per_cell": max(sizes) if sizes else 0
+        }
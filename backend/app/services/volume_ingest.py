@@ -0,0 +1,428 @@
+
+import asyncio
+import gzip
+import io
+import json
+import os
+import tempfile
+import zipfile
+from collections import Counter
+from typing import AsyncIterator, BinaryIO, Dict, Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+from PIL import Image
+from starlette.concurrency import iterate_in_threadpool
+
+from app.core.config import settings
+from app.services.batching_service import prediction_batcher
+
+VOLUME_EXTENSIONS = (".npy", ".nii", ".nii.gz", ".dcm", ".zip")
+NO_TUMOR = "No Tumor"
+
+class VolumeFormatError(ValueError):
+    """Raised for uploads that can't be read as a volume."""
+    pass
+
+def volume_suffix(filename: str) -> Optional[str]:
+    name = filename.lower()
+    for suffix in sorted(VOLUME_EXTENSIONS, key=len, reverse=True):
+        if name.endswith(suffix):
+            return suffix
+    return None
+
+def spool_upload(source: BinaryIO, suffix: str, max_bytes: int) -> str:
+    """
+    Copies an upload to a temporary file in fixed-size chunks and returns its
+    path. Gzipped NIfTI is decompressed on the way, so the volume can be
+    memory-mapped afterwards. The caller deletes the file.
+    """
+    source.seek(0)
+    if suffix == ".nii.gz":
+        source, suffix = gzip.GzipFile(fileobj=source, mode="rb"), ".nii"
+    fd, path = tempfile.mkstemp(prefix="neurovision-volume-", suffix=suffix)
+    try:
+        with os.fdopen(fd, "wb") as out:
+            written = 0
+            while True:
+                chunk = source.read(1024 * 1024)
+                if not chunk:
+                    break
+                written += len(chunk)
+                if written > max_bytes:
+                    raise VolumeFormatError(f"Volume exceeds {max_bytes // (1024 * 1024)} MB")
+                out.write(chunk)
+    except (OSError, EOFError) as e:
+        os.remove(path)
+        raise VolumeFormatError(f"Could not read upload: {e}")
+    except BaseException:
+        os.remove(path)
+        raise
+    return path
+
+def slice_to_image(pixels: np.ndarray, low: float, high: float) -> Image.Image:
+    """Windows one slice to 8-bit greyscale, the form the classifier was trained on."""
+    scaled = (np.asarray(pixels, dtype=np.float32) - low) * (255.0 / max(high - low, 1e-6))
+    return Image.fromarray(np.clip(scaled, 0, 255).astype(np.uint8), mode="L")
+
+def is_blank(pixels: np.ndarray, low: float, high: float, min_fraction: float) -> bool:
+    """True for slices (volume edges, padding) where almost nothing rises above background noise."""
+    return float(np.mean(pixels > low + 0.1 * (high - low))) < min_fraction
+
+class Volume:
+    """A stack of 2-D slices that are read one at a time."""
+
+    format = "volume"
+
+    @property
+    def num_slices(self) -> int:
+        raise NotImplementedError
+
+    def iter_slices(self) -> Iterator[Tuple[int, Union[np.ndarray, Exception], Optional[float], Optional[float]]]:
+        """
+        Yields (index, pixels, window low, window high) per slice, in order. A
+        slice that can't be decoded yields its exception in place of the
+        pixels (and no window), so one bad slice doesn't end the volume.
+        """
+        raise NotImplementedError
+
+    def describe(self) -> Dict:
+        return {"format": self.format, "slices": self.num_slices}
+
+    def close(self):
+        pass
+
+class ArrayVolume(Volume):
+    """
+    A memory-mapped voxel array (.npy, or NIfTI via nibabel's array proxy).
+    Indexing a slice only pages in that slice, and the intensity window comes
+    from a strided sample, so the volume is never read whole.
+    """
+
+    def __init__(self, data, axis: int, format: str, orient=None):
+        shape = tuple(int(n) for n in data.shape)
+        if len(shape) not in (3, 4):
+            raise VolumeFormatError(f"Expected a 3-D volume, got shape {shape}")
+        if 0 in shape:
+            raise VolumeFormatError(f"Volume is empty along an axis: shape {shape}")
+        if not -3 <= axis < 3:
+            raise VolumeFormatError(f"Slice axis must be 0, 1 or 2, got {axis}")
+        self.data = data
+        # Indexed rather than sliced up front: slicing a lazy proxy would read it all
+        self.frame = (0,) * (len(shape) - 3) # First frame of a time series
+        self.axis = axis % 3
+        self.format = format
+        self.orient = orient
+        self.shape = shape[:3]
+        self.low, self.high = self._window()
+
+    @property
+    def num_slices(self) -> int:
+        return self.shape[self.axis]
+
+    def _slice(self, index: int) -> np.ndarray:
+        key = [slice(None)] * 3
+        key[self.axis] = index
+        pixels = np.asarray(self.data[tuple(key) + self.frame], dtype=np.float32)
+        return self.orient(pixels) if self.orient else pixels
+
+    def _window(self) -> Tuple[float, float]:
+        # About 64^3 voxels spread over the whole volume are plenty for percentiles
+        step = tuple(max(1, n // 64) for n in self.shape)
+        sample = np.asarray(self.data[(slice(None, None, step[0]), slice(None, None, step[1]), slice(None, None, step[2])) + self.frame], dtype=np.float32)
+        low, high = np.percentile(sample, (0.5, 99.5))
+        return float(low), float(high)
+
+    def iter_slices(self):
+        for index in range(self.num_slices):
+            yield index, self._slice(index), self.low, self.high
+
+    def describe(self) -> Dict:
+        return {**super().describe(), "shape": list(self.shape), "axis": self.axis}
+
+class DicomSeries(Volume):
+    """
+    DICOM slices: either a zip of one file per slice (ordered by position
+    along the scan axis) or a single multi-frame file, decoded frame by frame.
+    Needs pydicom.
+    """
+
+    format = "dicom"
+
+    def __init__(self, path: str):
+        try:
+            import pydicom # Optional dependency
+        except ImportError:
+            raise VolumeFormatError("DICOM support needs pydicom (pip install pydicom)")
+        self.pydicom = pydicom
+        self.path = path
+        self.archive = None
+        self.members: List[str] = []
+        self._sampled_window: Optional[Tuple[float, float]] = None
+
+        if zipfile.is_zipfile(path):
+            self.archive = zipfile.ZipFile(path)
+            self.members = self._ordered_members()
+            if not self.members:
+                self.archive.close()
+                raise VolumeFormatError("Zip archive contains no DICOM slices")
+            self._frames = len(self.members)
+        else:
+            try:
+                header = pydicom.dcmread(path, stop_before_pixels=True)
+            except Exception as e:
+                raise VolumeFormatError(f"Not a DICOM file: {e}")
+            self._frames = int(getattr(header, "NumberOfFrames", 1) or 1)
+
+    def _ordered_members(self) -> List[str]:
+        positioned = []
+        for info in self.archive.infolist():
+            if info.is_dir() or os.path.basename(info.filename).startswith("."):
+                continue
+            try:
+                with self.archive.open(info) as f:
+                    header = self.pydicom.dcmread(f, stop_before_pixels=True)
+            except Exception:
+                continue # Not DICOM (DICOMDIR, readme, ...)
+            position = getattr(header, "ImagePositionPatient", None)
+            order = float(position[2]) if position is not None else float(getattr(header, "InstanceNumber", 0) or 0)
+            positioned.append((order, info.filename))
+        return [name for _, name in sorted(positioned)]
+
+    @property
+    def num_slices(self) -> int:
+        return self._frames
+
+    def _window(self, dataset, pixels: np.ndarray) -> Tuple[float, float]:
+        center, width = getattr(dataset, "WindowCenter", None), getattr(dataset, "WindowWidth", None)
+        if center is not None and width is not None:
+            # Multi-valued tags list several presets; the first is the default
+            center = float(center[0] if isinstance(center, self.pydicom.multival.MultiValue) else center)
+            width = float(width[0] if isinstance(width, self.pydicom.multival.MultiValue) else width)
+            return center - width / 2, center + width / 2
+        if self._sampled_window is None:
+            # One window for the whole series, so empty slices stay dark instead of
+            # having their noise stretched to full contrast
+            indices = sorted(set(np.linspace(0, self.num_slices - 1, min(self.num_slices, 5)).astype(int).tolist()))
+            sample = [p.ravel() for _, _, p in self._read(indices) if not isinstance(p, Exception)]
+            if not sample:
+                # None of the sampled slices decode; window this one on its own
+                low, high = np.percentile(pixels, (0.5, 99.5))
+                return float(low), float(high)
+            low, high = np.percentile(np.concatenate(sample), (0.5, 99.5))
+            self._sampled_window = (float(low), float(high))
+        return self._sampled_window
+
+    def _rescale(self, dataset, pixels: np.ndarray) -> np.ndarray:
+        slope = float(getattr(dataset, "RescaleSlope", 1) or 1)
+        intercept = float(getattr(dataset, "RescaleIntercept", 0) or 0)
+        return pixels.astype(np.float32) * slope + intercept
+
+    def _read(self, indices: Optional[List[int]] = None) -> Iterator[Tuple[int, object, Union[np.ndarray, Exception]]]:
+        """
+        Yields (index, dataset, rescaled pixels) for the given slices, or all
+        of them, one at a time; a slice that fails to decode yields its
+        exception instead of pixels.
+        """
+        if self.archive is not None:
+            for index in (indices if indices is not None else range(len(self.members))):
+                try:
+                    with self.archive.open(self.members[index]) as f:
+                        dataset = self.pydicom.dcmread(io.BytesIO(f.read()))
+                    pixels = self._rescale(dataset, dataset.pixel_array)
+                except Exception as e:
+                    yield index, None, e
+                    continue
+                yield index, dataset, pixels
+            return
+
+        from pydicom.pixels import iter_pixels
+        header = self.pydicom.dcmread(self.path, stop_before_pixels=True)
+        order = list(indices) if indices is not None else list(range(self.num_slices))
+        position = 0
+        while position < len(order):
+            # A frame that fails to decode ends iter_pixels; report it and resume after it
+            try:
+                for frame in iter_pixels(self.path, indices=order[position:]):
+                    pixels = self._rescale(header, frame)
+                    yield order[position], header, pixels
+                    position += 1
+                return
+            except Exception as e:
+                yield order[position], header, e
+                position += 1
+
+    def iter_slices(self):
+        for index, dataset, pixels in self._read():
+            if not isinstance(pixels, Exception):
+                try:
+                    low, high = self._window(dataset, pixels)
+                except Exception as e:
+                    pixels = e
+            if isinstance(pixels, Exception):
+                yield index, pixels, None, None
+            else:
+                yield index, pixels, low, high
+
+    def close(self):
+        if self.archive is not None:
+            self.archive.close()
+
+def open_volume(path: str, suffix: str, axis: Optional[int] = None) -> Volume:
+    """Opens a spooled upload by its original suffix, without reading the voxels."""
+    if suffix == ".npy":
+        try:
+            data = np.load(path, mmap_mode="r", allow_pickle=False)
+        except ValueError as e:
+            raise VolumeFormatError(f"Invalid .npy volume: {e}")
+        return ArrayVolume(data, axis=0 if axis is None else axis, format="npy")
+
+    if suffix in (".nii", ".nii.gz"):
+        try:
+            import nibabel # Optional dependency
+        except ImportError:
+            raise VolumeFormatError("NIfTI support needs nibabel (pip install nibabel)")
+        try:
+            image = nibabel.load(path, mmap=True)
+        except Exception as e:
+            raise VolumeFormatError(f"Invalid NIfTI volume: {e}")
+        # Voxel axes are usually (x, y, z); rotate axial slices into the usual radiological view
+        return ArrayVolume(image.dataobj, axis=2 if axis is None else axis, format="nifti", orient=np.rot90)
+
+    if suffix in (".dcm", ".zip"):
+        return DicomSeries(path)
+
+    raise VolumeFormatError(f"Unsupported volume type; expected one of {', '.join(VOLUME_EXTENSIONS)}")
+
+def aggregate_study(results: List[Dict], min_tumor_slices: int) -> Dict:
+    """
+    Study-level summary of per-slice predictions. The study is called for a
+    tumor class when at least `min_tumor_slices` slices predict a tumor; the
+    class is the most common tumor prediction among them.
+    """
+    if not results:
+        return {"prediction": None, "confidence": None, "slices_analyzed": 0}
+
+    classes = list(results[0]["probabilities"])
+    mean_probabilities = {
+        cls: sum(r["probabilities"][cls] for r in results) / len(results) for cls in classes
+    }
+    votes = Counter(r["prediction"] for r in results)
+    tumor_votes = Counter({cls: n for cls, n in votes.items() if cls != NO_TUMOR})
+    peak_slices = {
+        cls: max(results, key=lambda r: r["probabilities"][cls])["slice"] for cls in classes if cls != NO_TUMOR
+    }
+
+    if sum(tumor_votes.values()) >= min_tumor_slices:
+        prediction = tumor_votes.most_common(1)[0][0]
+        supporting = [r for r in results if r["prediction"] == prediction]
+        confidence = sum(r["confidence"] for r in supporting) / len(supporting)
+    else:
+        prediction = NO_TUMOR
+        confidence = mean_probabilities[NO_TUMOR]
+
+    return {
+        "prediction": prediction,
+        "confidence": confidence,
+        "slices_analyzed": len(results),
+        "slice_votes": dict(votes),
+        "tumor_slices": sum(tumor_votes.values()),
+        "mean_probabilities": mean_probabilities,
+        "peak_slices": peak_slices
+    }
+
+class VolumePredictionStream:
+    """
+    Runs a volume through the model a batch of slices at a time and renders
+    one NDJSON line per slice, then a STUDY line with the aggregate. Slices
+    are read lazily in a worker thread, so memory holds one batch of 2-D
+    slices whatever the volume's size.
+    """
+
+    def __init__(self, batch_size: int, timeout_s: Optional[float] = None, model_version: Optional[str] = None, skip_blank: float = 0.0):
+        self.batch_size = max(1, batch_size)
+        self.timeout_s = timeout_s
+        self.model_version = model_version
+        self.skip_blank = skip_blank
+        self.results: List[Dict] = []
+        self.errors = 0
+        self.skipped = 0
+
+    def _images(self, volume: Volume) -> Iterator[Tuple[int, Union[Image.Image, Exception, None]]]:
+        """(index, image) per slice: None for a skipped blank slice, the exception for an unreadable one."""
+        for index, pixels, low, high in volume.iter_slices():
+            if isinstance(pixels, Exception):
+                yield index, pixels
+            elif self.skip_blank and is_blank(pixels, low, high, self.skip_blank):
+                yield index, None
+            else:
+                yield index, slice_to_image(pixels, low, high)
+
+    async def stream(self, volume: Volume) -> AsyncIterator[str]:
+        yield json.dumps({"type": "VOLUME", **volume.describe()}) + "\n"
+
+        pending: List[Tuple[int, Image.Image]] = []
+        async for index, image in iterate_in_threadpool(self._images(volume)):
+            if isinstance(image, Exception):
+                self.errors += 1
+                yield json.dumps({"type": "ERROR", "slice": index, "error": f"Could not read slice: {image}"}) + "\n"
+                continue
+            if image is None:
+                self.skipped += 1
+                yield json.dumps({"type": "SKIPPED", "slice": index, "reason": "blank"}) + "\n"
+                continue
+            pending.append((index, image))
+            if len(pending) >= self.batch_size:
+                for line in await self._run_batch(pending):
+                    yield line
+                pending = []
+
+        if pending:
+            for line in await self._run_batch(pending):
+                yield line
+
+        study = aggregate_study(self.results, settings.VOLUME_MIN_TUMOR_SLICES)
+        yield json.dumps({
+            "type": "STUDY",
+            **study,
+            "slices": volume.num_slices,
+            "skipped": self.skipped,
+            "errors": self.errors,
+            "model_version": self.results[0]["model_version"] if self.results else None
+        }) + "\n"
+
+    async def _run_batch(self, batch: List[Tuple[int, Image.Image]]) -> List[str]:
+        try:
+            # Same queue bound and executor slots as bulk uploads and single requests
+            outputs = await prediction_batcher.submit_batch([image for _, image in batch], self.timeout_s, self.model_version)
+        except asyncio.TimeoutError:
+            outputs = [TimeoutError("Inference timed out")] * len(batch)
+        except Exception as e:
+            outputs = [e] * len(batch)
+
+        lines = []
+        for (index, _), output in zip(batch, outputs):
+            if isinstance(output, Exception):
+                self.errors += 1
+                lines.append(json.dumps({"type": "ERROR", "slice": index, "error": str(output)}) + "\n")
+            else:
+                self.results.append({"slice": index, **output})
+                lines.append(json.dumps({"type": "SLICE", "slice": index, "result": output}) + "\n")
+        return lines
+
+async def stream_volume_predictions(volume: Volume, path: str, model_version: Optional[str] = None) -> AsyncIterator[str]:
+    """NDJSON body for /api/predict/volume. Closes the volume and deletes its spooled file when done."""
+    try:
+        stream = VolumePredictionStream(
+            settings.INFERENCE_MAX_BATCH_SIZE,
+            settings.INFERENCE_TIMEOUT_S,
+            model_version,
+            skip_blank=settings.VOLUME_SKIP_BLANK_FRACTION
+        )
+        async for line in stream.stream(volume):
+            yield line
+    finally:
+        volume.close()
+        try:
+            os.remove(path)
+        except OSError:
+            pass
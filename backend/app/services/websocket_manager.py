@@ -1,26 +1,253 @@
-
-from typing import List
+import asyncio
+import json
+import time
+from collections import OrderedDict, deque
+from typing import Deque, Dict, List, Optional, Tuple, Union
 from fastapi import WebSocket
 
+from app.core.config import settings
+from app.services.fleet_viewport import Subscription
+
+try:
+    import orjson # Optional dependency
+except ImportError:
+    orjson = None
+
+Message = Union[dict, bytes] # JSON messages, or binary frames sent as they are
+
+FRAME_CACHE_SIZE = 8 # Recently encoded messages kept, for ones sent again (INIT_FLEET to clients joining together)
+
+def encode_json(message: dict) -> str:
+    """Compact JSON text as send_json would produce it; with orjson when installed, several times faster."""
+    if orjson is not None:
+        return orjson.dumps(message, option=orjson.OPT_SERIALIZE_NUMPY).decode()
+    return json.dumps(message, separators=(",", ":"), ensure_ascii=False)
+
+class ClientConnection:
+    """One websocket client: its outbound queue, the task draining it, and send stats."""
+
+    def __init__(self, websocket: WebSocket, encoding: str):
+        self.websocket = websocket
+        self.encoding = encoding
+        self.subscription: Optional[Subscription] = None # None: the whole fleet
+        self.queue: Deque[Tuple[float, Union[str, bytes], bool]] = deque() # (queued at, encoded message, replaceable)
+        self.ready = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+        self.connected_at = time.time()
+
+        # Stats
+        self.sent = 0
+        self.dropped = 0
+        self.lag_ms = 0.0 # Queue-to-sent time of the last message
+        self.max_lag_ms = 0.0
+        self.last_send_ms = 0.0
+
+    def get_stats(self) -> Dict:
+        client = self.websocket.client
+        oldest = (time.perf_counter() - self.queue[0][0]) * 1000 if self.queue else 0.0
+        return {
+            "client": f"{client.host}:{client.port}" if client else None,
+            "encoding": self.encoding,
+            "subscription": self.subscription is not None,
+            "connected_s": round(time.time() - self.connected_at, 1),
+            "queued": len(self.queue),
+            "oldest_queued_ms": round(oldest, 3),
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "lag_ms": round(self.lag_ms, 3),
+            "max_lag_ms": round(self.max_lag_ms, 3),
+            "last_send_ms": round(self.last_send_ms, 3)
+        }
+
 class ConnectionManager:
-    def __init__(self):
-        self.active_connections: List[WebSocket] = []
+    """
+    Fan-out to websocket clients. `broadcast` and `send` encode the message
+    to JSON once and only queue the text; each client has its own writer
+    task draining its queue, so a slow client never holds up the others.
+    Messages must not be changed after they are sent: a message sent again
+    (the same object) reuses its encoding.
+
+    A client whose queue reaches `max_queue` is a slow consumer. With the
+    "drop" policy its queued replaceable messages (fleet updates, superseded
+    by the newest) are discarded; delta clients see the seq gap and resync.
+    Under "drop" a replaceable message also replaces any still queued, so a
+    client never has more than one fleet update pending. With "disconnect"
+    it is closed. Clients whose send fails or takes longer
+    than `send_timeout_s` are removed.
+    """
+
+    def __init__(self, max_queue: int = 16, policy: str = "drop", send_timeout_s: float = 10.0):
+        if policy not in ("drop", "disconnect"):
+            raise ValueError(f"Unknown slow consumer policy: {policy}")
+        self.max_queue = max(1, max_queue)
+        self.policy = policy
+        self.send_timeout = send_timeout_s
+        self.clients: Dict[WebSocket, ClientConnection] = {}
+        self._frames: "OrderedDict[int, Tuple[dict, str]]" = OrderedDict() # id(message) -> (message, text)
+
+        # Stats
+        self.frames_encoded = 0
+        self.encode_ms = 0.0
+        self.bytes_encoded = 0
+        self.dropped = 0
+        self.slow_disconnects = 0
+        self.failed_sends = 0
 
-    async def connect(self, websocket: WebSocket):
+    @property
+    def active_connections(self) -> List[WebSocket]:
+        return list(self.clients)
+
+    async def connect(self, websocket: WebSocket, encoding: str = "full"):
         await websocket.accept()
-        self.active_connections.append(websocket)
-        print(f"Client connected. Active connections: {len(self.active_connections)}")
+        client = ClientConnection(websocket, encoding)
+        client.task = asyncio.create_task(self._writer(client))
+        self.clients[websocket] = client
+        print(f"Client connected ({encoding} updates). Active connections: {len(self.clients)}")
 
     def disconnect(self, websocket: WebSocket):
-        self.active_connections.remove(websocket)
-        print(f"Client disconnected. Active connections: {len(self.active_connections)}")
+        client = self.clients.pop(websocket, None)
+        if client is None:
+            return # Already removed by its writer
+        if client.task is not asyncio.current_task():
+            client.task.cancel()
+        print(f"Client disconnected. Active connections: {len(self.clients)}")
+
+    def count(self, encoding: str) -> int:
+        """Clients on the whole-fleet stream using `encoding`."""
+        return sum(1 for c in self.clients.values() if c.encoding == encoding and c.subscription is None)
+
+    def subscribe(self, websocket: WebSocket, subscription: Optional[Subscription]):
+        client = self.clients.get(websocket)
+        if client is not None:
+            client.subscription = subscription
+
+    def subscriptions(self) -> Dict[Tuple[Subscription, bool], List[WebSocket]]:
+        """Clients with a scoped subscription, grouped by identical subscription and whether they take binary frames."""
+        groups: Dict[Tuple[Subscription, bool], List[WebSocket]] = {}
+        for websocket, client in self.clients.items():
+            if client.subscription is not None:
+                groups.setdefault((client.subscription, client.encoding == "binary"), []).append(websocket)
+        return groups
+
+    def encode(self, message: Message) -> Union[str, bytes]:
+        """The message as JSON text, encoded once while it is among the last FRAME_CACHE_SIZE sent; bytes as they are."""
+        if isinstance(message, bytes):
+            return message
+        key = id(message)
+        cached = self._frames.get(key)
+        if cached is not None and cached[0] is message: # Holding the message keeps its id from being reused
+            self._frames.move_to_end(key)
+            return cached[1]
+        started = time.perf_counter()
+        frame = encode_json(message)
+        self.encode_ms += (time.perf_counter() - started) * 1000
+        self.frames_encoded += 1
+        self.bytes_encoded += len(frame)
+        self._frames[key] = (message, frame)
+        if len(self._frames) > FRAME_CACHE_SIZE:
+            self._frames.popitem(last=False)
+        return frame
+
+    def send(self, websocket: WebSocket, message: Message, replaceable: bool = False):
+        """Queues a message for one client, after anything already queued for it."""
+        client = self.clients.get(websocket)
+        if client is not None:
+            self._enqueue(client, self.encode(message), replaceable)
+
+    async def broadcast(self, message: Message, encoding: Optional[str] = None, replaceable: bool = False,
+                        unscoped: bool = False):
+        """
+        Queues a message for every client, or only those using `encoding`,
+        or (`unscoped`) only those on the whole-fleet stream. It is encoded
+        once for all of them.
+        """
+        clients = [c for c in self.clients.values()
+                   if (encoding is None or c.encoding == encoding) and not (unscoped and c.subscription is not None)]
+        self._enqueue_all(clients, message, replaceable)
 
-    async def broadcast(self, message: dict):
-        for connection in self.active_connections:
+    async def broadcast_to(self, websockets: List[WebSocket], message: Message, replaceable: bool = False):
+        """Queues a message, encoded once, for the given clients."""
+        clients = [self.clients[w] for w in websockets if w in self.clients]
+        self._enqueue_all(clients, message, replaceable)
+
+    def _enqueue_all(self, clients: List[ClientConnection], message: Message, replaceable: bool):
+        if not clients:
+            return
+        frame = self.encode(message)
+        for client in clients:
+            self._enqueue(client, frame, replaceable)
+
+    def _enqueue(self, client: ClientConnection, frame: Union[str, bytes], replaceable: bool):
+        # Under "drop", a replaceable frame supersedes any still waiting, so at
+        # most one fleet update is ever pending; a full queue drops them too
+        if self.policy == "drop" and (replaceable or len(client.queue) >= self.max_queue):
+            kept = deque(item for item in client.queue if not item[2])
+            dropped = len(client.queue) - len(kept)
+            if dropped:
+                client.queue = kept
+                client.dropped += dropped
+                self.dropped += dropped
+        if len(client.queue) >= self.max_queue:
+            self.slow_disconnects += 1
+            print(f"⚠️ Disconnecting slow dispatch client ({len(client.queue)} messages queued)")
+            self.disconnect(client.websocket)
+            asyncio.create_task(self._close(client.websocket))
+            return
+        client.queue.append((time.perf_counter(), frame, replaceable))
+        client.ready.set()
+
+    async def _writer(self, client: ClientConnection):
+        websocket = client.websocket
+        while True:
+            if not client.queue:
+                client.ready.clear()
+                await client.ready.wait()
+                continue
+            queued_at, frame, _ = client.queue.popleft()
+            started = time.perf_counter()
             try:
-                await connection.send_json(message)
+                send = websocket.send_bytes(frame) if isinstance(frame, bytes) else websocket.send_text(frame)
+                await asyncio.wait_for(send, self.send_timeout)
+            except asyncio.CancelledError:
+                raise
             except Exception as e:
-                print(f"Error broadcasting: {e}")
-                # Potentially remove dead connection?
+                self.failed_sends += 1
+                print(f"Error broadcasting: {e!r}; dropping client")
+                self.disconnect(websocket)
+                await self._close(websocket)
+                return
+            now = time.perf_counter()
+            client.sent += 1
+            client.last_send_ms = (now - started) * 1000
+            client.lag_ms = (now - queued_at) * 1000
+            client.max_lag_ms = max(client.max_lag_ms, client.lag_ms)
+
+    async def _close(self, websocket: WebSocket):
+        try:
+            await websocket.close(code=1013) # Try again later
+        except Exception:
+            pass # Already gone
+
+    def connection_stats(self) -> List[Dict]:
+        return [client.get_stats() for client in self.clients.values()]
+
+    def get_stats(self) -> Dict:
+        lags = [c.lag_ms for c in self.clients.values()]
+        return {
+            "connections": len(self.clients),
+            "subscribed": sum(1 for c in self.clients.values() if c.subscription is not None),
+            "policy": self.policy,
+            "max_queue": self.max_queue,
+            "queued": sum(len(c.queue) for c in self.clients.values()),
+            "max_lag_ms": round(max(lags), 3) if lags else 0.0,
+            "mean_lag_ms": round(sum(lags) / len(lags), 3) if lags else 0.0,
+            "dropped": self.dropped,
+            "slow_disconnects": self.slow_disconnects,
+            "failed_sends": self.failed_sends,
+            "encoder": "orjson" if orjson is not None else "json",
+            "frames_encoded": self.frames_encoded,
+            "bytes_encoded": self.bytes_encoded,
+            "avg_encode_ms": round(self.encode_ms / self.frames_encoded, 3) if self.frames_encoded else 0.0
+        }
 
-manager = ConnectionManager()
+manager = ConnectionManager(settings.DISPATCH_WS_QUEUE_SIZE, settings.DISPATCH_WS_SLOW_POLICY, settings.DISPATCH_WS_SEND_TIMEOUT_S)
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Batch assignment vs. per-request greedy dispatch for simultaneous ride
+requests.
+
+Scatters IDLE units over a Mumbai-sized area and drops a burst of requests
+around a few incident hot spots, then dispatches the same burst twice on
+identical fleets: once request by request to the nearest unit (the greedy
+path) and once through DispatchService.assign_batch. Reports total and
+per-request ETA, unassigned requests and solve time. With --check-pruning
+it also solves small bursts against every unit, to show that limiting each
+request to its nearest candidates loses nothing. Run from the backend
+directory:
+
+    python -m benchmarks.bench_assignment --sizes 50x500 200x2000 500x5000
+"""
+import argparse
+import json
+import random
+import sys
+import time
+from typing import Dict, List, Tuple
+
+from app.services.dispatch_service import DispatchService
+from app.services.spatial_index import CAPABILITIES
+from benchmarks.metrics import percentile
+
+CITY = (18.90, 19.30, 72.77, 73.05) # lat_min, lat_max, lng_min, lng_max
+
+def make_units(n: int, rng: random.Random) -> List[Tuple[str, str, str, float, float]]:
+    types = list(CAPABILITIES)
+    return [
+        (f"AMB-{i}", f"Unit-{i}", rng.choice(types), rng.uniform(CITY[0], CITY[1]), rng.uniform(CITY[2], CITY[3]))
+        for i in range(n)
+    ]
+
+def make_burst(n: int, hot_spots: int, spread_deg: float, rng: random.Random) -> List[Tuple[float, float, str]]:
+    centres = [(rng.uniform(CITY[0], CITY[1]), rng.uniform(CITY[2], CITY[3])) for _ in range(hot_spots)]
+    required = [None, None, "BLS", "ALS", "ICU"]
+    burst = []
+    for _ in range(n):
+        lat, lng = rng.choice(centres)
+        burst.append((rng.gauss(lat, spread_deg), rng.gauss(lng, spread_deg), rng.choice(required)))
+    return burst
+
+def fresh_service(units) -> DispatchService:
+    service = DispatchService(seed=0, seed_fleet=False, start=False, journal_dir="")
+    service.add_ambulances(units)
+    return service
+
+def summarize(name: str, etas: List[float], requests: int, elapsed_s: float) -> Dict:
+    return {
+        "path": name,
+        "assigned": len(etas),
+        "unassigned": requests - len(etas),
+        "total_eta_s": round(sum(etas), 1),
+        "mean_eta_s": round(sum(etas) / len(etas), 1) if etas else None,
+        "p95_eta_s": round(percentile(etas, 95), 1) if etas else None,
+        "max_eta_s": round(max(etas), 1) if etas else None,
+        "elapsed_ms": round(elapsed_s * 1000, 2),
+    }
+
+def run_greedy(units, burst) -> Dict:
+    service = fresh_service(units)
+    etas = []
+    started = time.perf_counter()
+    for lat, lng, required_type in burst:
+        assignment = service.dispatch_nearest(lat, lng, required_type)
+        if assignment:
+            etas.append(assignment["eta_s"])
+    return summarize("greedy", etas, len(burst), time.perf_counter() - started)
+
+def run_batch(units, burst, candidates: int) -> Dict:
+    service = fresh_service(units)
+    started = time.perf_counter()
+    results = service.assign_batch(burst, candidates)
+    elapsed = time.perf_counter() - started
+    row = summarize(f"batch(k={candidates})", [r["eta_s"] for r in results if r], len(burst), elapsed)
+    row["fallbacks"] = service.batch_stats["fallbacks"]
+    return row
+
+def main():
+    parser = argparse.ArgumentParser(description="Batch assignment vs greedy dispatch")
+    parser.add_argument("--sizes", nargs="+", default=["50x500", "200x2000", "500x5000"], help="REQUESTSxUNITS")
+    parser.add_argument("--hot-spots", type=int, default=3)
+    parser.add_argument("--spread-deg", type=float, default=0.01, help="Std-dev of requests around a hot spot")
+    parser.add_argument("--candidates", nargs="+", type=int, default=[8])
+    parser.add_argument("--check-pruning", action="store_true", help="Also solve against every unit (slow for large sizes)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    rows = []
+    for size in args.sizes:
+        requests, units = (int(x) for x in size.lower().split("x"))
+        fleet = make_units(units, rng)
+        burst = make_burst(requests, args.hot_spots, args.spread_deg, rng)
+        greedy = run_greedy(fleet, burst)
+        results = [greedy] + [run_batch(fleet, burst, k) for k in args.candidates]
+        if args.check_pruning:
+            results.append(run_batch(fleet, burst, units))
+        for row in results[1:]:
+            if row["assigned"] == greedy["assigned"] and greedy["total_eta_s"]:
+                row["eta_saved_pct"] = round(100 * (1 - row["total_eta_s"] / greedy["total_eta_s"]), 2)
+        rows.append({"requests": requests, "units": units, "results": results})
+        for row in results:
+            print(f"{size:<10} {row['path']:<14} total_eta={row['total_eta_s']}s mean={row['mean_eta_s']}s "
+                  f"p95={row['p95_eta_s']}s unassigned={row['unassigned']} {row['elapsed_ms']}ms"
+                  + (f" saved={row['eta_saved_pct']}%" if "eta_saved_pct" in row else ""), file=sys.stderr)
+
+    output = json.dumps({"hot_spots": args.hot_spots, "spread_deg": args.spread_deg, "results": rows}, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Compares the one-image /api/predict path against the micro-batching scheduler.
+
+Uses a randomly initialised BrainTumorViT so it runs without the trained
+checkpoint. Run from the backend directory:
+
+    python -m benchmarks.bench_batching --requests 64 --concurrency 16
+"""
+import argparse
+import asyncio
+import time
+
+import torch
+
+from app.ml.model import BrainTumorViT
+from app.services.inference_service import inference_service
+from app.services.batching_service import MicroBatcher
+from app.services.inference_executor import InferenceExecutor
+from benchmarks.metrics import latency_summary
+from benchmarks.synthetic import make_scan
+
+def summarize(name, latencies, wall):
+    return {
+        "path": name,
+        "images": len(latencies),
+        "images_per_sec": round(len(latencies) / wall, 2),
+        **latency_summary(latencies),
+    }
+
+def bench_single(images):
+    latencies = []
+    start = time.perf_counter()
+    for image in images:
+        t0 = time.perf_counter()
+        inference_service.predict(image)
+        latencies.append(time.perf_counter() - t0)
+    return summarize("single", latencies, time.perf_counter() - start)
+
+async def bench_batched(images, concurrency, max_batch_size, max_wait_ms):
+    executor = InferenceExecutor(mode="thread", max_workers=1)
+    batcher = MicroBatcher(
+        inference_service.predict_batch, executor,
+        max_batch_size=max_batch_size, max_wait_ms=max_wait_ms, max_queue=len(images)
+    )
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(image):
+        async with semaphore:
+            t0 = time.perf_counter()
+            await batcher.submit(image)
+            latencies.append(time.perf_counter() - t0)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(image) for image in images))
+    result = summarize(f"batched(max={max_batch_size})", latencies, time.perf_counter() - start)
+    result["avg_batch_size"] = batcher.get_stats()["avg_batch_size"]
+    executor.shutdown()
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--max-batch-size", type=int, default=8)
+    parser.add_argument("--max-wait-ms", type=float, default=10.0)
+    args = parser.parse_args()
+
+    torch.manual_seed(0)
+    inference_service.registry.register("bench", BrainTumorViT(num_classes=4).to(inference_service.device).eval())
+    images = [make_scan(i) for i in range(args.requests)]
+
+    # Warm-up so neither path pays for first-call allocation
+    inference_service.predict_batch(images[:2])
+
+    rows = [bench_single(images)]
+    rows.append(asyncio.run(bench_batched(images, args.concurrency, args.max_batch_size, args.max_wait_ms)))
+
+    for row in rows:
+        print(row)
+    print(f"Speedup: {rows[1]['images_per_sec'] / rows[0]['images_per_sec']:.2f}x")
+
+if __name__ == "__main__":
+    main()
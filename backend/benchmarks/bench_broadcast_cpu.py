@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+CPU per broadcast tick against the number of dispatch websocket clients.
+
+Broadcasts a full FLEET_UPDATE of a --units fleet to in-process clients
+for --ticks ticks and measures the process CPU time until every client has
+been handed its frame, for:
+
+    per_client   the previous fan-out: send_json encodes for every client
+    once_json    ConnectionManager, encoded once with the standard library
+    once_orjson  ConnectionManager, encoded once with orjson (if installed)
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_broadcast_cpu --units 2000 --clients 10 100 1000
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import sys
+import time
+from typing import Dict, List
+
+from app.services import websocket_manager
+from app.services.dispatch_scenario import Scenario
+from app.services.dispatch_service import DispatchService
+from app.services.websocket_manager import ConnectionManager
+
+class NullSocket:
+    """A client that takes frames instantly; send_json encodes like Starlette's."""
+
+    client = None
+
+    async def accept(self):
+        pass
+
+    async def send_json(self, message: Dict):
+        await self.send_text(json.dumps(message, separators=(",", ":"), ensure_ascii=False))
+
+    async def send_text(self, frame: str):
+        pass
+
+    async def close(self, code: int = 1000):
+        pass
+
+async def run(message: Dict, clients: int, ticks: int, mode: str) -> Dict:
+    sockets = [NullSocket() for _ in range(clients)]
+    manager = None
+    if mode != "per_client":
+        manager = ConnectionManager(max_queue=ticks + 1)
+        with contextlib.redirect_stdout(io.StringIO()):
+            for socket in sockets:
+                await manager.connect(socket)
+
+    cpu_ms: List[float] = []
+    for _ in range(ticks):
+        tick_message = dict(message) # A new message each tick, as the broadcast loop sends
+        started = time.process_time()
+        if manager:
+            await manager.broadcast(tick_message, replaceable=True)
+            while any(c.queue for c in manager.clients.values()):
+                await asyncio.sleep(0)
+        else:
+            for socket in sockets:
+                await socket.send_json(tick_message)
+        cpu_ms.append((time.process_time() - started) * 1000)
+
+    if manager:
+        for client in list(manager.clients.values()):
+            client.task.cancel()
+    cpu_ms.sort()
+    return {"mode": mode, "clients": clients, "cpu_ms_per_tick": round(sum(cpu_ms) / len(cpu_ms), 2),
+            "p95_cpu_ms": round(cpu_ms[int(0.95 * (len(cpu_ms) - 1))], 2)}
+
+def main():
+    parser = argparse.ArgumentParser(description="Broadcast CPU per tick vs client count")
+    parser.add_argument("--units", type=int, default=2000)
+    parser.add_argument("--clients", nargs="+", type=int, default=[10, 100, 1000])
+    parser.add_argument("--ticks", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="")
+    args = parser.parse_args()
+
+    service = DispatchService(seed=args.seed, seed_fleet=False, start=False, journal_dir="")
+    service.add_ambulances(Scenario.generate(args.units, 0, 1, seed=args.seed).units)
+    service.scheduler.run_ticks(1)
+    snapshot = service.snapshot
+    message = {"type": "FLEET_UPDATE", "data": snapshot.serialize(), "tick": snapshot.tick}
+    print(f"Frame: {len(json.dumps(message, separators=(',', ':')))} bytes", file=sys.stderr)
+
+    orjson = websocket_manager.orjson
+    modes = ["per_client", "once_json"] + (["once_orjson"] if orjson is not None else [])
+    results = []
+    for clients in args.clients:
+        for mode in modes:
+            websocket_manager.orjson = orjson if mode == "once_orjson" else None
+            row = asyncio.run(run(message, clients, args.ticks, mode))
+            results.append(row)
+            print(f"clients={clients:<6} {mode:<12} cpu/tick={row['cpu_ms_per_tick']}ms p95={row['p95_cpu_ms']}ms",
+                  file=sys.stderr)
+    websocket_manager.orjson = orjson
+
+    output = json.dumps({"units": args.units, "results": results}, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Dispatch simulation cost against fleet size.
+
+Queries: nearest and top-k IDLE ambulances with a capability filter, via
+the grid index behind DispatchService.find_nearest_ambulances vs. a linear
+haversine scan, checking that both return the same units.
+
+Ticks: one simulation step on the FleetStore arrays plus the grid rebuild
+and get_all_ambulances serialization, vs. the per-object Python loop the
+simulation used before.
+
+Scatters a synthetic fleet over a Mumbai-sized area, a share of it en route
+to random pickups. Run from the backend directory:
+
+    python -m benchmarks.bench_dispatch --fleet-sizes 100 1000 10000 100000
+"""
+import argparse
+import json
+import math
+import random
+import sys
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+from app.services.fleet_store import EN_ROUTE_TO_PICKUP, IDLE, FleetStore
+from app.services.spatial_index import CAPABILITIES, GridIndex, haversine_km, serving_types
+from benchmarks.metrics import latency_summary
+
+CITY = (18.90, 19.30, 72.77, 73.05) # lat_min, lat_max, lng_min, lng_max
+SPEED_DEG, JITTER_DEG = 0.0005, 0.0001
+
+def make_fleet(n: int, idle_share: float, rng: random.Random) -> FleetStore:
+    fleet = FleetStore()
+    types = list(CAPABILITIES)
+    for i in range(n):
+        row = fleet.add(f"AMB-{i}", f"Unit-{i}", rng.choice(types), rng.uniform(CITY[0], CITY[1]), rng.uniform(CITY[2], CITY[3]))
+        if rng.random() >= idle_share:
+            fleet.set_target(row, rng.uniform(CITY[0], CITY[1]), rng.uniform(CITY[2], CITY[3]))
+    return fleet
+
+def rebuild(index: GridIndex, fleet: FleetStore):
+    idle = np.flatnonzero(fleet.status == IDLE)
+    index.rebuild(idle, fleet.lat[idle], fleet.lng[idle])
+
+def linear_nearest(units: List[Tuple], lat: float, lng: float, k: int, types: Optional[Set[str]]) -> List[Tuple[str, float]]:
+    """What find_nearest_ambulance did before the index: a haversine for every unit."""
+    candidates = [
+        (haversine_km(lat, lng, ulat, ulng), uid)
+        for uid, ulat, ulng, utype, idle in units
+        if idle and (types is None or utype in types)
+    ]
+    candidates.sort()
+    return [(uid, d) for d, uid in candidates[:k]]
+
+def grid_nearest(index: GridIndex, fleet: FleetStore, lat: float, lng: float, k: int, types: Optional[Set[str]]):
+    allowed = None if types is None else fleet.type_mask(types)
+
+    def accept(rows):
+        mask = fleet.status[rows] == IDLE
+        return mask if allowed is None else mask & allowed[fleet.type_code[rows]]
+
+    return [(fleet.ids[row], d) for row, d in index.nearest(lat, lng, k, accept)]
+
+def time_queries(fn, queries) -> Tuple[List[float], list]:
+    latencies, results = [], []
+    for query in queries:
+        t0 = time.perf_counter()
+        results.append(fn(*query))
+        latencies.append(time.perf_counter() - t0)
+    return latencies, results
+
+def bench_queries(fleet: FleetStore, index: GridIndex, args, rng: random.Random) -> Dict:
+    units = [
+        (fleet.ids[i], float(fleet.lat[i]), float(fleet.lng[i]), fleet.types[i], fleet.status[i] == IDLE)
+        for i in range(len(fleet))
+    ]
+    required = [None, "BLS", "ALS", "ICU", "NEONATAL"]
+    queries = [
+        (rng.uniform(CITY[0], CITY[1]), rng.uniform(CITY[2], CITY[3]), k, serving_types(rng.choice(required)))
+        for k in args.k for _ in range(args.queries)
+    ]
+    linear_latencies, linear_results = time_queries(lambda *q: linear_nearest(units, *q), queries)
+    grid_latencies, grid_results = time_queries(lambda *q: grid_nearest(index, fleet, *q), queries)
+
+    result = {
+        "mismatches": sum([u for u, _ in a] != [u for u, _ in b] for a, b in zip(linear_results, grid_results))
+    }
+    for k in args.k:
+        picked = [i for i, q in enumerate(queries) if q[2] == k]
+        result[f"k{k}"] = {
+            "linear": latency_summary([linear_latencies[i] for i in picked]),
+            "grid": latency_summary([grid_latencies[i] for i in picked]),
+        }
+    return result
+
+class LegacyAmbulance:
+    def __init__(self, lat, lng, status, target):
+        self.lat, self.lng, self.status, self.target, self.heading = lat, lng, status, target, 0.0
+
+def legacy_tick(ambulances: List[LegacyAmbulance]):
+    """The per-object simulation step (and serialization) the service used before FleetStore."""
+    for amb in ambulances:
+        if amb.status == "EN_ROUTE_TO_PICKUP" and amb.target:
+            dy = amb.target[0] - amb.lat
+            dx = amb.target[1] - amb.lng
+            distance = math.sqrt(dx * dx + dy * dy)
+            if distance < SPEED_DEG:
+                amb.lat, amb.lng = amb.target
+                amb.status, amb.target = "ON_SCENE", None
+            else:
+                ratio = SPEED_DEG / distance
+                amb.lat += dy * ratio
+                amb.lng += dx * ratio
+                amb.heading = math.degrees(math.atan2(dx, dy))
+        elif amb.status == "IDLE":
+            amb.lat += random.uniform(-JITTER_DEG, JITTER_DEG)
+            amb.lng += random.uniform(-JITTER_DEG, JITTER_DEG)
+    return [{"status": a.status, "location": {"lat": a.lat, "lng": a.lng}, "heading": a.heading} for a in ambulances]
+
+def bench_ticks(fleet: FleetStore, index: GridIndex, ticks: int) -> Dict:
+    legacy = [
+        LegacyAmbulance(float(fleet.lat[i]), float(fleet.lng[i]),
+                        "EN_ROUTE_TO_PICKUP" if fleet.status[i] == EN_ROUTE_TO_PICKUP else "IDLE",
+                        (float(fleet.target_lat[i]), float(fleet.target_lng[i])) if fleet.status[i] == EN_ROUTE_TO_PICKUP else None)
+        for i in range(len(fleet))
+    ]
+    np_rng = np.random.default_rng(0)
+    timings = {"step": [], "rebuild": [], "serialize": [], "legacy": []}
+    for _ in range(ticks):
+        t0 = time.perf_counter()
+        fleet.step(np_rng, SPEED_DEG, JITTER_DEG)
+        t1 = time.perf_counter()
+        rebuild(index, fleet)
+        t2 = time.perf_counter()
+        fleet.serialize()
+        t3 = time.perf_counter()
+        legacy_tick(legacy)
+        t4 = time.perf_counter()
+        timings["step"].append(t1 - t0)
+        timings["rebuild"].append(t2 - t1)
+        timings["serialize"].append(t3 - t2)
+        timings["legacy"].append(t4 - t3)
+    return {name: latency_summary(values) for name, values in timings.items()}
+
+def main():
+    parser = argparse.ArgumentParser(description="Dispatch query and tick cost vs fleet size")
+    parser.add_argument("--fleet-sizes", nargs="+", type=int, default=[100, 1000, 10000, 100000])
+    parser.add_argument("--k", nargs="+", type=int, default=[1, 5])
+    parser.add_argument("--queries", type=int, default=200, help="Queries per k and fleet size")
+    parser.add_argument("--ticks", type=int, default=20, help="Simulation ticks per fleet size")
+    parser.add_argument("--idle-share", type=float, default=0.7)
+    parser.add_argument("--cell-km", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    rows = []
+    for n in args.fleet_sizes:
+        fleet = make_fleet(n, args.idle_share, rng)
+        index = GridIndex(args.cell_km)
+        rebuild(index, fleet)
+        row = {"fleet": n, "index": index.get_stats(), **bench_queries(fleet, index, args, rng), "tick": bench_ticks(fleet, index, args.ticks)}
+        rows.append(row)
+        query, tick = row[f"k{args.k[0]}"], row["tick"]
+        print(f"fleet={n:<7} query p50 linear={query['linear']['p50_ms']}ms grid={query['grid']['p50_ms']}ms | "
+              f"tick p50 legacy={tick['legacy']['p50_ms']}ms step={tick['step']['p50_ms']}ms "
+              f"rebuild={tick['rebuild']['p50_ms']}ms serialize={tick['serialize']['p50_ms']}ms | "
+              f"mismatches={row['mismatches']}", file=sys.stderr)
+
+    output = json.dumps({"cell_km": args.cell_km, "results": rows}, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    if any(row["mismatches"] for row in rows):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Broadcast latency to many dispatch websocket clients when a few are slow.
+
+Connects --clients in-process sockets to a ConnectionManager, --slow of
+which take --slow-ms per send, and broadcasts --frames fleet updates
+--interval-ms apart. Reports how long after each broadcast the fast
+clients received it, and how long the broadcast call itself took, for the
+previous fan-out (await each send in turn) and the queued one, under each
+slow consumer policy. Run from the backend directory:
+
+    python -m benchmarks.bench_fanout --clients 1000 5000 --slow 10
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import sys
+import time
+from typing import Dict, List
+
+from app.services.websocket_manager import ConnectionManager
+from benchmarks.metrics import latency_summary
+
+class BenchSocket:
+    """Stands in for a client: takes messages like a Starlette WebSocket and records delivery latency."""
+
+    client = None
+
+    def __init__(self, delay_s: float, latencies: List[float], sent_at: Dict[int, float]):
+        self.delay = delay_s
+        self.latencies = latencies
+        self.sent_at = sent_at # Broadcast time by seq
+
+    async def accept(self):
+        pass
+
+    async def send_json(self, message: Dict):
+        await self.send_text(json.dumps(message, separators=(",", ":"), ensure_ascii=False))
+
+    async def send_text(self, frame: str):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+            return
+        start = frame.index('"seq":') + 6
+        seq = int(frame[start:frame.index(",", start)])
+        self.latencies.append(time.perf_counter() - self.sent_at[seq])
+
+    async def close(self, code: int = 1000):
+        pass
+
+async def sequential_broadcast(sockets: List[BenchSocket], message: Dict):
+    # The previous ConnectionManager.broadcast
+    for socket in sockets:
+        try:
+            await socket.send_json(message)
+        except Exception as e:
+            print(f"Error broadcasting: {e}")
+
+async def run(clients: int, slow: int, slow_ms: float, frames: int, interval_ms: float, units: int, policy: str) -> Dict:
+    latencies: List[float] = []
+    sent_at: Dict[int, float] = {}
+    sockets = [BenchSocket(slow_ms / 1000 if i < slow else 0.0, latencies, sent_at) for i in range(clients)]
+    payload = [{"id": f"AMB-{i}", "location": {"lat": 19.07601, "lng": 72.87765}} for i in range(units)]
+    manager = ConnectionManager(max_queue=16, policy=policy) if policy != "sequential" else None
+    if manager:
+        with contextlib.redirect_stdout(io.StringIO()):
+            for socket in sockets:
+                await manager.connect(socket)
+
+    call_times = []
+    started = time.perf_counter()
+    for seq in range(frames):
+        message = {"type": "FLEET_UPDATE", "seq": seq, "changes": payload}
+        call_started = sent_at[seq] = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            if manager:
+                await manager.broadcast(message, replaceable=True)
+            else:
+                await sequential_broadcast(sockets, message)
+        call_times.append(time.perf_counter() - call_started)
+        await asyncio.sleep(max(0.0, started + (seq + 1) * interval_ms / 1000 - time.perf_counter()))
+    expected = (clients - slow) * frames
+    deadline = time.perf_counter() + 5.0
+    while len(latencies) < expected and time.perf_counter() < deadline:
+        await asyncio.sleep(0.05) # Let the queues drain
+
+    result = {"policy": policy, "clients": clients, "slow": slow, "delivered": len(latencies),
+              "expected": expected, "fast_client_latency": latency_summary(latencies),
+              "broadcast_call": latency_summary(call_times)}
+    if manager:
+        stats = manager.get_stats()
+        result.update(dropped=stats["dropped"], slow_disconnects=stats["slow_disconnects"])
+        for client in list(manager.clients.values()):
+            client.task.cancel()
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description="Websocket fan-out latency with slow clients")
+    parser.add_argument("--clients", nargs="+", type=int, default=[1000])
+    parser.add_argument("--slow", type=int, default=10, help="Clients that are slow to receive")
+    parser.add_argument("--slow-ms", type=float, default=200.0, help="Time a slow client takes per message")
+    parser.add_argument("--frames", type=int, default=10)
+    parser.add_argument("--interval-ms", type=float, default=1000.0, help="Time between broadcasts (the live loop runs at 1 Hz)")
+    parser.add_argument("--units", type=int, default=50, help="Units per fleet update")
+    parser.add_argument("--policies", nargs="+", default=["sequential", "drop", "disconnect"],
+                        choices=["sequential", "drop", "disconnect"])
+    parser.add_argument("--output", default="")
+    args = parser.parse_args()
+
+    results = []
+    for clients in args.clients:
+        for policy in args.policies:
+            row = asyncio.run(run(clients, args.slow, args.slow_ms, args.frames, args.interval_ms, args.units, policy))
+            results.append(row)
+            latency = row["fast_client_latency"]
+            print(f"clients={clients:<6} {policy:<10} fast p50={latency['p50_ms']}ms p99={latency['p99_ms']}ms "
+                  f"broadcast p99={row['broadcast_call']['p99_ms']}ms delivered={row['delivered']}/{row['expected']}",
+                  file=sys.stderr)
+
+    output = json.dumps({"results": results}, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+
+if __name__ == "__main__":
+    main()
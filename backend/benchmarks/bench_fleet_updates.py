@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Bytes per tick of the dispatch websocket's FLEET_UPDATE: the full fleet
+every tick, against delta frames (FleetDeltaEncoder) at each --precision.
+
+Runs a seeded fleet for --ticks ticks with dispatches and releases
+flowing, encodes every tick both ways exactly as the websocket sends them,
+and reports frame sizes (keyframes and deltas together), the time to build
+and encode a frame, and how many units a delta frame carries. Run from the
+backend directory:
+
+    python -m benchmarks.bench_fleet_updates --units 2000 --ticks 300 --precision 4 5
+"""
+import argparse
+import json
+import sys
+import time
+from typing import Dict, List
+
+import numpy as np
+
+from app.services.dispatch_scenario import Scenario
+from app.services.dispatch_service import DispatchService
+from app.services.fleet_delta import FleetDeltaEncoder
+from app.services.fleet_store import ON_SCENE
+from benchmarks.metrics import latency_summary
+
+def wire_bytes(message: Dict) -> int:
+    # What Starlette's send_json puts on the wire
+    return len(json.dumps(message, separators=(",", ":"), ensure_ascii=False).encode())
+
+def summary(sizes: List[int]) -> Dict:
+    array = np.asarray(sizes)
+    return {"mean_bytes": int(array.mean()), "p50_bytes": int(np.percentile(array, 50)), "max_bytes": int(array.max())}
+
+def main():
+    parser = argparse.ArgumentParser(description="FLEET_UPDATE bytes per tick, full vs delta")
+    parser.add_argument("--units", type=int, default=2000)
+    parser.add_argument("--ticks", type=int, default=300)
+    parser.add_argument("--rate", type=float, default=1.0, help="Dispatches per tick")
+    parser.add_argument("--precision", nargs="+", type=int, default=[5], help="Coordinate decimals to compare")
+    parser.add_argument("--keyframe-interval", type=int, default=30)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="")
+    args = parser.parse_args()
+
+    units = Scenario.generate(args.units, 0, 1, seed=args.seed).units
+    service = DispatchService(seed=args.seed, seed_fleet=False, start=False, journal_dir="")
+    service.add_ambulances(units)
+    encoders = {p: FleetDeltaEncoder(p, args.keyframe_interval) for p in args.precision}
+    rng = np.random.default_rng(args.seed)
+    lat = np.array([u[3] for u in units])
+    lng = np.array([u[4] for u in units])
+    on_scene_since = np.full(len(units), -1)
+
+    full_sizes, full_times = [], []
+    delta_sizes = {p: [] for p in encoders}
+    delta_times = {p: [] for p in encoders}
+    for tick in range(args.ticks):
+        for _ in range(rng.poisson(args.rate)):
+            i = int(rng.integers(len(units)))
+            service.dispatch_nearest(float(lat[i]), float(lng[i]))
+        service.scheduler.run_ticks(1)
+        status = service.fleet.status
+        on_scene_since[(status == ON_SCENE) & (on_scene_since < 0)] = tick
+        for row in np.flatnonzero((on_scene_since >= 0) & (tick - on_scene_since >= 30)).tolist():
+            service.complete_ride(service.fleet.ids[row])
+            on_scene_since[row] = -1
+
+        snapshot = service.snapshot
+        started = time.perf_counter()
+        full_sizes.append(wire_bytes({"type": "FLEET_UPDATE", "data": snapshot.serialize(), "tick": snapshot.tick}))
+        full_times.append(time.perf_counter() - started)
+        for p, encoder in encoders.items():
+            started = time.perf_counter()
+            delta_sizes[p].append(wire_bytes(encoder.encode(snapshot)))
+            delta_times[p].append(time.perf_counter() - started)
+
+    results = {"units": args.units, "ticks": args.ticks, "keyframe_interval": args.keyframe_interval,
+               "full": {**summary(full_sizes), "encode": latency_summary(full_times)}, "delta": []}
+    print(f"full          mean={results['full']['mean_bytes']:>9} B/tick", file=sys.stderr)
+    for p, encoder in encoders.items():
+        row = {"precision": p, **summary(delta_sizes[p]), "encode": latency_summary(delta_times[p]),
+               "ratio": round(float(np.mean(delta_sizes[p]) / np.mean(full_sizes)), 3), **encoder.get_stats()}
+        results["delta"].append(row)
+        print(f"delta p={p:<4} mean={row['mean_bytes']:>9} B/tick ({row['ratio']:.1%} of full) "
+              f"units/frame={row['avg_units_per_frame']}", file=sys.stderr)
+
+    output = json.dumps(results, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Cost of the fleet journal: tick overhead while logging, and recovery time
+as the history grows.
+
+Runs a seeded scenario's fleet for --ticks ticks with dispatches and
+releases flowing, with and without a journal, and compares tick time.
+Then, for each --history length, runs that many ticks into a fresh journal
+and times how long a new DispatchService takes to recover from it, with
+periodic snapshots and with none (the whole log replayed). Run from the
+backend directory:
+
+    python -m benchmarks.bench_journal --units 10000 --history 600 3600 14400
+"""
+import argparse
+import json
+import shutil
+import sys
+import tempfile
+import time
+from typing import Dict, Optional
+
+import numpy as np
+
+from app.services.dispatch_scenario import Scenario
+from app.services.dispatch_service import DispatchService
+from app.services.fleet_store import ON_SCENE
+from benchmarks.metrics import latency_summary
+
+def drive(units, ticks: int, rate: float, journal_dir: str, snapshot_every: Optional[int], seed: int) -> Dict:
+    """Runs `ticks` ticks with `rate` dispatches per tick; ON_SCENE units are released after 30 ticks."""
+    service = DispatchService(seed=seed, seed_fleet=False, start=False, journal_dir=journal_dir)
+    if snapshot_every is not None:
+        service.snapshot_every = snapshot_every
+    service.add_ambulances(units)
+    rng = np.random.default_rng(seed)
+    lat = np.array([u[3] for u in units])
+    lng = np.array([u[4] for u in units])
+    on_scene_since = np.full(len(units), -1)
+    tick_times = []
+    for tick in range(ticks):
+        for _ in range(rng.poisson(rate)):
+            i = int(rng.integers(len(units)))
+            service.dispatch_nearest(float(lat[i]), float(lng[i]))
+        started = time.perf_counter()
+        service.scheduler.run_ticks(1)
+        tick_times.append(time.perf_counter() - started)
+        status = service.fleet.status
+        on_scene_since[(status == ON_SCENE) & (on_scene_since < 0)] = tick
+        for row in np.flatnonzero((on_scene_since >= 0) & (tick - on_scene_since >= 30)).tolist():
+            service.complete_ride(service.fleet.ids[row])
+            on_scene_since[row] = -1
+    if service.journal is not None:
+        service.journal.flush() # Simulated crash: flushed, but no final snapshot
+        stats = service.journal.get_stats()
+        service.journal.close()
+    else:
+        stats = None
+    return {"tick": latency_summary(tick_times), "journal": stats}
+
+def recover(journal_dir: str, seed: int) -> Dict:
+    started = time.perf_counter()
+    service = DispatchService(seed=seed, seed_fleet=False, start=False, journal_dir=journal_dir)
+    elapsed = time.perf_counter() - started
+    recovery = dict(service.journal.recovery)
+    service.journal.close()
+    return {"recover_ms": round(elapsed * 1000, 1), **recovery, "units": len(service.fleet)}
+
+def main():
+    parser = argparse.ArgumentParser(description="Fleet journal overhead and recovery time")
+    parser.add_argument("--units", type=int, default=10000)
+    parser.add_argument("--ticks", type=int, default=300, help="Ticks for the overhead comparison")
+    parser.add_argument("--rate", type=float, default=2.0, help="Dispatches per tick")
+    parser.add_argument("--history", nargs="+", type=int, default=[600, 3600], help="Ticks of history before recovery")
+    parser.add_argument("--snapshot-every", type=int, default=60, help="Ticks between snapshots")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="")
+    args = parser.parse_args()
+
+    units = Scenario.generate(args.units, 0, 1, seed=args.seed).units
+    results = {"units": args.units, "rate": args.rate}
+    work = tempfile.mkdtemp(prefix="fleet-journal-")
+    try:
+        plain = drive(units, args.ticks, args.rate, "", None, args.seed)
+        logged = drive(units, args.ticks, args.rate, f"{work}/overhead", args.snapshot_every, args.seed)
+        results["overhead"] = {"without_journal": plain["tick"], "with_journal": logged["tick"], "journal": logged["journal"]}
+        print(f"tick p50 without journal={plain['tick']['p50_ms']}ms with={logged['tick']['p50_ms']}ms "
+              f"(mean {plain['tick']['mean_ms']} vs {logged['tick']['mean_ms']}ms)", file=sys.stderr)
+
+        results["recovery"] = []
+        for history in args.history:
+            for label, every in (("snapshots", args.snapshot_every), ("log_only", 10 ** 9)):
+                directory = f"{work}/{label}-{history}"
+                drive(units, history, args.rate, directory, every, args.seed)
+                row = {"history_ticks": history, "mode": label, **recover(directory, args.seed)}
+                results["recovery"].append(row)
+                print(f"history={history:<6} {label:<9} recover={row['recover_ms']}ms "
+                      f"events_replayed={row['events_replayed']}", file=sys.stderr)
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+    output = json.dumps(results, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+
+if __name__ == "__main__":
+    main()
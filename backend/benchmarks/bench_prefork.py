@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+Per-worker memory and throughput of serve_prefork.py for 1..N workers.
+
+Starts the server at each worker count, drives /api/predict with concurrent
+clients, and reads every worker's RSS, PSS and USS from /proc. PSS splits
+shared pages between the processes mapping them, so total PSS is the real
+memory cost of the fleet; USS is what each worker holds privately. Run from
+the backend directory (Linux only):
+
+    python -m benchmarks.bench_prefork --max-workers 4 --duration 20
+
+Pass --modes prefork uvicorn to compare against `uvicorn --workers N`,
+where every worker loads its own copy of the model.
+"""
+import argparse
+import http.client
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional
+
+from benchmarks.metrics import latency_summary
+from benchmarks.synthetic import make_scan
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def multipart_body(image: bytes, boundary: str) -> bytes:
+    return (
+        f"--{boundary}\r\n"
+        'Content-Disposition: form-data; name="file"; filename="scan.jpg"\r\n'
+        "Content-Type: image/jpeg\r\n\r\n"
+    ).encode() + image + f"\r\n--{boundary}--\r\n".encode()
+
+def request(port: int, method: str, path: str, body: Optional[bytes] = None, headers: Optional[Dict] = None, timeout: float = 120):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=timeout)
+    try:
+        conn.request(method, path, body=body, headers=headers or {})
+        response = conn.getresponse()
+        return response.status, response.read()
+    finally:
+        conn.close()
+
+def child_pids(pid: int) -> List[int]:
+    children = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # The command name may contain spaces; ppid is the second field after it
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+            with open(f"/proc/{entry}/cmdline", "rb") as f:
+                cmdline = f.read()
+        except (OSError, IndexError, ValueError):
+            continue
+        if ppid == pid and b"resource_tracker" not in cmdline:
+            children.append(int(entry))
+    return sorted(children)
+
+def memory_mb(pid: int) -> Dict[str, float]:
+    fields = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 3 and parts[2] == "kB":
+                fields[parts[0].rstrip(":")] = int(parts[1]) / 1024
+    return {
+        "rss_mb": round(fields.get("Rss", 0.0), 1),
+        "pss_mb": round(fields.get("Pss", 0.0), 1),
+        "uss_mb": round(fields.get("Private_Clean", 0.0) + fields.get("Private_Dirty", 0.0), 1),
+    }
+
+def start_server(mode: str, workers: int, port: int, env: Dict) -> subprocess.Popen:
+    if mode == "prefork":
+        cmd = [sys.executable, "serve_prefork.py", "--workers", str(workers), "--host", "127.0.0.1", "--port", str(port)]
+    else:
+        cmd = [sys.executable, "-m", "uvicorn", "app.main:app", "--workers", str(workers),
+               "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"]
+    return subprocess.Popen(cmd, cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+def wait_ready(port: int, server: subprocess.Popen, workers: int, children: int, timeout: float):
+    """Waits for the worker processes to exist and for readiness to hold across several probes."""
+    deadline = time.time() + timeout
+    streak = 0
+    while time.time() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"Server exited with code {server.returncode}")
+        try:
+            status, _ = request(port, "GET", "/api/health/ready", timeout=5)
+        except OSError:
+            status = None
+        streak = streak + 1 if status == 200 and len(child_pids(server.pid)) >= children else 0
+        if streak >= workers * 3:
+            return
+        time.sleep(0.5)
+    raise TimeoutError("Server did not become ready")
+
+def drive_load(port: int, images: List[bytes], concurrency: int, duration: float) -> Dict:
+    boundary = uuid.uuid4().hex
+    bodies = [multipart_body(image, boundary) for image in images]
+    headers = {"Content-Type": f"multipart/form-data; boundary={boundary}"}
+    latencies: List[float] = []
+    errors = [0]
+    lock = threading.Lock()
+    stop_at = time.perf_counter() + duration
+
+    def client(offset: int):
+        i = offset
+        while time.perf_counter() < stop_at:
+            t0 = time.perf_counter()
+            try:
+                status, _ = request(port, "POST", "/api/predict", bodies[i % len(bodies)], headers)
+            except OSError:
+                status = None
+            with lock:
+                if status == 200:
+                    latencies.append(time.perf_counter() - t0)
+                else:
+                    errors[0] += 1
+            i += concurrency
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - started
+
+    result = {"requests": len(latencies), "errors": errors[0], "images_per_sec": round(len(latencies) / wall, 2)}
+    if latencies:
+        result["latency"] = latency_summary(latencies)
+    return result
+
+def run(mode: str, workers: int, args, images: List[bytes]) -> Dict:
+    port = free_port()
+    env = dict(os.environ, PYTHONPATH=BACKEND_DIR)
+    # Every request must reach the model, not the cache
+    env["PREDICTION_CACHE_ENABLED"] = "false"
+    # A single uvicorn worker serves from the supervisor process itself
+    forks = mode == "prefork" or workers > 1
+    server = start_server(mode, workers, port, env)
+    try:
+        wait_ready(port, server, workers, workers if forks else 0, args.startup_timeout)
+        load = drive_load(port, images, args.concurrency, args.duration)
+        pids = child_pids(server.pid) if forks else [server.pid]
+        per_worker = [dict(pid=pid, **memory_mb(pid)) for pid in pids]
+        parent = memory_mb(server.pid)
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            server.kill()
+
+    total_pss = sum(w["pss_mb"] for w in per_worker) + (parent["pss_mb"] if forks else 0)
+    return {
+        "mode": mode,
+        "workers": workers,
+        **load,
+        "parent": parent,
+        "per_worker": per_worker,
+        "total_pss_mb": round(total_pss, 1),
+        "avg_worker_uss_mb": round(sum(w["uss_mb"] for w in per_worker) / max(1, len(per_worker)), 1),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Memory and throughput of pre-forked workers")
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--modes", nargs="+", default=["prefork"], choices=["prefork", "uvicorn"])
+    parser.add_argument("--concurrency", type=int, default=0, help="Concurrent clients (default: 4 per worker)")
+    parser.add_argument("--duration", type=float, default=20.0, help="Seconds of load per configuration")
+    parser.add_argument("--num-images", type=int, default=32)
+    parser.add_argument("--startup-timeout", type=float, default=300.0)
+    parser.add_argument("--output", default="")
+    args = parser.parse_args()
+
+    images = [make_scan(i) for i in range(args.num_images)]
+    rows = []
+    for mode in args.modes:
+        for workers in range(1, args.max_workers + 1):
+            config = argparse.Namespace(**vars(args))
+            config.concurrency = args.concurrency or 4 * workers
+            try:
+                row = run(mode, workers, config, images)
+            except Exception as e:
+                row = {"mode": mode, "workers": workers, "error": str(e)}
+                print(f"❌ {mode} x{workers}: {e}", file=sys.stderr)
+            else:
+                print(f"{mode:8} workers={workers:<2} {row['images_per_sec']} img/s "
+                      f"total_pss={row['total_pss_mb']}MB avg_uss={row['avg_worker_uss_mb']}MB", file=sys.stderr)
+            rows.append(row)
+
+    report = {"cpu_count": os.cpu_count(), "duration_s": args.duration, "results": rows}
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+
+if __name__ == "__main__":
+    main()
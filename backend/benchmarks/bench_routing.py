@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Road routing latency at city scale.
+
+Loads a road graph built by build_road_graph.py (--graph), or generates a
+synthetic street grid (--grid ROWS, ~120 m blocks; 300 is about a
+36 x 36 km city of 90k junctions) and adds landmarks to it. Then times
+point-to-point queries three ways, checking that all agree on the travel
+time: plain Dijkstra, A* with a straight-line heuristic, and A* with ALT
+landmarks (what RoadRouter uses when the graph has them). Also reports the
+LRU route cache on a skewed query mix, and the one-to-many ETA query
+dispatch uses to rank candidates against one A* per candidate. Run from
+the backend directory:
+
+    python -m benchmarks.bench_routing --grid 300 --queries 200
+"""
+import argparse
+import heapq
+import json
+import math
+import sys
+import time
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from app.services.road_network import RoadGraph, RoadRouter, add_landmarks
+from benchmarks.metrics import latency_summary
+from benchmarks.synthetic import make_road_grid
+
+def dijkstra_to(forward, source: int, target: int) -> Tuple[float, int]:
+    """Travel time source -> target with an early exit, and the nodes settled."""
+    indptr, indices, travel, _ = forward
+    dist = {source: 0.0}
+    heap = [(0.0, source)]
+    settled = 0
+    while heap:
+        d, u = heapq.heappop(heap)
+        if d > dist[u]:
+            continue
+        settled += 1
+        if u == target:
+            return d, settled
+        for e in range(indptr[u], indptr[u + 1]):
+            v = indices[e]
+            nd = d + travel[e]
+            if nd < dist.get(v, math.inf):
+                dist[v] = nd
+                heapq.heappush(heap, (nd, v))
+    return math.inf, settled
+
+def time_queries(name: str, run, pairs: List[Tuple[int, int]]) -> Tuple[Dict, List[float]]:
+    latencies, seconds, settled = [], [], []
+    for source, target in pairs:
+        started = time.perf_counter()
+        result, nodes = run(source, target)
+        latencies.append(time.perf_counter() - started)
+        seconds.append(result)
+        settled.append(nodes)
+    return {"method": name, **latency_summary(latencies), "avg_settled_nodes": round(float(np.mean(settled)), 1)}, seconds
+
+def router_query(router: RoadRouter):
+    def run(source: int, target: int):
+        before = router.settled
+        route = router._astar(source, target)
+        return (route.seconds if route else math.inf), router.settled - before
+    return run
+
+def main():
+    parser = argparse.ArgumentParser(description="Road routing latency")
+    parser.add_argument("--graph", default="", help=".npz from build_road_graph.py (default: synthetic grid)")
+    parser.add_argument("--grid", type=int, default=200, help="Rows and columns of the synthetic grid")
+    parser.add_argument("--landmarks", type=int, default=16, help="Landmarks to add when the graph has none")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--local-km", type=float, default=5.0, help="Max straight-line length of the dispatch-like queries")
+    parser.add_argument("--candidates", type=int, default=8, help="Units ranked per pickup in the one-to-many test")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    if args.graph:
+        graph = RoadGraph.load(args.graph)
+    else:
+        graph = make_road_grid(args.grid, args.grid, seed=args.seed)
+    load_s = time.perf_counter() - started
+    started = time.perf_counter()
+    if graph.landmarks is None and args.landmarks:
+        add_landmarks(graph, args.landmarks, seed=args.seed)
+    landmark_s = time.perf_counter() - started
+    print(f"Graph: {graph.num_nodes} nodes, {graph.num_edges} edges (built in {load_s:.1f}s, "
+          f"landmarks in {landmark_s:.1f}s)", file=sys.stderr)
+
+    alt = RoadRouter(graph)
+    plain = RoadRouter(RoadGraph(graph.node_lat, graph.node_lng, graph.indptr, graph.indices, graph.travel_s, graph.length_m))
+    rng = np.random.default_rng(args.seed)
+
+    # City-wide pairs, and dispatch-like ones: a pickup and a unit a few km away
+    random_pairs = [tuple(int(x) for x in rng.integers(graph.num_nodes, size=2)) for _ in range(args.queries)]
+    local_pairs = []
+    while len(local_pairs) < args.queries:
+        source = int(rng.integers(graph.num_nodes))
+        lat = graph.node_lat[source] + rng.uniform(-1, 1) * args.local_km / 111.0 / math.sqrt(2)
+        lng = graph.node_lng[source] + rng.uniform(-1, 1) * args.local_km / 111.0 / math.sqrt(2)
+        local_pairs.append((source, alt.snap(lat, lng)[0]))
+
+    results = {"nodes": graph.num_nodes, "edges": graph.num_edges, "landmarks": int(len(graph.landmarks)) if graph.landmarks is not None else 0,
+               "landmark_build_s": round(landmark_s, 2), "queries": {}}
+    for label, pairs in (("city_wide", random_pairs), (f"within_{args.local_km:g}km", local_pairs)):
+        rows = []
+        reference = None
+        for name, run in (("dijkstra", lambda s, t: dijkstra_to(alt._forward, s, t)),
+                          ("astar_straight_line", router_query(plain)),
+                          ("astar_alt", router_query(alt))):
+            row, seconds = time_queries(name, run, pairs)
+            if reference is None:
+                reference = seconds
+            row["mismatches"] = sum(abs(a - b) > 1e-3 * max(1.0, a) for a, b in zip(reference, seconds))
+            rows.append(row)
+            print(f"{label:<14} {name:<20} p50={row['p50_ms']}ms p95={row['p95_ms']}ms "
+                  f"settled={row['avg_settled_nodes']} mismatches={row['mismatches']}", file=sys.stderr)
+        results["queries"][label] = rows
+
+    # LRU cache: dispatch traffic repeats origin/destination pairs (stations, hospitals, hot spots)
+    router = RoadRouter(graph, cache_size=max(1, args.queries // 2))
+    hot = local_pairs[:max(1, args.queries // 4)]
+    mix = [hot[min(len(hot) - 1, int(rng.pareto(1.2)))] for _ in range(args.queries * 4)]
+    latencies = []
+    for source, target in mix:
+        started = time.perf_counter()
+        router.route_nodes(source, target)
+        latencies.append(time.perf_counter() - started)
+    results["cache"] = {**latency_summary(latencies), "hit_rate": router.get_stats()["cache_hit_rate"]}
+    print(f"cache          p50={results['cache']['p50_ms']}ms hit_rate={results['cache']['hit_rate']}", file=sys.stderr)
+
+    # Ranking candidate units for one pickup: one reverse search vs one A* per unit
+    one_to_many, per_unit = [], []
+    for _, pickup in local_pairs[:max(1, args.queries // 4)]:
+        lat, lng = graph.node_lat[pickup], graph.node_lng[pickup]
+        units = rng.integers(graph.num_nodes, size=args.candidates)
+        units = np.array([alt.snap(lat + rng.uniform(-0.02, 0.02), lng + rng.uniform(-0.02, 0.02))[0] for _ in units])
+        started = time.perf_counter()
+        alt.etas_to(lat, lng, graph.node_lat[units], graph.node_lng[units])
+        one_to_many.append(time.perf_counter() - started)
+        started = time.perf_counter()
+        for unit in units:
+            alt._astar(int(unit), int(pickup))
+        per_unit.append(time.perf_counter() - started)
+    results["rank_candidates"] = {"candidates": args.candidates, "reverse_search": latency_summary(one_to_many),
+                                  "astar_per_unit": latency_summary(per_unit)}
+    print(f"rank {args.candidates} units  reverse search p50={results['rank_candidates']['reverse_search']['p50_ms']}ms "
+          f"vs A* per unit p50={results['rank_candidates']['astar_per_unit']['p50_ms']}ms", file=sys.stderr)
+
+    output = json.dumps(results, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+
+if __name__ == "__main__":
+    main()
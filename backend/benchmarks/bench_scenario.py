@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Replays a dispatch scenario headlessly and reports how dispatch performed.
+
+Generates a seeded scenario (N units, M requests/s around incident hot
+spots; the same seed gives the same scenario), or loads one saved with
+--save or recorded from live traffic with DISPATCH_RECORD_PATH. Then runs
+it through a fresh DispatchService in simulated time, once per --modes
+entry, and reports assignment latency, tick time, quoted ETA and actual
+response time distributions. Run from the backend directory:
+
+    python -m benchmarks.bench_scenario --units 2000 --rate 0.5 --duration 3600 --save shift.ndjson
+    python -m benchmarks.bench_scenario --replay shift.ndjson --modes greedy batch --output shift.json
+
+Pass --baseline with an earlier report to fail (exit 1) when a mode's p95
+assignment latency or tick time, mean ETA or p95 response time gets worse
+by more than --max-regression (wall-clock times also by more than 1 ms).
+"""
+import argparse
+import json
+import sys
+from typing import Dict, List
+
+from app.services.dispatch_scenario import Scenario, run_scenario
+from app.services.road_network import load_router
+
+# (section, statistic) pairs compared against a baseline; higher is worse for all of them
+WATCHED = (("assign_latency_ms", "p95"), ("tick_ms", "p95"), ("eta_s", "mean"), ("response_s", "p95"))
+NOISE_FLOOR_MS = 1.0 # Wall-clock changes smaller than this are timer noise, not regressions
+
+def compare_to_baseline(results: List[Dict], baseline_path: str, max_regression: float) -> List[str]:
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    previous = {row["mode"]: row for row in baseline.get("results", [])}
+    regressions = []
+    for row in results:
+        old = previous.get(row["mode"])
+        if old is None:
+            continue
+        for section, stat in WATCHED:
+            before, after = old[section].get(stat), row[section].get(stat)
+            if not before or after is None:
+                continue
+            if section.endswith("_ms") and after - before < NOISE_FLOOR_MS:
+                continue
+            if (after - before) / before > max_regression:
+                regressions.append(f"{row['mode']} {section}.{stat}: {before} -> {after}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a dispatch scenario headlessly")
+    parser.add_argument("--replay", default="", help="Scenario file to replay instead of generating one")
+    parser.add_argument("--units", type=int, default=500)
+    parser.add_argument("--rate", type=float, default=0.2, help="Ride requests per second")
+    parser.add_argument("--duration", type=float, default=3600.0, help="Seconds of requests")
+    parser.add_argument("--hot-spots", type=int, default=3)
+    parser.add_argument("--hot-share", type=float, default=0.7, help="Share of requests around hot spots")
+    parser.add_argument("--spread-km", type=float, default=1.5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--save", default="", help="Write the generated scenario here")
+    parser.add_argument("--modes", nargs="+", default=["greedy"], choices=["greedy", "batch"])
+    parser.add_argument("--tick-hz", type=float, default=1.0)
+    parser.add_argument("--batch-window-ms", type=float, default=250.0)
+    parser.add_argument("--scene-s", type=float, default=900.0, help="Time on scene before a unit is available again")
+    parser.add_argument("--road-graph", default="", help="Route by road with this graph")
+    parser.add_argument("--baseline", default="", help="Earlier report to check for regressions")
+    parser.add_argument("--max-regression", type=float, default=0.15)
+    parser.add_argument("--output", default="")
+    args = parser.parse_args()
+
+    if args.replay:
+        scenario = Scenario.load(args.replay)
+    else:
+        scenario = Scenario.generate(args.units, args.rate, args.duration, args.hot_spots, args.hot_share,
+                                     args.spread_km, args.seed)
+        if args.save:
+            scenario.save(args.save)
+    print(f"Scenario: {len(scenario.units)} units, {len(scenario.requests)} requests over {scenario.duration_s:.0f}s",
+          file=sys.stderr)
+
+    router = load_router(args.road_graph) if args.road_graph else None
+    results = []
+    for mode in args.modes:
+        row = run_scenario(scenario, mode, args.tick_hz, args.batch_window_ms / 1000.0, scene_s=args.scene_s,
+                           router=router, seed=args.seed)
+        results.append(row)
+        print(f"{mode:<7} assigned={row['assigned']} unassigned={row['unassigned']} "
+              f"assign p95={row['assign_latency_ms'].get('p95')}ms tick p95={row['tick_ms'].get('p95')}ms "
+              f"eta mean={row['eta_s'].get('mean')}s response p95={row['response_s'].get('p95')}s", file=sys.stderr)
+
+    report = {"results": results}
+    regressions = []
+    if args.baseline:
+        regressions = compare_to_baseline(results, args.baseline, args.max_regression)
+        report["regressions"] = regressions
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    if regressions:
+        print(f"❌ {len(regressions)} metric(s) regressed more than {args.max_regression:.0%}:", file=sys.stderr)
+        for line in regressions:
+            print(f"  {line}", file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Per-tick cost of viewport-scoped fleet updates against the number of
+subscribed clients.
+
+Runs a seeded --units fleet and gives each of --clients clients a random
+--view-km wide box (a dashboard zoomed into one ward): its own, or one of
+--views shared boxes. Each tick, builds every client's FLEET_UPDATE two ways:
+
+    scan      mask the whole fleet per client (clients x fleet), encode per client
+    buckets   FleetViewport: grid the fleet once, read only the overlapped cells,
+              one frame per distinct box, encoded once
+
+Reports milliseconds per tick selecting units (select) and including JSON
+encoding (total), and bytes per client against the whole-fleet frame. Each
+pass starts from a snapshot with nothing serialized yet, so both include
+building the dicts they send: scan for the whole fleet, buckets only for
+the units in view. Run
+from the backend directory:
+
+    python -m benchmarks.bench_viewport --units 100000 --clients 100 1000
+    python -m benchmarks.bench_viewport --units 100000 --clients 1000 --views 50
+"""
+import argparse
+import json
+import sys
+import time
+from typing import Dict, List
+
+import numpy as np
+
+from app.services.dispatch_scenario import CITY, Scenario
+from app.services.dispatch_service import DispatchService
+from app.services.fleet_store import FleetSnapshot
+from app.services.fleet_viewport import FleetViewport, Subscription
+from app.services.spatial_index import KM_PER_DEG_LAT
+from app.services.websocket_manager import encode_json
+from benchmarks.metrics import latency_summary
+
+def random_views(count: int, view_km: float, seed: int, distinct: int = 0) -> List[Subscription]:
+    """`count` boxes: all different, or drawn from `distinct` different ones."""
+    if distinct:
+        boxes = random_views(distinct, view_km, seed)
+        return [boxes[i] for i in np.random.default_rng(seed + 1).integers(distinct, size=count)]
+    rng = np.random.default_rng(seed)
+    lat_min, lat_max, lng_min, lng_max = CITY
+    half = view_km / KM_PER_DEG_LAT / 2
+    views = []
+    for _ in range(count):
+        lat, lng = rng.uniform(lat_min, lat_max), rng.uniform(lng_min, lng_max)
+        views.append(Subscription((lat - half, lng - half, lat + half, lng + half), None, None))
+    return views
+
+def unserialized(snapshot: FleetSnapshot) -> FleetSnapshot:
+    """The same fleet state, without the dicts an earlier pass built."""
+    return FleetSnapshot(snapshot.tick, snapshot.sim_time, snapshot.ids, snapshot.call_signs, snapshot.types,
+                         snapshot.lat, snapshot.lng, snapshot.heading, snapshot.status)
+
+def scan(snapshot, views: List[Subscription], encode: bool) -> int:
+    payload = snapshot.serialize()
+    sent = 0
+    for view in views:
+        lat_min, lng_min, lat_max, lng_max = view.bbox
+        rows = np.flatnonzero((snapshot.lat >= lat_min) & (snapshot.lat <= lat_max) &
+                              (snapshot.lng >= lng_min) & (snapshot.lng <= lng_max))
+        message = {"type": "FLEET_UPDATE", "tick": snapshot.tick, "data": [payload[r] for r in rows.tolist()]}
+        if encode:
+            sent += len(encode_json(message))
+    return sent
+
+def buckets(viewport: FleetViewport, snapshot, views: List[Subscription], encode: bool) -> int:
+    frames: Dict[Subscription, str] = {} # As ConnectionManager encodes each distinct message once
+    sent = 0
+    for view in views:
+        message = viewport.message(snapshot, view)
+        if encode:
+            if view not in frames:
+                frames[view] = encode_json(message)
+            sent += len(frames[view])
+    return sent
+
+def main():
+    parser = argparse.ArgumentParser(description="Viewport-scoped fleet update cost vs clients")
+    parser.add_argument("--units", type=int, default=10000)
+    parser.add_argument("--clients", nargs="+", type=int, default=[10, 100, 1000])
+    parser.add_argument("--view-km", type=float, default=3.0, help="Width of each client's box")
+    parser.add_argument("--views", type=int, default=0, help="Distinct boxes clients share; 0 for one per client")
+    parser.add_argument("--cell-km", type=float, default=2.0)
+    parser.add_argument("--ticks", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="")
+    args = parser.parse_args()
+
+    service = DispatchService(seed=args.seed, seed_fleet=False, start=False, journal_dir="")
+    service.add_ambulances(Scenario.generate(args.units, 0, 1, seed=args.seed).units)
+    service.scheduler.run_ticks(1)
+    whole = len(encode_json({"type": "FLEET_UPDATE", "data": service.snapshot.serialize(), "tick": service.snapshot.tick}))
+    print(f"Whole-fleet frame: {whole} bytes", file=sys.stderr)
+
+    results = []
+    for clients in args.clients:
+        views = random_views(clients, args.view_km, args.seed, args.views)
+        times: Dict[str, List[float]] = {"scan_select": [], "scan_total": [], "buckets_select": [], "buckets_total": []}
+        sent = 0
+        for _ in range(args.ticks):
+            service.scheduler.run_ticks(1)
+            snapshot = service.snapshot
+            for encode in (False, True):
+                suffix = "total" if encode else "select"
+                fresh = unserialized(snapshot)
+                started = time.perf_counter()
+                scan(fresh, views, encode)
+                times[f"scan_{suffix}"].append(time.perf_counter() - started)
+                fresh = unserialized(snapshot)
+                viewport = FleetViewport(args.cell_km) # Fresh, so each pass grids the snapshot
+                started = time.perf_counter()
+                sent = buckets(viewport, fresh, views, encode)
+                times[f"buckets_{suffix}"].append(time.perf_counter() - started)
+        row = {"clients": clients, "distinct_views": len(set(views)),
+               **{name: latency_summary(values) for name, values in times.items()},
+               "bytes_per_client": sent // clients, "whole_fleet_bytes": whole,
+               "avg_units_per_view": viewport.get_stats()["avg_units_per_frame"]}
+        results.append(row)
+        print(f"clients={clients:<6} select p50: scan={row['scan_select']['p50_ms']}ms buckets={row['buckets_select']['p50_ms']}ms"
+              f" | total p50: scan={row['scan_total']['p50_ms']}ms buckets={row['buckets_total']['p50_ms']}ms"
+              f" | bytes/client={row['bytes_per_client']} ({row['avg_units_per_view']} units)", file=sys.stderr)
+
+    output = json.dumps({"units": args.units, "view_km": args.view_km, "views": args.views, "results": results}, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Frame size and encode time of the dispatch websocket's fleet update in each
+wire format, for fleets of --units units.
+
+    json      FLEET_UPDATE with every unit as a JSON object (?encoding=full)
+    delta     FleetDeltaEncoder's frame: changed fields only (?encoding=delta)
+    binary    FleetBinaryEncoder's packed records (?encoding=binary)
+
+Before measuring, decodes binary frames (whole-fleet with the unit table,
+viewport-scoped, and with only new units in the table) and checks them
+against the snapshot to within the record's precision; exits non-zero on a
+mismatch. Run from the backend directory:
+
+    python -m benchmarks.bench_wire_format --units 100 2000 10000
+"""
+import argparse
+import json
+import sys
+import time
+from typing import Dict, List
+
+import numpy as np
+
+from app.services.dispatch_scenario import Scenario
+from app.services.dispatch_service import DispatchService
+from app.services.fleet_binary import COORD_SCALE, HEADING_SCALE, FleetBinaryEncoder, carries_table, decode_frame
+from app.services.fleet_delta import FleetDeltaEncoder
+from app.services.fleet_store import STATUSES
+from app.services.websocket_manager import encode_json
+from benchmarks.metrics import latency_summary
+
+def check_frame(snapshot, frame: bytes, rows: np.ndarray, table_start) -> List[str]:
+    """Differences between a decoded frame and the snapshot rows it should carry."""
+    decoded = decode_frame(frame)
+    errors = []
+    if decoded["tick"] != snapshot.tick:
+        errors.append(f"tick {decoded['tick']} != {snapshot.tick}")
+    if [d["row"] for d in decoded["data"]] != rows.tolist():
+        errors.append("rows differ")
+        return errors
+    expected_units = [] if table_start is None else [
+        [snapshot.ids[r], snapshot.call_signs[r], snapshot.types[r]] for r in range(table_start, len(snapshot))]
+    if decoded["units"] != expected_units or decoded["table_start"] != (table_start or 0):
+        errors.append("unit table differs")
+    if carries_table(frame) != bool(expected_units):
+        errors.append("carries_table disagrees with the table")
+    lat = np.array([d["location"]["lat"] for d in decoded["data"]])
+    lng = np.array([d["location"]["lng"] for d in decoded["data"]])
+    heading = np.array([d["heading"] for d in decoded["data"]])
+    if len(rows) and max(np.abs(lat - snapshot.lat[rows]).max(), np.abs(lng - snapshot.lng[rows]).max()) > 0.5 / COORD_SCALE + 1e-12:
+        errors.append("coordinates off by more than half a unit")
+    if len(rows) and np.abs(heading - snapshot.heading[rows]).max() > 0.5 / HEADING_SCALE + 1e-9:
+        errors.append("heading off by more than half a unit")
+    if [d["status"] for d in decoded["data"]] != [STATUSES[s] for s in snapshot.status[rows].tolist()]:
+        errors.append("statuses differ")
+    return errors
+
+def round_trip(service: DispatchService, seed: int) -> List[str]:
+    encoder = FleetBinaryEncoder()
+    snapshot = service.snapshot
+    everything = np.arange(len(snapshot))
+    errors = check_frame(snapshot, encoder.frame(snapshot, "INIT_FLEET", table_start=0), everything, 0)
+    errors += check_frame(snapshot, encoder.frame(snapshot), everything, None)
+    rows = np.sort(np.random.default_rng(seed).choice(len(snapshot), size=len(snapshot) // 3, replace=False))
+    errors += check_frame(snapshot, encoder.frame(snapshot, rows=rows, scoped=True), rows, None)
+    # Units added after the client's INIT_FLEET arrive in the next frame's table
+    encoder.announced = len(snapshot)
+    added = Scenario.generate(5, 0, 1, seed=seed + 1).units
+    service.add_ambulances([(f"NEW-{id}", f"New {call_sign}", *rest) for id, call_sign, *rest in added])
+    service.scheduler.run_ticks(1)
+    snapshot = service.snapshot
+    table_start = encoder.table_start(snapshot)
+    errors += check_frame(snapshot, encoder.frame(snapshot, table_start=table_start), np.arange(len(snapshot)), table_start)
+    if decode_frame(encoder.frame(snapshot, rows=rows, scoped=True))["scoped"] is not True:
+        errors.append("scoped flag lost")
+    return errors
+
+def timed(encode, ticks: int, service: DispatchService) -> Dict:
+    times, sizes = [], []
+    for _ in range(ticks):
+        service.scheduler.run_ticks(1)
+        snapshot = service.snapshot
+        started = time.perf_counter()
+        sizes.append(len(encode(snapshot)))
+        times.append(time.perf_counter() - started)
+    return {**latency_summary(times), "avg_bytes": round(sum(sizes) / len(sizes))}
+
+def main():
+    parser = argparse.ArgumentParser(description="Fleet update frame size and encode time per wire format")
+    parser.add_argument("--units", nargs="+", type=int, default=[100, 2000, 10000])
+    parser.add_argument("--ticks", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="")
+    args = parser.parse_args()
+
+    results = []
+    for units in args.units:
+        service = DispatchService(seed=args.seed, seed_fleet=False, start=False, journal_dir="")
+        service.add_ambulances(Scenario.generate(units, 0, 1, seed=args.seed).units)
+        service.scheduler.run_ticks(1)
+        errors = round_trip(service, args.seed)
+        if errors:
+            print(f"units={units}: binary round trip failed: {'; '.join(errors)}", file=sys.stderr)
+            sys.exit(1)
+
+        delta = FleetDeltaEncoder()
+        binary = FleetBinaryEncoder()
+        formats = {
+            # serialize() is cached per snapshot, so it's counted as part of the JSON encode
+            "json": lambda s: encode_json({"type": "FLEET_UPDATE", "data": s.serialize(), "tick": s.tick}).encode(),
+            "delta": lambda s: encode_json(delta.encode(s)).encode(),
+            "binary": lambda s: binary.frame(s),
+        }
+        row = {"units": units, **{name: timed(encode, args.ticks, service) for name, encode in formats.items()}}
+        row["binary_vs_json"] = round(row["binary"]["avg_bytes"] / row["json"]["avg_bytes"], 3)
+        results.append(row)
+        print(f"units={units:<6} " + " | ".join(
+            f"{name}: {row[name]['avg_bytes']} B, p50 {row[name]['p50_ms']}ms" for name in formats) +
+            f" | binary/json size={row['binary_vs_json']}", file=sys.stderr)
+
+    output = json.dumps({"round_trip": "ok", "results": results}, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+
+if __name__ == "__main__":
+    main()
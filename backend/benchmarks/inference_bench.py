@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+Inference benchmark for InferenceService and BrainTumorPredictor.
+
+Sweeps batch size, torch intra-op thread count and backend over synthetic
+MRI-sized images and reports p50/p95/p99 latency and images/sec as JSON.
+Run from the backend directory:
+
+    python -m benchmarks.inference_bench --batch-sizes 1 4 8 --threads 1 4 \\
+        --backends eager int8 --output bench.json
+
+Add --explain to also time the service with attention-rollout heatmaps.
+
+Pass --baseline with an earlier report to fail (exit 1) when any matching
+configuration's p95 latency or throughput regresses by more than
+--max-regression.
+"""
+import argparse
+import copy
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+import torch
+from PIL import Image
+
+from app.core.config import settings
+from app.services.inference_backends import BACKENDS, build_backend
+from app.ml.model import BrainTumorViT, load_state_dict_file
+from app.services.inference_service import InferenceService
+from benchmarks.metrics import latency_summary
+from benchmarks.synthetic import make_scan
+
+TARGETS = ("service", "predictor")
+
+def load_eager_model(checkpoint: str) -> BrainTumorViT:
+    model = BrainTumorViT(num_classes=4)
+    if checkpoint:
+        model.load_state_dict(load_state_dict_file(checkpoint))
+    return model.eval()
+
+def make_predictor(eager: BrainTumorViT):
+    """BrainTumorPredictor loads from a file in its own format, so hand it the weights we already have."""
+    from predictor_module import BrainTumorPredictor
+
+    path = os.path.join(tempfile.mkdtemp(prefix="neurovision-bench-"), "predictor.pth")
+    torch.save({'model_state_dict': eager.state_dict(), 'num_classes': 4}, path)
+    return BrainTumorPredictor(path)
+
+def run_config(runner, images: List[bytes], batch_size: int, iterations: int, warmup: int) -> Dict:
+    batches = [
+        [images[(i * batch_size + j) % len(images)] for j in range(batch_size)]
+        for i in range(warmup + iterations)
+    ]
+
+    for batch in batches[:warmup]:
+        runner(batch)
+
+    latencies = []
+    start = time.perf_counter()
+    for batch in batches[warmup:]:
+        t0 = time.perf_counter()
+        runner(batch)
+        latencies.append(time.perf_counter() - t0)
+    wall = time.perf_counter() - start
+
+    summary = latency_summary(latencies)
+    return {
+        "iterations": iterations,
+        "images": iterations * batch_size,
+        "images_per_sec": round(iterations * batch_size / wall, 2),
+        "batch_latency": summary,
+        "per_image_p50_ms": round(summary["p50_ms"] / batch_size, 2),
+    }
+
+def compare_to_baseline(results: List[Dict], baseline_path: str, max_regression: float) -> List[str]:
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+
+    def key(row):
+        return (row["target"], row["backend"], row["threads"], row["batch_size"], row.get("explain", False))
+
+    previous = {key(row): row for row in baseline.get("results", []) if "error" not in row}
+    regressions = []
+    for row in results:
+        if "error" in row:
+            continue
+        old = previous.get(key(row))
+        if old is None:
+            continue
+        p95_change = row["batch_latency"]["p95_ms"] / old["batch_latency"]["p95_ms"] - 1
+        throughput_change = 1 - row["images_per_sec"] / old["images_per_sec"]
+        if p95_change > max_regression or throughput_change > max_regression:
+            regressions.append(
+                f"{key(row)}: p95 {old['batch_latency']['p95_ms']} -> {row['batch_latency']['p95_ms']} ms, "
+                f"throughput {old['images_per_sec']} -> {row['images_per_sec']} img/s"
+            )
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the predict path")
+    parser.add_argument("--checkpoint", default=settings.MODEL_PATH if os.path.exists(settings.MODEL_PATH) else "",
+                        help="Checkpoint to load (default: MODEL_PATH if present, else random weights)")
+    parser.add_argument("--targets", nargs="+", default=["service"], choices=TARGETS)
+    parser.add_argument("--backends", nargs="+", default=["eager"], choices=BACKENDS)
+    parser.add_argument("--batch-sizes", nargs="+", type=int, default=[1, 8])
+    parser.add_argument("--threads", nargs="+", type=int, default=[torch.get_num_threads()])
+    parser.add_argument("--image-size", type=int, default=512, help="Side of the synthetic scans, in pixels")
+    parser.add_argument("--num-images", type=int, default=32, help="Distinct synthetic scans to cycle through")
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--explain", action="store_true", help="Also time service predictions with heatmaps")
+    parser.add_argument("--output", default="", help="Write the JSON report here as well as to stdout")
+    parser.add_argument("--baseline", default="", help="Earlier report to check for regressions")
+    parser.add_argument("--max-regression", type=float, default=0.15)
+    args = parser.parse_args()
+
+    images = [make_scan(i, size=args.image_size) for i in range(args.num_images)]
+    eager = load_eager_model(args.checkpoint)
+    service = InferenceService()
+    predictor = make_predictor(eager) if "predictor" in args.targets else None
+
+    results = []
+    for backend in args.backends:
+        for threads in args.threads:
+            torch.set_num_threads(threads)
+            try:
+                model = build_backend(copy.deepcopy(eager), backend, num_threads=threads)
+            except Exception as e:
+                print(f"❌ {backend}: build failed: {e}", file=sys.stderr)
+                results.append({"backend": backend, "threads": threads, "error": str(e)})
+                continue
+
+            for target in args.targets:
+                explain_modes = [False]
+                if target == "service":
+                    service.registry.register(f"bench-{backend}-t{threads}", model)
+                    batch_sizes = args.batch_sizes
+                    if args.explain and service.supports_explain and backend in ("eager", "int8"):
+                        explain_modes.append(True)
+                else:
+                    predictor.model = model
+                    batch_sizes = [1] # BrainTumorPredictor is single-image
+
+                for explain, batch_size in [(e, b) for e in explain_modes for b in batch_sizes]:
+                    if target == "service":
+                        runner = lambda batch, explain=explain: service.predict_batch(batch, explain=explain)
+                    else:
+                        runner = lambda batch: [predictor.predict(Image.open(io.BytesIO(image))) for image in batch]
+                    row = {"target": target, "backend": backend, "threads": threads, "batch_size": batch_size}
+                    if explain:
+                        row["explain"] = True
+                    row.update(run_config(runner, images, batch_size, args.iterations, args.warmup))
+                    results.append(row)
+                    label = backend + ("+heatmap" if explain else "")
+                    print(f"{target:9} {label:16} threads={threads:<2} batch={batch_size:<3} "
+                          f"p50={row['batch_latency']['p50_ms']}ms p95={row['batch_latency']['p95_ms']}ms "
+                          f"p99={row['batch_latency']['p99_ms']}ms {row['images_per_sec']} img/s", file=sys.stderr)
+
+    report = {
+        "meta": {
+            "torch": torch.__version__,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "checkpoint": args.checkpoint or None,
+            "image_size": args.image_size,
+            "jpeg_draft": service.preprocessor.jpeg_draft,
+        },
+        "results": results,
+        "preprocessing": service.preprocessor.get_stats(),
+    }
+
+    regressions = []
+    if args.baseline:
+        regressions = compare_to_baseline(results, args.baseline, args.max_regression)
+        report["regressions"] = regressions
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+
+    if regressions:
+        print(f"❌ {len(regressions)} configuration(s) regressed more than {args.max_regression:.0%}:", file=sys.stderr)
+        for line in regressions:
+            print(f"  {line}", file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,20 @@
+"""
+Latency summaries shared by the benchmark scripts.
+"""
+import statistics
+from typing import Dict, Sequence
+
+def percentile(values: Sequence[float], pct: float) -> float:
+    """Nearest-rank percentile; good enough for benchmark-sized samples."""
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[idx]
+
+def latency_summary(latencies_s: Sequence[float]) -> Dict[str, float]:
+    """p50/p95/p99/mean of a list of latencies in seconds, reported in milliseconds."""
+    return {
+        "p50_ms": round(percentile(latencies_s, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies_s, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies_s, 99) * 1000, 2),
+        "mean_ms": round(statistics.mean(latencies_s) * 1000, 2),
+    }
@@ -0,0 +1,63 @@
+"""
+Synthetic MRI-like test images and road networks, so benchmarks and export
+checks run without patient data or map extracts.
+"""
+import io
+
+import numpy as np
+from PIL import Image
+
+def make_scan(seed: int, size: int = 512, format: str = 'JPEG') -> bytes:
+    """A noisy bright ellipse on black, encoded like a typical upload."""
+    rng = np.random.default_rng(seed)
+    yy, xx = np.mgrid[0:size, 0:size]
+    cy, cx = size / 2, size / 2
+    mask = ((yy - cy) / (size * 0.42)) ** 2 + ((xx - cx) / (size * 0.35)) ** 2 <= 1.0
+    pixels = np.where(mask, 120, 0) + rng.normal(0, 25, (size, size))
+    image = Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8), mode='L')
+    buf = io.BytesIO()
+    if format == 'JPEG':
+        image.save(buf, format=format, quality=90)
+    else:
+        image.save(buf, format=format)
+    return buf.getvalue()
+
+def make_road_grid(rows: int, cols: int, seed: int = 0, spacing_m: float = 120.0,
+                   origin: tuple = (19.00, 72.82)):
+    """
+    A city-like RoadGraph: a jittered street grid with 60 km/h arterials
+    every tenth row and column, 25 km/h side streets, some one-way streets
+    and a few missing blocks. Restricted to its largest strongly connected
+    component, without landmarks.
+    """
+    from app.services.road_network import RoadGraph, build_csr, largest_strongly_connected, subgraph
+    from app.services.spatial_index import KM_PER_DEG_LAT, haversine_km_pairs
+
+    rng = np.random.default_rng(seed)
+    deg_lat = spacing_m / 1000 / KM_PER_DEG_LAT
+    deg_lng = deg_lat / np.cos(np.radians(origin[0]))
+    r, c = np.mgrid[0:rows, 0:cols]
+    lat = (origin[0] + r * deg_lat + rng.normal(0, deg_lat * 0.15, r.shape)).ravel()
+    lng = (origin[1] + c * deg_lng + rng.normal(0, deg_lng * 0.15, c.shape)).ravel()
+    node = np.arange(rows * cols).reshape(rows, cols)
+
+    # Undirected street segments, along rows then along columns
+    a = np.concatenate((node[:, :-1].ravel(), node[:-1, :].ravel()))
+    b = np.concatenate((node[:, 1:].ravel(), node[1:, :].ravel()))
+    arterial = np.concatenate(((r[:, :-1] % 10 == 0).ravel(), (c[:-1, :] % 10 == 0).ravel()))
+    keep = rng.random(len(a)) > 0.05
+    a, b, arterial = a[keep], b[keep], arterial[keep]
+
+    length = haversine_km_pairs(lat[a], lng[a], lat[b], lng[b]) * 1000 * 1.1 # Streets are not straight
+    speed = np.where(arterial, 60.0, 25.0) / 3.6
+    travel = length / speed
+    # One-way side streets alternate direction
+    one_way = ~arterial & (rng.random(len(a)) < 0.15)
+    flip = one_way & (rng.random(len(a)) < 0.5)
+    src = np.concatenate((np.where(flip, b, a), b[~one_way]))
+    dst = np.concatenate((np.where(flip, a, b), a[~one_way]))
+    travel = np.concatenate((travel, travel[~one_way]))
+    length = np.concatenate((length, length[~one_way]))
+
+    graph = RoadGraph(lat, lng, *build_csr(rows * cols, src, dst, travel, length))
+    return subgraph(graph, largest_strongly_connected(graph))
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Converts an OpenStreetMap extract into the road graph dispatch routes on.
+
+    python build_road_graph.py mumbai.osm models/mumbai_roads.npz
+
+Reads OSM XML (.osm, .osm.gz or .osm.bz2; convert a .pbf first with
+`osmium cat mumbai.osm.pbf -o mumbai.osm`). Keeps drivable ways, turns
+each stretch between junctions into one directed edge per allowed
+direction (travel time from maxspeed, else a per-road-class default), keeps
+the largest strongly connected component so every node can reach every
+other, and precomputes ALT landmarks. Point DISPATCH_ROAD_GRAPH at the
+output.
+
+    python build_road_graph.py --synthetic-grid 300 models/synthetic_roads.npz
+
+writes a synthetic street grid instead, for trying routing without a map.
+"""
+import argparse
+import bz2
+import gzip
+import re
+import time
+import xml.etree.ElementTree as ET
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.services.road_network import RoadGraph, add_landmarks, build_csr, largest_strongly_connected, subgraph
+from app.services.spatial_index import haversine_km_pairs
+
+# Default speeds (km/h) by highway class, for ways without a usable maxspeed
+SPEEDS_KPH = {
+    "motorway": 80, "motorway_link": 50, "trunk": 60, "trunk_link": 40,
+    "primary": 50, "primary_link": 35, "secondary": 40, "secondary_link": 30,
+    "tertiary": 35, "tertiary_link": 25, "unclassified": 25, "residential": 20,
+    "living_street": 10, "service": 15, "road": 20,
+}
+ONE_WAY_BY_DEFAULT = {"motorway", "motorway_link"}
+
+def open_extract(path: str):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rb")
+    if path.endswith(".bz2"):
+        return bz2.open(path, "rb")
+    return open(path, "rb")
+
+def parse_maxspeed(value: Optional[str]) -> Optional[float]:
+    """km/h from a maxspeed tag ("50", "50 km/h", "30 mph"), or None."""
+    match = re.match(r"\s*(\d+(?:\.\d+)?)\s*(mph)?", value or "")
+    if not match:
+        return None
+    speed = float(match.group(1))
+    return speed * 1.609 if match.group(2) else speed
+
+def read_osm(path: str) -> Tuple[Dict[int, Tuple[float, float]], List[Tuple[List[int], float, int]]]:
+    """Node coordinates, and each drivable way as (node refs, speed km/h, direction: 1, -1 or 0 for both)."""
+    coords: Dict[int, Tuple[float, float]] = {}
+    ways = []
+    with open_extract(path) as f:
+        for _, elem in ET.iterparse(f, events=("end",)):
+            if elem.tag == "node":
+                coords[int(elem.get("id"))] = (float(elem.get("lat")), float(elem.get("lon")))
+                elem.clear()
+            elif elem.tag == "way":
+                tags = {t.get("k"): t.get("v") for t in elem.iter("tag")}
+                highway = tags.get("highway")
+                if highway in SPEEDS_KPH and tags.get("access") not in ("no", "private") and tags.get("area") != "yes":
+                    oneway = tags.get("oneway")
+                    if oneway in ("yes", "true", "1") or tags.get("junction") in ("roundabout", "circular"):
+                        direction = 1
+                    elif oneway == "-1":
+                        direction = -1
+                    else:
+                        direction = 1 if highway in ONE_WAY_BY_DEFAULT and oneway != "no" else 0
+                    refs = [int(nd.get("ref")) for nd in elem.iter("nd")]
+                    ways.append((refs, parse_maxspeed(tags.get("maxspeed")) or SPEEDS_KPH[highway], direction))
+                elem.clear()
+            elif elem.tag == "relation":
+                elem.clear()
+    return coords, ways
+
+def build_graph(coords: Dict[int, Tuple[float, float]], ways: List[Tuple[List[int], float, int]],
+                keep_shape: bool = False) -> RoadGraph:
+    """
+    One edge per stretch of way between junctions (nodes shared by several
+    ways, or way ends), with the length of its full shape. With
+    `keep_shape`, every OSM node becomes a graph node, so simulated units
+    follow the road geometry exactly at the cost of a larger graph.
+    """
+    ways = [(refs, speed, direction) for refs, speed, direction in
+            (([r for r in refs if r in coords], speed, direction) for refs, speed, direction in ways) if len(refs) >= 2]
+    uses: Dict[int, int] = {}
+    for refs, _, _ in ways:
+        for ref in refs:
+            uses[ref] = uses.get(ref, 0) + 1
+        # Way ends are always junctions
+        uses[refs[0]] += 1
+        uses[refs[-1]] += 1
+
+    node_of: Dict[int, int] = {}
+    src, dst, travel, length = [], [], [], []
+    for refs, speed, direction in ways:
+        lat = np.array([coords[r][0] for r in refs])
+        lng = np.array([coords[r][1] for r in refs])
+        segment_m = haversine_km_pairs(lat[:-1], lng[:-1], lat[1:], lng[1:]) * 1000
+        start, meters = refs[0], 0.0
+        for ref, m in zip(refs[1:], segment_m.tolist()):
+            meters += m
+            if not keep_shape and uses[ref] < 2:
+                continue
+            a = node_of.setdefault(start, len(node_of))
+            b = node_of.setdefault(ref, len(node_of))
+            seconds = meters / (speed / 3.6)
+            if direction >= 0:
+                src.append(a); dst.append(b); travel.append(seconds); length.append(meters)
+            if direction <= 0:
+                src.append(b); dst.append(a); travel.append(seconds); length.append(meters)
+            start, meters = ref, 0.0
+
+    osm_ids = np.empty(len(node_of), dtype=np.int64)
+    for osm_id, node in node_of.items():
+        osm_ids[node] = osm_id
+    node_lat = np.array([coords[i][0] for i in osm_ids.tolist()])
+    node_lng = np.array([coords[i][1] for i in osm_ids.tolist()])
+    graph = RoadGraph(node_lat, node_lng, *build_csr(len(node_of), np.array(src, dtype=np.int64),
+                                                      np.array(dst, dtype=np.int64), np.array(travel), np.array(length)))
+    return subgraph(graph, largest_strongly_connected(graph))
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the dispatch road graph from an OSM extract")
+    parser.add_argument("extract", nargs="?", default="", help="OSM XML extract (.osm, .osm.gz, .osm.bz2)")
+    parser.add_argument("output", help="Road graph .npz to write")
+    parser.add_argument("--synthetic-grid", type=int, default=0, help="Write an N x N synthetic street grid instead")
+    parser.add_argument("--landmarks", type=int, default=16, help="ALT landmarks (0 to skip)")
+    parser.add_argument("--keep-shape", action="store_true", help="Keep every OSM node, not only junctions")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    if args.synthetic_grid:
+        from benchmarks.synthetic import make_road_grid
+        graph = make_road_grid(args.synthetic_grid, args.synthetic_grid, seed=args.seed)
+    elif args.extract:
+        print(f"🗺️ Reading {args.extract}...")
+        coords, ways = read_osm(args.extract)
+        print(f"   {len(coords)} nodes, {len(ways)} drivable ways")
+        graph = build_graph(coords, ways, args.keep_shape)
+    else:
+        parser.error("give an OSM extract or --synthetic-grid")
+    print(f"🛣️ Graph: {graph.num_nodes} nodes, {graph.num_edges} edges ({time.perf_counter() - started:.1f}s)")
+
+    if args.landmarks:
+        started = time.perf_counter()
+        add_landmarks(graph, args.landmarks, seed=args.seed)
+        print(f"🧭 {args.landmarks} landmarks in {time.perf_counter() - started:.1f}s")
+    graph.save(args.output)
+    print(f"✅ Wrote {args.output}")
+
+if __name__ == "__main__":
+    main()
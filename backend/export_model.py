@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Builds every CPU inference backend for BrainTumorViT, checks each one's
+probabilities against the eager fp32 model and compares their latency.
+
+    python export_model.py --checkpoint models/brain_tumor_vit_model.pth
+
+TorchScript and ONNX graphs are written next to the checkpoint (or to
+--out-dir); point INFERENCE_BACKEND_PATH at the chosen one and set
+INFERENCE_BACKEND accordingly.
+
+    python export_model.py --to-safetensors
+
+only rewrites the checkpoint as a .safetensors file, which MODEL_PATH can
+point at for memory-mapped loading.
+"""
+import argparse
+import copy
+import json
+import os
+import statistics
+import time
+from pathlib import Path
+
+import torch
+
+from app.core.config import settings
+from app.services.inference_backends import BACKENDS, build_backend
+from app.ml.model import BrainTumorViT, load_state_dict_file
+from app.services.inference_service import inference_service
+from benchmarks.synthetic import make_scan
+
+def load_eager_model(checkpoint_path: str, random_init: bool) -> BrainTumorViT:
+    model = BrainTumorViT(num_classes=4)
+    if random_init:
+        print("⚠️ Using randomly initialised weights (parity and latency only)")
+    else:
+        model.load_state_dict(load_state_dict_file(checkpoint_path))
+    return model.eval()
+
+def load_inputs(images_dir: str, samples: int) -> torch.Tensor:
+    """Preprocessed parity inputs: real images from a folder, else synthetic scans."""
+    if images_dir:
+        paths = sorted(p for p in Path(images_dir).iterdir() if p.suffix.lower() in ('.jpg', '.jpeg', '.png', '.webp'))[:samples]
+        images = [p.read_bytes() for p in paths]
+    else:
+        images = [make_scan(i) for i in range(samples)]
+    # The preprocessor reuses its output buffer, so keep a copy
+    return inference_service.preprocessor(images).clone()
+
+def time_forward(model, inputs: torch.Tensor, repeats: int) -> float:
+    """Median wall time of one forward pass over `inputs`, in milliseconds."""
+    with torch.no_grad():
+        model(inputs) # warm-up
+        timings = []
+        for _ in range(repeats):
+            t0 = time.perf_counter()
+            model(inputs)
+            timings.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(timings)
+
+def artifact_path_for(backend: str, checkpoint_path: str, out_dir: str):
+    stem = Path(checkpoint_path).stem
+    if backend == "torchscript":
+        return os.path.join(out_dir, f"{stem}.torchscript.pt")
+    if backend == "onnx":
+        return os.path.join(out_dir, f"{stem}.onnx")
+    return None
+
+def convert_to_safetensors(checkpoint_path: str, out_dir: str) -> str:
+    from safetensors.torch import save_file # Optional dependency
+
+    state_dict = load_state_dict_file(checkpoint_path)
+    out_path = os.path.join(out_dir, f"{Path(checkpoint_path).stem}.safetensors")
+    save_file({name: tensor.contiguous() for name, tensor in state_dict.items()}, out_path)
+    print(f"✅ Wrote {out_path}")
+    return out_path
+
+def main():
+    parser = argparse.ArgumentParser(description="Export and compare BrainTumorViT inference backends")
+    parser.add_argument("--checkpoint", default=settings.MODEL_PATH)
+    parser.add_argument("--random-init", action="store_true", help="Skip the checkpoint (for smoke tests)")
+    parser.add_argument("--backends", nargs="+", default=list(BACKENDS), choices=BACKENDS)
+    parser.add_argument("--out-dir", default=None, help="Where to write exported graphs (default: next to the checkpoint)")
+    parser.add_argument("--images", default="", help="Folder of real scans for the parity check")
+    parser.add_argument("--samples", type=int, default=16)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--tolerance", type=float, default=0.01, help="Max allowed absolute probability difference")
+    parser.add_argument("--report", default="", help="Also write the JSON report here")
+    parser.add_argument("--to-safetensors", action="store_true", help="Only convert the checkpoint to .safetensors")
+    args = parser.parse_args()
+
+    out_dir = args.out_dir or os.path.dirname(os.path.abspath(args.checkpoint))
+    os.makedirs(out_dir, exist_ok=True)
+
+    if args.to_safetensors:
+        convert_to_safetensors(args.checkpoint, out_dir)
+        return
+
+    eager = load_eager_model(args.checkpoint, args.random_init)
+    inputs = load_inputs(args.images, args.samples)
+    with torch.no_grad():
+        reference = torch.softmax(eager(inputs), dim=1)
+
+    rows = []
+    for backend in args.backends:
+        artifact = artifact_path_for(backend, args.checkpoint, out_dir)
+        if artifact and os.path.exists(artifact):
+            os.remove(artifact) # Always rebuild from the current checkpoint
+
+        try:
+            t0 = time.perf_counter()
+            model = build_backend(copy.deepcopy(eager), backend, artifact_path=artifact)
+            build_s = time.perf_counter() - t0
+        except Exception as e:
+            print(f"❌ {backend}: build failed: {e}")
+            rows.append({"backend": backend, "error": str(e)})
+            continue
+
+        with torch.no_grad():
+            probs = torch.softmax(model(inputs), dim=1)
+        max_diff = float((probs - reference).abs().max())
+        agreement = float((probs.argmax(dim=1) == reference.argmax(dim=1)).float().mean())
+
+        row = {
+            "backend": backend,
+            "artifact": artifact,
+            "build_s": round(build_s, 2),
+            "max_abs_prob_diff": max_diff,
+            "top1_agreement": agreement,
+            "within_tolerance": max_diff <= args.tolerance,
+            "latency_ms_batch1": round(time_forward(model, inputs[:1], args.repeats), 2),
+            f"latency_ms_batch{args.batch_size}": round(time_forward(model, inputs[:args.batch_size], args.repeats), 2),
+        }
+        rows.append(row)
+        status = "✅" if row["within_tolerance"] else "⚠️"
+        print(f"{status} {backend}: diff={max_diff:.5f} agree={agreement:.2%} "
+              f"b1={row['latency_ms_batch1']}ms b{args.batch_size}={row[f'latency_ms_batch{args.batch_size}']}ms")
+
+    eligible = [r for r in rows if r.get("within_tolerance")]
+    best = min(eligible, key=lambda r: r[f"latency_ms_batch{args.batch_size}"]) if eligible else None
+    report = {
+        "checkpoint": None if args.random_init else args.checkpoint,
+        "tolerance": args.tolerance,
+        "torch_threads": torch.get_num_threads(),
+        "results": rows,
+        "recommended_backend": best["backend"] if best else None
+    }
+
+    print(json.dumps(report, indent=2))
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
+    if best:
+        print(f"🚀 Fastest within tolerance: INFERENCE_BACKEND={best['backend']}"
+              + (f" INFERENCE_BACKEND_PATH={best['artifact']}" if best["artifact"] else ""))
+
+if __name__ == "__main__":
+    main()
@@ -1,70 +1,44 @@
 
 import torch
-import torch.nn as nn
-import torchvision.transforms as transforms
-from PIL import Image
-import torchvision
 
-class BrainTumorViT(nn.Module):
-    def __init__(self, num_classes=4):
-        super(BrainTumorViT, self).__init__()
-        self.vit = torchvision.models.vit_b_16(pretrained=False)
-        self.vit.heads = nn.Sequential(
-            nn.Linear(self.vit.heads.head.in_features, 256),
-            nn.ReLU(),
-            nn.Dropout(0.5),
-            nn.Linear(256, num_classes)
-        )
-        
-    def forward(self, x):
-        return self.vit(x)
+from app.ml.model import CLASSES, BrainTumorViT, build_model_from_state, format_prediction, load_state_dict_file
+from app.services.inference_backends import build_backend
+from app.services.preprocessing import ImagePreprocessor
+
+# BrainTumorViT is re-exported: this module defined it before app.ml.model did
+__all__ = ["BrainTumorPredictor", "BrainTumorViT", "get_predictor"]
 
 class BrainTumorPredictor:
-    def __init__(self, model_path):
+    def __init__(self, model_path, backend='eager', backend_path=None):
         self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+        if backend != 'eager':
+            self.device = torch.device('cpu')
+        self.backend = backend
+        self.backend_path = backend_path
         self.model = self.load_model(model_path)
-        self.classes = ['Glioma', 'Meningioma', 'No Tumor', 'Pituitary']
+        self.classes = CLASSES
         self.image_size = 224
         
-        self.transform = transforms.Compose([
-            transforms.Resize((self.image_size, self.image_size)),
-            transforms.ToTensor(),
-            transforms.Normalize(mean=[0.485, 0.456, 0.406], 
-                               std=[0.229, 0.224, 0.225])
-        ])
+        self.preprocessor = ImagePreprocessor(image_size=self.image_size)
         
     def load_model(self, model_path):
-        checkpoint = torch.load(model_path, map_location=self.device)
-        model = BrainTumorViT(num_classes=checkpoint['num_classes'])
-        model.load_state_dict(checkpoint['model_state_dict'])
-        model.to(self.device)
-        model.eval()
-        return model
+        model = build_model_from_state(load_state_dict_file(model_path))
+        return build_backend(model, self.backend, artifact_path=self.backend_path, device=self.device)
     
     def predict(self, image):
-        if image.mode != 'RGB':
-            image = image.convert('RGB')
-        
-        input_tensor = self.transform(image).unsqueeze(0).to(self.device)
+        input_tensor = self.preprocessor([image]).to(self.device)
         
         with torch.no_grad():
             outputs = self.model(input_tensor)
             probabilities = torch.softmax(outputs, dim=1)
-            confidence, prediction = torch.max(probabilities, 1)
             
-        return {
-            'prediction': self.classes[prediction.item()],
-            'confidence': confidence.item(),
-            'probabilities': {
-                cls: prob.item() for cls, prob in zip(self.classes, probabilities[0])
-            }
-        }
+        return format_prediction(probabilities[0], self.classes)
 
 # Singleton instance
 _predictor_instance = None
 
-def get_predictor(model_path='vit_brain_tumor_metadata.pth'):
+def get_predictor(model_path='vit_brain_tumor_metadata.pth', backend='eager', backend_path=None):
     global _predictor_instance
     if _predictor_instance is None:
-        _predictor_instance = BrainTumorPredictor(model_path)
+        _predictor_instance = BrainTumorPredictor(model_path, backend=backend, backend_path=backend_path)
     return _predictor_instance
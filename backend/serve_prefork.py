@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Pre-fork server: loads the model once, then forks uvicorn workers that share
+its weights copy-on-write.
+
+    python serve_prefork.py --workers 4 --port 8000
+
+`uvicorn --workers N` spawns fresh interpreters, and each one loads its own
+copy of the ViT. Here the parent loads and warms the model, freezes the
+garbage collector (so collections in the workers don't write to the pages
+holding those objects) and only then forks. Every worker inherits the same
+physical pages for the weights and never writes to them.
+
+Each worker is pinned to its own slice of the available CPUs and sets torch's
+intra-op threads to match, so N workers don't oversubscribe the machine.
+The parent never runs inference itself and restarts workers that die.
+
+Every worker still runs its own app: its own dispatch simulation and model
+registry. Model hot swaps are refused in the workers (restart the server
+with the new MODEL_PATH instead), and a dispatch journal, which one process
+must own, is only allowed with a single worker.
+"""
+import argparse
+import gc
+import os
+import signal
+import socket
+import sys
+import time
+from typing import Dict, List, Optional
+
+import torch
+
+from app.core.config import settings
+
+def plan_cpus(workers: int, threads: Optional[int], pin: bool) -> List[Optional[List[int]]]:
+    """CPU set for each worker, or None to leave it unpinned."""
+    cpus = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else list(range(os.cpu_count() or 1))
+    per_worker = threads or max(1, len(cpus) // workers)
+    if not pin or per_worker * workers > len(cpus):
+        if pin:
+            print(f"⚠️ {workers} workers x {per_worker} threads exceed {len(cpus)} CPUs; not pinning")
+        return [None] * workers
+    return [cpus[i * per_worker:(i + 1) * per_worker] for i in range(workers)]
+
+def bind_socket(host: str, port: int, backlog: int) -> socket.socket:
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+def run_worker(index: int, sock: socket.socket, cpus: Optional[List[int]], threads: int, log_level: str):
+    """Body of a forked worker. Never returns."""
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, signal.SIG_DFL)
+    if cpus is not None:
+        os.sched_setaffinity(0, cpus)
+    torch.set_num_threads(threads)
+    settings.INFERENCE_TORCH_THREADS = threads # Read by the inference executor when app.main imports it
+    settings.INFERENCE_PREFORKED = True
+
+    import uvicorn
+    from app.main import app
+
+    print(f"👷 Worker {index} (pid {os.getpid()}) on CPUs {cpus if cpus is not None else 'any'} with {threads} torch threads")
+    code = 0
+    try:
+        uvicorn.Server(uvicorn.Config(app, log_level=log_level)).run(sockets=[sock])
+    except BaseException as e:
+        print(f"❌ Worker {index} crashed: {e!r}")
+        code = 1
+    finally:
+        sys.stdout.flush()
+        os._exit(code)
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the API from pre-forked workers sharing one model copy")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--threads", type=int, default=0, help="Torch threads per worker (default: CPUs / workers)")
+    parser.add_argument("--no-pin", action="store_true", help="Don't pin workers to CPUs")
+    parser.add_argument("--backlog", type=int, default=2048)
+    parser.add_argument("--log-level", default="warning")
+    args = parser.parse_args()
+
+    if settings.INFERENCE_EXECUTOR_MODE != "thread":
+        parser.error("Pre-fork workers share the model in-process; set INFERENCE_EXECUTOR_MODE=thread")
+    if settings.DISPATCH_JOURNAL_DIR and args.workers > 1:
+        # Each worker would run its own fleet and write it to the same journal
+        parser.error("DISPATCH_JOURNAL_DIR needs a single process; use --workers 1 or unset it")
+
+    cpu_plan = plan_cpus(args.workers, args.threads or None, not args.no_pin)
+    threads = args.threads or (len(cpu_plan[0]) if cpu_plan[0] else max(1, (os.cpu_count() or 1) // args.workers))
+
+    # One intra-op thread in the parent: an OpenMP pool started before fork() is
+    # not usable in the children, and the parent never serves requests anyway
+    torch.set_num_threads(1)
+    from app.services.inference_service import inference_service
+
+    started = time.perf_counter()
+    if not inference_service.warm_up(batch_sizes=(1, settings.INFERENCE_MAX_BATCH_SIZE)):
+        print("⚠️ Model unavailable in the parent; workers will report not ready")
+    print(f"✅ Parent {os.getpid()} loaded {inference_service.model_version} in {time.perf_counter() - started:.1f}s")
+
+    # Move everything allocated so far out of the collector's reach, so
+    # collections in the workers don't touch (and copy) the shared pages
+    gc.collect()
+    gc.freeze()
+
+    sock = bind_socket(args.host, args.port, args.backlog)
+    workers: Dict[int, int] = {} # pid -> worker index
+
+    def spawn(index: int):
+        pid = os.fork()
+        if pid == 0:
+            run_worker(index, sock, cpu_plan[index], threads, args.log_level)
+        workers[pid] = index
+
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    for index in range(args.workers):
+        spawn(index)
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    print(f"🚀 Serving on {args.host}:{args.port} with {args.workers} workers")
+
+    while workers:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        index = workers.pop(pid, None)
+        if index is not None and not stopping:
+            print(f"⚠️ Worker {index} (pid {pid}) exited with status {status}; restarting")
+            time.sleep(1) # Don't spin if workers crash on startup
+            spawn(index)
+
+    sock.close()
+
+if __name__ == "__main__":
+    main()
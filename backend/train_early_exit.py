@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+Distils early-exit heads for BrainTumorViT and calibrates their confidence
+threshold.
+
+    python train_early_exit.py --checkpoint models/brain_tumor_vit_model.pth \\
+        --images data/scans --exit-layers 4 8 --target-agreement 0.99
+
+The backbone stays frozen: each head (LayerNorm + Linear on the class token
+after an intermediate encoder layer) is trained to match the full model's
+softened probabilities, so no labels are needed. On a held-out split the
+script then picks the lowest threshold whose cascade still agrees with the
+full model on at least --target-agreement of the images, and reports how
+often each exit is taken, the cascade's average latency and its agreement.
+
+Heads are written next to the checkpoint as <name>.exits.pth, where
+INFERENCE_EARLY_EXIT=true picks them up.
+"""
+import argparse
+import json
+import statistics
+import time
+from pathlib import Path
+from typing import Dict, List
+
+import torch
+import torch.nn.functional as F
+
+from app.core.config import settings
+from app.ml.early_exit import DEFAULT_EXIT_LAYERS, EarlyExitViT, class_tokens, exit_heads_path, make_exit_head
+from app.ml.model import BrainTumorViT, load_state_dict_file
+from app.services.inference_service import inference_service
+from benchmarks.synthetic import make_scan
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp')
+
+def load_images(images_dir: str, limit: int) -> List[bytes]:
+    if images_dir:
+        paths = sorted(p for p in Path(images_dir).rglob('*') if p.suffix.lower() in IMAGE_EXTENSIONS)[:limit]
+        return [p.read_bytes() for p in paths]
+    print("⚠️ No --images given; distilling on synthetic scans (for smoke tests only)")
+    return [make_scan(i) for i in range(limit)]
+
+def extract_features(model: BrainTumorViT, images: List[bytes], layers: List[int], batch_size: int):
+    """Class tokens at each exit layer and the full model's logits, for every image."""
+    tokens: Dict[int, List[torch.Tensor]] = {layer: [] for layer in layers}
+    logits = []
+    with torch.no_grad():
+        for start in range(0, len(images), batch_size):
+            inputs = inference_service.preprocessor(images[start:start + batch_size])
+            batch_tokens, batch_logits = class_tokens(model.vit, inputs, layers)
+            for layer in layers:
+                tokens[layer].append(batch_tokens[layer])
+            logits.append(batch_logits)
+    return {layer: torch.cat(t) for layer, t in tokens.items()}, torch.cat(logits)
+
+def distil_head(features: torch.Tensor, teacher_logits: torch.Tensor, epochs: int, lr: float, temperature: float):
+    head = make_exit_head(features.shape[1], teacher_logits.shape[1])
+    optimizer = torch.optim.AdamW(head.parameters(), lr=lr, weight_decay=1e-4)
+    soft_targets = F.softmax(teacher_logits / temperature, dim=1)
+    for _ in range(epochs):
+        for batch in torch.randperm(len(features)).split(64):
+            student = F.log_softmax(head(features[batch]) / temperature, dim=1)
+            loss = F.kl_div(student, soft_targets[batch], reduction='batchmean') * temperature ** 2
+            optimizer.zero_grad()
+            loss.backward()
+            optimizer.step()
+    return head.eval()
+
+def simulate(head_probs: List[torch.Tensor], full_pred: torch.Tensor, exit_layers: List[int], threshold: float, depth: int) -> Dict:
+    """Cascade outcome at `threshold`, computed from cached head outputs."""
+    n = len(full_pred)
+    prediction = full_pred.clone()
+    layers_run = torch.full((n,), depth, dtype=torch.float32)
+    pending = torch.ones(n, dtype=torch.bool)
+    exits = {}
+    for layer, probs in zip(exit_layers, head_probs):
+        confidence, predicted = probs.max(dim=1)
+        taken = pending & (confidence >= threshold)
+        prediction[taken] = predicted[taken]
+        layers_run[taken] = layer
+        exits[f"layer{layer}"] = round(float(taken.float().mean()), 4)
+        pending &= ~taken
+    exits["final"] = round(float(pending.float().mean()), 4)
+    return {
+        "threshold": threshold,
+        "exit_rate": exits,
+        "agreement": round(float((prediction == full_pred).float().mean()), 4),
+        "relative_depth": round(float(layers_run.mean()) / depth, 4)
+    }
+
+def measure_latency(model, inputs: torch.Tensor, batch_size: int, repeats: int) -> float:
+    """Median milliseconds per image over the held-out set."""
+    timings = []
+    with torch.no_grad():
+        model(inputs[:batch_size]) # warm-up
+        for _ in range(repeats):
+            t0 = time.perf_counter()
+            for start in range(0, len(inputs), batch_size):
+                model(inputs[start:start + batch_size])
+            timings.append((time.perf_counter() - t0) * 1000 / len(inputs))
+    return statistics.median(timings)
+
+def main():
+    parser = argparse.ArgumentParser(description="Distil and calibrate early-exit heads for BrainTumorViT")
+    parser.add_argument("--checkpoint", default=settings.MODEL_PATH)
+    parser.add_argument("--random-init", action="store_true", help="Skip the checkpoint (for smoke tests)")
+    parser.add_argument("--images", default="", help="Folder of scans (searched recursively); labels are not needed")
+    parser.add_argument("--max-images", type=int, default=2000)
+    parser.add_argument("--holdout", type=float, default=0.25, help="Fraction kept aside for calibration")
+    parser.add_argument("--exit-layers", nargs="+", type=int, default=list(DEFAULT_EXIT_LAYERS))
+    parser.add_argument("--epochs", type=int, default=30)
+    parser.add_argument("--lr", type=float, default=1e-3)
+    parser.add_argument("--temperature", type=float, default=2.0)
+    parser.add_argument("--target-agreement", type=float, default=0.99, help="Minimum top-1 agreement with the full model")
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--out", default="", help="Where to write the heads (default: <checkpoint>.exits.pth)")
+    args = parser.parse_args()
+
+    torch.manual_seed(0)
+    model = BrainTumorViT(num_classes=4)
+    if not args.random_init:
+        model.load_state_dict(load_state_dict_file(args.checkpoint))
+    model.eval()
+    depth = len(model.vit.encoder.layers)
+    exit_layers = sorted(set(args.exit_layers))
+    if not all(0 < layer < depth for layer in exit_layers):
+        parser.error(f"--exit-layers must be between 1 and {depth - 1}")
+
+    images = load_images(args.images, args.max_images)
+    split = max(1, int(len(images) * (1 - args.holdout)))
+    train_images, holdout_images = images[:split], images[split:]
+    if not holdout_images:
+        parser.error("Not enough images for a calibration split")
+    print(f"📦 {len(train_images)} training / {len(holdout_images)} calibration images")
+
+    train_tokens, train_logits = extract_features(model, train_images, exit_layers, args.batch_size)
+    heads = {}
+    for layer in exit_layers:
+        heads[layer] = distil_head(train_tokens[layer], train_logits, args.epochs, args.lr, args.temperature)
+        print(f"✅ Distilled exit head after layer {layer}")
+
+    holdout_tokens, holdout_logits = extract_features(model, holdout_images, exit_layers, args.batch_size)
+    full_pred = holdout_logits.argmax(dim=1)
+    with torch.no_grad():
+        head_probs = [F.softmax(heads[layer](holdout_tokens[layer]), dim=1) for layer in exit_layers]
+
+    sweep = [simulate(head_probs, full_pred, exit_layers, t / 100, depth) for t in range(50, 100)]
+    eligible = [row for row in sweep if row["agreement"] >= args.target_agreement]
+    if eligible:
+        chosen = eligible[0]
+    else:
+        chosen = sweep[-1]
+        print(f"⚠️ No threshold reaches {args.target_agreement:.1%} agreement; using {chosen['threshold']}")
+
+    # Measured on the real cascade, not the simulation
+    cascade = EarlyExitViT(model, heads, chosen["threshold"])
+    holdout_inputs = inference_service.preprocessor(holdout_images).clone()
+    with torch.no_grad():
+        log_probs, exit_at = cascade.cascade(holdout_inputs)
+    agreement = float((log_probs.argmax(dim=1) == full_pred).float().mean())
+    full_ms = measure_latency(model, holdout_inputs, args.batch_size, args.repeats)
+    cascade_ms = measure_latency(cascade, holdout_inputs, args.batch_size, args.repeats)
+
+    report = {
+        "checkpoint": None if args.random_init else args.checkpoint,
+        "exit_layers": exit_layers,
+        "target_agreement": args.target_agreement,
+        "threshold": chosen["threshold"],
+        "calibration_images": len(holdout_images),
+        "exit_rate": {
+            name: round(float((exit_at == i).float().mean()), 4) for i, name in enumerate(cascade.exit_names)
+        },
+        "agreement": round(agreement, 4),
+        "avg_ms_per_image": {"full": round(full_ms, 2), "early_exit": round(cascade_ms, 2)},
+        "speedup": round(full_ms / cascade_ms, 2),
+        "sweep": sweep
+    }
+
+    out = args.out or exit_heads_path(args.checkpoint)
+    torch.save({
+        "exit_layers": exit_layers,
+        "num_classes": holdout_logits.shape[1],
+        "threshold": chosen["threshold"],
+        "heads": {str(layer): head.state_dict() for layer, head in heads.items()},
+        "calibration": {k: v for k, v in report.items() if k != "sweep"}
+    }, out)
+
+    print(json.dumps(report, indent=2))
+    print(f"🚀 Wrote {out}: threshold {chosen['threshold']}, agreement {agreement:.2%}, "
+          f"{full_ms:.1f} -> {cascade_ms:.1f} ms/image")
+
+if __name__ == "__main__":
+    main()
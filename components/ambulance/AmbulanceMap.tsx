@@ -1,6 +1,6 @@
 
 import React, { useEffect, useState } from 'react';
-import { MapContainer, TileLayer, Marker, Popup, Polyline, useMap } from 'react-leaflet';
+import { MapContainer, TileLayer, Marker, Popup, Polyline, useMap, useMapEvents } from 'react-leaflet';
 import { Icon, DivIcon } from 'leaflet';
 import 'leaflet/dist/leaflet.css';
 import { motion, AnimatePresence } from 'framer-motion';
@@ -32,6 +32,7 @@ interface AmbulanceMapProps {
     ambulances: Ambulance[];
     userLocation: GeoLocation | null;
     routes?: GeoLocation[][];
+    onViewportChange?: (bbox: [number, number, number, number]) => void; // [south, west, north, east]
 }
 
 const ZoomHandler: React.FC<{ center: [number, number] }> = ({ center }) => {
@@ -45,7 +46,18 @@ const ZoomHandler: React.FC<{ center: [number, number] }> = ({ center }) => {
 };
 
 
-const AmbulanceMap: React.FC<AmbulanceMapProps> = ({ ambulances, userLocation, routes }) => {
+// Reports the visible area (padded by half a screen) whenever the map stops moving
+const ViewportReporter: React.FC<{ onChange: (bbox: [number, number, number, number]) => void }> = ({ onChange }) => {
+    const map = useMapEvents({
+        moveend: () => {
+            const bounds = map.getBounds().pad(0.5);
+            onChange([bounds.getSouth(), bounds.getWest(), bounds.getNorth(), bounds.getEast()]);
+        }
+    });
+    return null;
+};
+
+const AmbulanceMap: React.FC<AmbulanceMapProps> = ({ ambulances, userLocation, routes, onViewportChange }) => {
     const [center, setCenter] = useState<[number, number]>([19.0760, 72.8777]); // Mumbai
 
     useEffect(() => {
@@ -69,6 +81,7 @@ const AmbulanceMap: React.FC<AmbulanceMapProps> = ({ ambulances, userLocation, r
                 />
 
                 <ZoomHandler center={center} />
+                {onViewportChange && <ViewportReporter onChange={onViewportChange} />}
 
                 {/* User Location */}
                 {userLocation && (
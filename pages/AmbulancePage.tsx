@@ -1,5 +1,5 @@
 
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef, useCallback } from 'react';
 import GlassPanel from '../components/ui/GlassPanel';
 import { Layers, Activity, Wind, Waves } from 'lucide-react';
 import AmbulanceMap from '../components/ambulance/AmbulanceMap';
@@ -15,17 +15,50 @@ const AmbulancePage: React.FC = () => {
     const [ambulances, setAmbulances] = useState<Ambulance[]>([]);
     const [userLocation] = useState<GeoLocation>({ lat: 19.0720, lng: 72.8800 });
     const [isConnected, setIsConnected] = useState(false);
+    const wsRef = useRef<WebSocket | null>(null);
+    const viewportRef = useRef<[number, number, number, number] | null>(null);
+
+    // Only receive the units around what the map shows
+    const subscribe = useCallback((bbox: [number, number, number, number]) => {
+        viewportRef.current = bbox;
+        if (wsRef.current?.readyState === WebSocket.OPEN) {
+            wsRef.current.send(JSON.stringify({ type: 'SUBSCRIBE', bbox }));
+        }
+    }, []);
 
     useEffect(() => {
         // Connect to Real-Time Dispatch Engine (still useful for fleet viz)
-        const ws = new WebSocket('ws://localhost:8000/ws/dispatch');
+        // Delta updates: a keyframe on connect and every few seconds, otherwise only changed fields.
+        // Once subscribed to the map's viewport, every update is a keyframe of just that area.
+        const ws = new WebSocket('ws://localhost:8000/ws/dispatch?encoding=delta');
+        const fleet = new Map<string, Ambulance>();
+        let lastSeq: number | null = null;
 
-        ws.onopen = () => setIsConnected(true);
+        wsRef.current = ws;
+
+        ws.onopen = () => {
+            setIsConnected(true);
+            if (viewportRef.current) ws.send(JSON.stringify({ type: 'SUBSCRIBE', bbox: viewportRef.current }));
+        };
         ws.onmessage = (event) => {
             const message = JSON.parse(event.data);
-            if (message.type === 'INIT_FLEET' || message.type === 'FLEET_UPDATE') {
-                setAmbulances(message.data);
+            if (message.type !== 'INIT_FLEET' && message.type !== 'FLEET_UPDATE') return;
+            if (message.keyframe) {
+                fleet.clear();
+                message.data.forEach((a: Ambulance) => fleet.set(a.id, a));
+            } else {
+                if (lastSeq === null || message.seq !== lastSeq + 1) {
+                    // Missed a frame; deltas no longer apply until the server sends a keyframe
+                    if (lastSeq !== null) ws.send(JSON.stringify({ type: 'RESYNC' }));
+                    lastSeq = null;
+                    return;
+                }
+                message.changes.forEach((change: Partial<Ambulance> & { id: string }) => {
+                    fleet.set(change.id, { ...fleet.get(change.id), ...change } as Ambulance);
+                });
             }
+            lastSeq = message.seq ?? null;
+            setAmbulances(Array.from(fleet.values()));
         };
         ws.onclose = () => setIsConnected(false);
 
@@ -95,6 +128,7 @@ const AmbulancePage: React.FC = () => {
                         ambulances={ambulances}
                         userLocation={userLocation}
                         routes={[]}
+                        onViewportChange={subscribe}
                     />
 
                     {/* Field Overlay */}